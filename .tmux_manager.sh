@@ -3,7 +3,8 @@
 SESSION_NAME=$1
 WORK_DIR=$2
 ACTION=$3  # start or stop
-CMD="source .env.export && .venv/bin/python -m streamlit run --server.port 4229 app.py"
+PORT=4229
+CMD="source .env.export && .venv/bin/python -m streamlit run --server.port $PORT app.py"
 
 cd "$WORK_DIR" || exit 1
 
@@ -21,6 +22,9 @@ elif [ "$ACTION" == "start" ]; then
     else
         echo "Starting new tmux session: $SESSION_NAME"
         tmux new -d -s "$SESSION_NAME" "$CMD"
+        # Run the app once so the catalog and background services are built before the first visitor.
+        # In the background: a slow cold start must not hold up (or time out) the service start.
+        (.venv/bin/python prewarm.py --port "$PORT" || echo "Prewarm failed; the first visitor will warm the app instead") &
     fi
     exit 0
 else
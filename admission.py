@@ -0,0 +1,123 @@
+"""Which queued requests are handed to deluge next.
+
+Adding every request straight away splits the bandwidth between all of them,
+so nothing finishes for a long time, and can fill the download disk. The
+``AdmissionPolicy`` keeps at most ``MAX_ACTIVE_DOWNLOADS`` torrents
+downloading and only admits a request when its estimated size fits in the
+free disk space left after the active downloads finish.
+
+Each user's requests are admitted in the order they were made. Between
+users, the request with the highest priority goes first; a request's
+priority grows the longer it waits, so a busy admin cannot starve everyone
+else, and ties go to the user with the fewest active downloads.
+
+Free space is read from ``DOWNLOAD_DISK_PATH``, which defaults to deluge's
+download folder. When the app does not run where that path exists (deluge
+in a container, say), set it in ``.env.export`` to where the same disk is
+mounted on this host; otherwise the disk check is skipped, with a warning.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import os
+import shutil
+
+from loguru import logger
+
+from deluge_rpc import DOWNLOAD_PATH
+from sizes import DEFAULT_SIZE, GB
+
+
+MAX_ACTIVE_DOWNLOADS = int(os.getenv("MAX_ACTIVE_DOWNLOADS", "3"))
+DISK_PATH = Path(os.getenv("DOWNLOAD_DISK_PATH", DOWNLOAD_PATH))
+# Space always left free on the download disk.
+DISK_HEADROOM = int(float(os.getenv("DISK_HEADROOM_GB", "20")) * GB)
+# A waiting request gains one priority level per this much time.
+AGING = timedelta(minutes=float(os.getenv("ADMISSION_AGING_MINUTES", "30")))
+
+NORMAL = 0
+HIGH = 1
+
+# Download paths found missing, so each is only warned about once.
+_missing_paths = set()
+
+
+def free_space(path: Path = DISK_PATH) -> Optional[int]:
+	"""Free bytes on the download disk, or None when it is not visible from here."""
+	try:
+		return shutil.disk_usage(path).free
+	except OSError as exc:
+		if path not in _missing_paths:
+			_missing_paths.add(path)
+			logger.warning("Cannot read free space of {} ({}); downloads are admitted without a disk space check. Set DOWNLOAD_DISK_PATH to the download disk as mounted here.", path, exc)
+		return None
+
+
+class Download(NamedTuple):
+	"""A torrent that is being added or is still downloading."""
+
+	username: Optional[str]
+	remaining: int
+	# Stalled downloads still need their disk space but no longer hold a slot.
+	stalled: bool = False
+
+
+class Admission(NamedTuple):
+	admitted: list
+	# Requests larger than the free disk space, even with nothing else downloading.
+	too_large: list
+	# Why the remaining requests wait: 'slot', 'disk' or None when none wait.
+	waiting_for: Optional[str]
+
+
+class AdmissionPolicy:
+	def __init__(self, max_active: int = MAX_ACTIVE_DOWNLOADS, headroom: int = DISK_HEADROOM, aging: timedelta = AGING) -> None:
+		self.max_active = max_active
+		self.headroom = headroom
+		self.aging = aging
+
+	def urgency(self, job, now: datetime) -> int:
+		"""The job's priority, raised one level for every ``aging`` it has waited."""
+		return job.priority + int((now - job.created_at) / self.aging)
+
+	def select(self, queued: Sequence, active: Sequence[Download], free_bytes: Optional[int], now: Optional[datetime] = None) -> Admission:
+		"""Pick the queued jobs to start now.
+
+		``queued`` holds jobs with ``username``, ``priority``, ``size_bytes`` and
+		``created_at``, oldest first. ``free_bytes`` of None skips the disk check.
+		"""
+		now = now or datetime.now()
+		queues: Dict[Optional[str], List] = {}
+		for job in queued:
+			queues.setdefault(job.username, []).append(job)
+		active_per_user = Counter(download.username for download in active if not download.stalled)
+		slots = self.max_active - sum(active_per_user.values())
+		budget = None if free_bytes is None else free_bytes - self.headroom - sum(download.remaining for download in active)
+
+		admitted, too_large = [], []
+		while queues:
+			if slots <= 0:
+				return Admission(admitted, too_large, 'slot')
+			user = min(queues, key=lambda name: (-self.urgency(queues[name][0], now), active_per_user[name], queues[name][0].created_at))
+			job = queues[user][0]
+			size = job.size_bytes or DEFAULT_SIZE
+			if budget is not None and size > budget:
+				if size > free_bytes - self.headroom:
+					too_large.append(job)
+				else:
+					# Smaller requests do not jump ahead of it, or it could wait forever.
+					return Admission(admitted, too_large, 'disk')
+			else:
+				admitted.append(job)
+				slots -= 1
+				active_per_user[user] += 1
+				if budget is not None:
+					budget -= size
+			queues[user].pop(0)
+			if not queues[user]:
+				del queues[user]
+		return Admission(admitted, too_large, None)
@@ -1,20 +1,19 @@
-import streamlit as st
-import json
-from pathlib import Path
-import subprocess
 import os
-import csv
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
+import streamlit as st
 import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
-try:
-    import jellyfin
-    from jellyfin.generated.api_10_10.models.media_type import MediaType
-    JELLYFIN_AVAILABLE = True
-except ImportError:
-    JELLYFIN_AVAILABLE = False
+import numpy as np
+from catalog import CatalogReloader, download_size, select_best_magnet
+from library import LOOKUP_TIMEOUT, LibrarySync
+from torrent_store import TorrentStore, infohash_from_magnet
+from deluge_rpc import DelugePool
+from torrent_poller import POLL_INTERVAL, TorrentPoller
+from request_queue import ADDING, FAILED, QUEUED, RequestQueue
+from admission import HIGH, NORMAL
+from posters import THUMBNAIL_URL, PosterCache
+import profiling
 
 # Page configuration
 st.set_page_config(
@@ -23,9 +22,103 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load authentication config
-with open('config.yaml') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+# Time every phase of this run; admins can switch on showing and logging it
+profile = profiling.start("page")
+
+# Load the catalog once per process; every session shares the same read-only snapshot
+@st.cache_resource
+def get_catalog_reloader():
+    """Return the catalog loader, which swaps in a new out.json in the background."""
+    return CatalogReloader.shared()
+
+@st.cache_resource
+def get_deluge_pool():
+    """Return the shared deluge RPC connection pool, or None when not configured."""
+    return DelugePool.from_env()
+
+def requester():
+    """``(username, priority)`` for requests from this session; admins' requests go first."""
+    priority = HIGH if profiling.is_admin(st.session_state.get('roles')) else NORMAL
+    return st.session_state.get('username'), priority
+
+def request_movie(movie, magnet):
+    """Queue a torrent request; a background worker adds it to deluge once it is admitted."""
+    username, priority = requester()
+    job = get_request_queue().submit(magnet.url, movie.title, movie.year, download_size(movie, magnet), username, priority)
+    if job is None:
+        st.error("❌ Could not find the torrent hash in the magnet link")
+        return
+    # A full rerun redraws the card as a live fragment that follows the job
+    st.rerun()
+
+@st.cache_resource
+def get_library_sync():
+    """Return the background Jellyfin library sync (one per process)."""
+    return LibrarySync.shared()
+
+def check_movie_in_jellyfin(title, year, imdb_link=None):
+    """Check if a movie exists in Jellyfin library using the locally mirrored index."""
+    try:
+        with profiling.timed("library lookups"):
+            return get_library_sync().index.contains(title, year, imdb_link)
+    except Exception:
+        return False
+
+@st.cache_resource
+def get_poster_cache():
+    """Return the poster thumbnail cache (one per process)."""
+    return PosterCache.shared()
+
+@st.cache_resource
+def get_torrent_store():
+    """Return the torrent status store (one per process)."""
+    return TorrentStore.shared()
+
+@st.cache_resource
+def get_torrent_poller():
+    """Return the background torrent status poller (one per process)."""
+    poller = TorrentPoller.shared(get_torrent_store(), get_deluge_pool())
+    # Finished downloads are looked up in Jellyfin right away, not at the next library sync
+    poller.on_complete(get_library_sync().movies_completed)
+    return poller
+
+@st.cache_resource
+def get_request_queue():
+    """Return the request job queue and its worker threads (one per process)."""
+    return RequestQueue.shared(get_torrent_store(), get_deluge_pool(), get_torrent_poller())
+
+@st.cache_resource
+def get_query_api():
+    """Start the JSON query API next to the page when QUERY_API_PORT is set."""
+    if not os.getenv('QUERY_API_PORT'):
+        return None
+    import query_api
+    service = query_api.QueryService(get_catalog_reloader(), get_library_sync(), get_torrent_poller())
+    return query_api.from_env(service)
+
+# Start the process-wide services before the login gate, so the first visit,
+# or prewarm.py right after a restart, builds them before anyone signs in
+_ = get_catalog_reloader()
+
+# Start the Jellyfin library sync; lookups use the on-disk mirror until it completes
+_ = get_library_sync()
+
+# Start polling deluge for torrent progress and processing queued requests in the background
+_ = get_torrent_poller()
+_ = get_request_queue()
+
+# Serve the JSON query API from the same indexes, when enabled
+_ = get_query_api()
+profile.lap("services")
+
+# Load authentication config; parsed again only when the file changes
+@st.cache_data(show_spinner=False)
+def load_config(mtime):
+    """Parse config.yaml; ``mtime`` is part of the cache key, so an edited file is re-read."""
+    with open('config.yaml') as file:
+        return yaml.load(file, Loader=SafeLoader)
+
+config = load_config(os.stat('config.yaml').st_mtime_ns)
 
 # Create authenticator object
 authenticator = stauth.Authenticate(
@@ -50,7 +143,11 @@ if st.session_state.get('authentication_status'):
     if st.sidebar.button("♻️ Clear cache & reload"):
         st.cache_data.clear()
         st.cache_resource.clear()
+        LibrarySync.shared().refresh_now()
+        CatalogReloader.shared().refresh_now()
         st.rerun()
+    if profiling.is_admin(st.session_state.get('roles')):
+        st.sidebar.toggle("⏱️ Profile reruns", key="profile_reruns", help="Time each phase of every rerun and log it to profile_log.jsonl")
     
 elif st.session_state.get('authentication_status') is False:
     # Login failed
@@ -92,6 +189,8 @@ elif st.session_state.get('authentication_status') is None:
     
     st.stop()
 
+profile.lap("auth")
+
 # Custom CSS for card styling
 st.markdown("""
     <style>
@@ -143,424 +242,179 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# Load JSON data
-@st.cache_data
-def load_data():
-    with open('./out.json', 'r') as f:
-        return json.load(f)
-
-def select_best_magnet(magnet_links):
-    """Select the best magnet link based on quality and type preferences."""
-    if not magnet_links:
-        return None
-    
-    # Quality preference order
-    quality_order = ['1080p', '2160p', '720p', '480p', '3D']
-    
-    # Type preference patterns (in order)
-    type_patterns = [
-        lambda t: t.startswith('WEB'),  # WEB*
-        lambda t: t == 'BluRay',        # BluRay
-        lambda t: t.startswith('DVD'),  # DVD*
-        lambda t: t.startswith('HD')    # HD*
-    ]
-    
-    # Score each magnet link
-    def score_link(link):
-        quality = link.get('quality', '')
-        link_type = link.get('type', '')
-        
-        # Quality score (lower is better)
-        try:
-            quality_score = quality_order.index(quality)
-        except ValueError:
-            quality_score = len(quality_order)  # Unknown quality gets lowest priority
-        
-        # Type score (lower is better)
-        type_score = len(type_patterns)  # Default to lowest priority
-        for idx, pattern in enumerate(type_patterns):
-            if pattern(link_type):
-                type_score = idx
-                break
-        
-        # Return tuple for sorting (quality first, then type)
-        return (quality_score, type_score)
-    
-    # Sort and return the best link
-    best_link = min(magnet_links, key=score_link)
-    return best_link
-
-def request_movie(magnet_url, movie_title, movie_year):
-    """Run docker compose command to add torrent to deluge and track its status."""
-    try:
-        deluge_user = os.getenv("DELUGE_USERNAME")
-        deluge_pass = os.getenv("DELUGE_PASSWORD")
-        deluge_working_dir = os.getenv("DELUGE_WORKING_DIRECTORY")
-        
-        if not deluge_user or not deluge_pass:
-            st.error("❌ Deluge credentials not configured")
-            return
-        
-        if not deluge_working_dir:
-            st.error("❌ Deluge working directory not configured")
-            return
-        
-        # Step 1: Add torrent to deluge
-        add_cmd = [
-            "docker", "compose", "exec", "deluge", "deluge-console",
-            "-U", deluge_user,
-            "-P", deluge_pass,
-            "add",
-            magnet_url,
-            "--path", "/8tb_hdd",
-            "-m", "/8tb_hdd/Movies"
-        ]
-        
-        add_result = subprocess.run(
-            add_cmd,
-            capture_output=True,
-            text=True,
-            timeout=60,
-            cwd=deluge_working_dir
-        )
-        
-        if "Torrent added!" not in add_result.stderr and "Torrent added!" not in add_result.stdout:
-            st.error(f"❌ Failed to add torrent: {add_result.stderr}")
-            return
-        
-        # Step 2: Get torrent status
-        import re
-        import time
-        time.sleep(3)  # Give deluge a moment to register the torrent
-        
-        info_cmd = [
-            "docker", "compose", "exec", "deluge", "deluge-console",
-            "-U", deluge_user,
-            "-P", deluge_pass,
-            "info"
-        ]
-        
-        # Parse the output to find the torrent with matching year and title
-        torrent_info = None
-        max_attempts = 2
-        for attempt in range(max_attempts):
-            if attempt > 0:
-                # Retry once after a short delay in case deluge hasn't indexed it yet
-                time.sleep(5)
-
-            info_result = subprocess.run(
-                info_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120,
-                cwd=deluge_working_dir
-            )
-
-            output = info_result.stdout + info_result.stderr
-            for line in output.split('\n'):
-                if str(movie_year) in line and movie_title.lower() in line.lower():
-                    torrent_info = line.strip()
-                    break
-
-            if torrent_info:
-                break
-
-        if not torrent_info:
-            st.warning(f"⚠️ Torrent added but status not found yet. It may take a moment to appear.")
-            # st.code(output, language=None)
-            return
-        
-        # Extract completion percentage and torrent ID from line like:
-        # [D]  7.22% Back to the Future (1985) [1080p] fb94d1f636cf921a7cd37ba2ffbb3c7ffd680113
-        match = re.search(r'\[\S+\]\s+([\d.]+)%\s+.*?([a-f0-9]{40})$', torrent_info)
-        
-        if match:
-            completion = match.group(1)
-            torrent_id = match.group(2)
+def toggle_cart(slug, title, year):
+    """Add a movie to the request cart or remove it, following its checkbox."""
+    if st.session_state.get(f"cart_{slug}"):
+        st.session_state.cart[slug] = f"{title} ({year})"
+    else:
+        st.session_state.cart.pop(slug, None)
+
+def clear_cart():
+    for slug in st.session_state.cart:
+        st.session_state.pop(f"cart_{slug}", None)
+    st.session_state.cart = {}
+
+def request_cart():
+    """Queue every movie in the cart as one batch, skipping those already available or requested."""
+    movies = [movie for movie in map(catalog.movie, st.session_state.cart) if movie]
+    magnets = {movie.slug: select_best_magnet(movie.magnet_links) for movie in movies}
+    infohashes = {slug: infohash_from_magnet(magnet.url) for slug, magnet in magnets.items() if magnet}
+    statuses = get_torrent_poller().get(infohashes.values())
+    jobs = get_request_queue().jobs(infohashes.values())
+    
+    requests, in_library, already_requested = [], [], []
+    for movie in movies:
+        infohash = infohashes.get(movie.slug)
+        if not infohash:
+            continue
+        if check_movie_in_jellyfin(movie.title, movie.year, movie.imdb_link):
+            in_library.append(movie.title)
+        elif infohash in statuses or (infohash in jobs and jobs[infohash].state != FAILED):
+            already_requested.append(movie.title)
         else:
-            completion = "0"
-            torrent_id = "unknown"
-        
-        # Step 3: Save to CSV
-        csv_file = "torrent_tracking.csv"
-        file_exists = Path(csv_file).exists()
-        
-        with open(csv_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['timestamp', 'movie_title', 'year', 'torrent_id', 'completion_percent', 'status'])
-            
-            writer.writerow([
-                datetime.now().isoformat(),
-                movie_title,
-                movie_year,
-                torrent_id,
-                completion,
-                'added'
-            ])
-        
-        st.success(f"✅ Torrent added for: {movie_title} ({movie_year})")
-        st.info(f"📊 Completion: {completion}% | ID: {torrent_id[:16]}...")
-        
-    except subprocess.TimeoutExpired:
-        st.error("⏱️ Request timed out")
-    except Exception as e:
-        st.error(f"❌ Error: {str(e)}")
-
-@st.cache_resource
-def get_jellyfin_api():
-    """Initialize and return Jellyfin API connection."""
-    if not JELLYFIN_AVAILABLE:
-        return None
-    try:
-        api = jellyfin.api(
-            os.getenv("JELLYFIN_URL"),
-            os.getenv("JELLYFIN_API_KEY")
-        )
-        return api
-    except Exception:
-        return None
-
-@st.cache_data(ttl=3600)
-def get_jellyfin_items():
-    """Fetch and cache all movie items from Jellyfin library as dictionaries."""
-    if not JELLYFIN_AVAILABLE:
-        return []
-    
-    api = get_jellyfin_api()
-    if not api:
-        return []
+            requests.append((magnets[movie.slug].url, movie.title, movie.year, download_size(movie, magnets[movie.slug])))
     
-    try:
-        cached_items = []
-        for item in api.items.search.recursive().all:
-            if item.media_type == MediaType.VIDEO and item.type.value == 'Movie':
-                # Extract only the necessary data to avoid pickling issues with Jellyfin objects
-                cached_items.append({
-                    'name': item.name,
-                    'year': item.production_year
-                })
-        # st.write(f"Fetched {len(cached_items)} movies from Jellyfin")
-        return cached_items
-    except Exception:
-        return []
-
-def check_movie_in_jellyfin(title, year):
-    """Check if a movie exists in Jellyfin library using cached items."""
-    if not JELLYFIN_AVAILABLE:
-        return False
-    
-    items = get_jellyfin_items()
-    if not items:
-        return False
-    
-    try:
-        for item in items:
-            if title.lower() in item['name'].lower() and item['year'] == year:
-                return True
-    except Exception:
-        pass
-    
-    return False
+    queued = get_request_queue().submit_many(requests, *requester())
+    clear_cart()
+    return len(queued), in_library, already_requested
 
 def get_latest_torrent_status(torrent_id):
-    """Get the latest status for a torrent from the CSV file."""
-    csv_file = "torrent_tracking.csv"
-    if not Path(csv_file).exists():
-        return None
-    
-    latest_status = None
-    try:
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('torrent_id') == torrent_id:
-                    latest_status = row
-    except Exception:
-        pass
-    
-    return latest_status
+    """Get the latest status for a torrent from the poller's shared state."""
+    return next(iter(get_torrent_poller().get([torrent_id]).values()), None)
 
-def update_torrent_statuses_from_deluge():
-    """Update statuses for all torrents in the CSV by querying deluge."""
-    csv_file = "torrent_tracking.csv"
-    if not Path(csv_file).exists():
-        return
-    
-    deluge_user = os.getenv("DELUGE_USERNAME")
-    deluge_pass = os.getenv("DELUGE_PASSWORD")
-    deluge_working_dir = os.getenv("DELUGE_WORKING_DIRECTORY")
-    
-    if not deluge_user or not deluge_pass or not deluge_working_dir:
-        return
-    
-    # Read existing torrents from CSV
-    torrents_to_check = {}
-    try:
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                torrent_id = row.get('torrent_id')
-                if torrent_id and torrent_id != 'unknown':
-                    torrents_to_check[torrent_id] = {
-                        'title': row.get('movie_title'),
-                        'year': row.get('year')
-                    }
-    except Exception:
-        return
-    
-    if not torrents_to_check:
-        return
-    
-    # Query deluge for current info
-    try:
-        info_cmd = [
-            "docker", "compose", "exec", "deluge", "deluge-console",
-            "-U", deluge_user,
-            "-P", deluge_pass,
-            "info"
-        ]
-        
-        info_result = subprocess.run(
-            info_cmd,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=deluge_working_dir
-        )
-        
-        output = info_result.stdout + info_result.stderr
-        
-        # Parse output and update CSV
-        with open(csv_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            
-            for torrent_id, torrent_info in torrents_to_check.items():
-                title = torrent_info['title']
-                year = torrent_info['year']
-                
-                # Find the matching line in deluge output
-                found = False
-                for line in output.split('\n'):
-                    if torrent_id in line:
-                        found = True
-                        # Extract completion percentage
-                        match = re.search(r'\[\S+\]\s+([\d.]+)%', line)
-                        completion = match.group(1) if match else "0"
-                        
-                        # Write update to CSV
-                        writer.writerow([
-                            datetime.now().isoformat(),
-                            title,
-                            year,
-                            torrent_id,
-                            completion,
-                            'downloading'
-                        ])
-                        break
-                
-                if not found:
-                    # Torrent may have completed or been removed
-                    writer.writerow([
-                        datetime.now().isoformat(),
-                        title,
-                        year,
-                        torrent_id,
-                        "100",
-                        'completed'
-                    ])
-    except Exception:
-        pass
-
-@st.cache_resource
-def update_torrent_cache_on_load():
-    """Cache the initial torrent status update to run only once per session."""
-    update_torrent_statuses_from_deluge()
-    return True
-
-data = load_data()
-
-# Pre-load Jellyfin cache on initial page load
-_ = get_jellyfin_items()
-
-# Update torrent statuses from deluge once on initial page load (cached)
-_ = update_torrent_cache_on_load()
+# Read the snapshot once so the whole rerun uses the same catalog version
+snapshot = get_catalog_reloader().current
+catalog, filter_index = snapshot.catalog, snapshot.filters
 
 # Header
 st.title("🎬 Riju's Movie Request Platform")
-st.markdown(f"**Total Movies:** {len(data['media'])}")
+st.markdown(f"**Total Movies:** {len(catalog)}")
+
+# Filter state. The counts shown next to each filter option depend on all the
+# other filters, so the state is read from the session before drawing the widgets.
+search_query = st.session_state.get('search_title', "")
+search_cast = st.session_state.get('search_cast', "")
+search_director = st.session_state.get('search_director', "")
+selected_years = st.session_state.get('filter_years', [])
+selected_genres = st.session_state.get('filter_genres', [])
+selected_qualities = st.session_state.get('filter_qualities', [])
+min_rating = st.session_state.get('min_rating', 0.0)
+sort_option = st.session_state.get('sort_option', "Relevance")
+
+# Filter and order the catalog. The result is kept per session, so changing
+# page only slices it instead of filtering and ordering again.
+query_key = (
+    search_query, search_cast, search_director,
+    tuple(selected_years), tuple(selected_genres), tuple(selected_qualities),
+    min_rating, sort_option,
+)
+cached_query = st.session_state.get('ordered_rows')
+query_cached = bool(cached_query and cached_query[0] == query_key and cached_query[1] is catalog)
+profile.cache("ordered rows", query_cached)
+if query_cached:
+    filtered_rows, facet_counts = cached_query[2], cached_query[3]
+else:
+    filtered_rows, facet_counts = snapshot.query_with_counts(
+        title=search_query,
+        cast=search_cast,
+        director=search_director,
+        years=selected_years,
+        genres=selected_genres,
+        qualities=selected_qualities,
+        min_rating=min_rating,
+        sort=sort_option,
+    )
+    st.session_state['ordered_rows'] = (query_key, catalog, filtered_rows, facet_counts)
+profile.lap("query")
 
 # Sidebar filters
 st.sidebar.header("Filters")
 
 # Search
-search_query = st.sidebar.text_input("🔍 Search by title", "")
-search_cast = st.sidebar.text_input("🎭 Search by cast", "")
-search_director = st.sidebar.text_input("🎬 Search by director", "")
+st.sidebar.text_input("🔍 Search by title", "", key="search_title")
+st.sidebar.text_input("🎭 Search by cast", "", key="search_cast")
+st.sidebar.text_input("🎬 Search by director", "", key="search_director")
+
+def facet_option(counts):
+    """Label a filter option with the number of results it has under the other filters."""
+    return lambda value: f"{value} ({counts.get(value, 0):,})"
+
+# Option labels change with the counts and the browser remembers selections by
+# label; setting each selection again sends it the new labels.
+for facet_key in ('filter_years', 'filter_genres', 'filter_qualities'):
+    if facet_key in st.session_state:
+        st.session_state[facet_key] = list(st.session_state[facet_key])
 
 # Year filter
-years = sorted(set(movie['year'] for movie in data['media']), reverse=True)
-selected_years = st.sidebar.multiselect("Year", years)
+st.sidebar.multiselect("Year", filter_index.years, key="filter_years", format_func=facet_option(facet_counts['year']))
 
 # Genre filter
-all_genres = sorted(set(genre for movie in data['media'] for genre in movie.get('genres', [])))
-selected_genres = st.sidebar.multiselect("Genre", all_genres)
+st.sidebar.multiselect("Genre", filter_index.genres, key="filter_genres", format_func=facet_option(facet_counts['genre']))
 
 # Quality filter
-selected_qualities = st.sidebar.multiselect("Quality", data['supported_qualities'])
+st.sidebar.multiselect("Quality", catalog.supported_qualities, key="filter_qualities", format_func=facet_option(facet_counts['quality']))
 
 # Rating filter
-min_rating = st.sidebar.slider("Minimum IMDB Rating", 0.0, 10.0, 0.0, 0.1)
+st.sidebar.slider("Minimum IMDB Rating", 0.0, 10.0, 0.0, 0.1, key="min_rating")
 
 # Sort options
-sort_option = st.sidebar.selectbox("Sort by", ["Year (Newest)", "Year (Oldest)", "Title", "Rating (Highest)", "Rating (Lowest)"])
+st.sidebar.selectbox(
+    "Sort by",
+    ["Relevance", "Year (Newest)", "Year (Oldest)", "Title", "Rating (Highest)", "Rating (Lowest)"],
+    key="sort_option",
+    help="Relevance ranks search matches best first, and falls back to newest first when not searching."
+)
 
 # Pagination settings
 st.sidebar.divider()
 st.sidebar.header("Pagination")
 items_per_page = st.sidebar.selectbox("Items per page", [6, 9, 12, 18, 24, 30], index=1)
 
-# Filter movies
-filtered_movies = data['media']
-
-if search_query:
-    filtered_movies = [m for m in filtered_movies if search_query.lower() in m['title'].lower()]
-
-if search_cast:
-    filtered_movies = [m for m in filtered_movies if any(
-        search_cast.lower() in cast_member.lower() for cast_member in m.get('cast', [])
-    )]
-
-if search_director:
-    filtered_movies = [m for m in filtered_movies if search_director.lower() in m.get('director', '').lower()]
-
-if selected_years:
-    filtered_movies = [m for m in filtered_movies if m['year'] in selected_years]
-
-if selected_genres:
-    filtered_movies = [m for m in filtered_movies if any(g in m.get('genres', []) for g in selected_genres)]
-
-if selected_qualities:
-    filtered_movies = [m for m in filtered_movies if any(
-        link['quality'] in selected_qualities for link in m.get('magnet_links', [])
-    )]
-
-filtered_movies = [m for m in filtered_movies if m.get('imdb_rating', 0) >= min_rating]
+# Request cart, kept across pages
+if 'cart' not in st.session_state:
+    st.session_state.cart = {}
+st.sidebar.divider()
+st.sidebar.header("Request cart")
+selection_mode = st.sidebar.toggle("🛒 Select multiple movies", key="selection_mode")
+if st.session_state.cart:
+    with st.sidebar.expander(f"🛒 {len(st.session_state.cart)} selected", expanded=True):
+        st.markdown("\n".join(f"- {label}" for label in st.session_state.cart.values()))
+    cart_col1, cart_col2 = st.sidebar.columns(2)
+    with cart_col1:
+        request_all = st.button("📥 Request all", width='stretch', key="request_cart")
+    with cart_col2:
+        st.button("🗑️ Clear", width='stretch', key="clear_cart", on_click=clear_cart)
+    if request_all:
+        queued_count, in_library, already_requested = request_cart()
+        st.sidebar.success(f"✅ Queued {queued_count} movie(s)")
+        if in_library:
+            st.sidebar.info(f"Skipped (in library): {', '.join(in_library)}")
+        if already_requested:
+            st.sidebar.info(f"Skipped (already requested): {', '.join(already_requested)}")
+elif selection_mode:
+    st.sidebar.caption("Tick movies on any page to add them to the cart.")
+
+profile.lap("sidebar")
+
+def clear_similar():
+    st.session_state.pop('similar_to', None)
+    st.session_state.page_number = 1
 
-# Sort movies
-if sort_option == "Title":
-    filtered_movies.sort(key=lambda x: x['title'])
-elif sort_option == "Year (Newest)":
-    filtered_movies.sort(key=lambda x: x['year'], reverse=True)
-elif sort_option == "Year (Oldest)":
-    filtered_movies.sort(key=lambda x: x['year'])
-elif sort_option == "Rating (Highest)":
-    filtered_movies.sort(key=lambda x: x.get('imdb_rating', 0), reverse=True)
-elif sort_option == "Rating (Lowest)":
-    filtered_movies.sort(key=lambda x: x.get('imdb_rating', 0))
+# "More like this" shows a movie followed by its precomputed neighbours instead of the
+# results, until the filters change or the user goes back
+if cached_query and cached_query[0] != query_key:
+    st.session_state.pop('similar_to', None)
+similar_row = catalog.by_slug.get(st.session_state.get('similar_to', ''))
+if similar_row is not None:
+    source = catalog.movies[similar_row]
+    info_col, back_col = st.columns([4, 1])
+    info_col.info(f"🎞️ Movies like **{source.title} ({source.year})**")
+    back_col.button("✖️ Back to results", width='stretch', on_click=clear_similar)
+    filtered_rows = np.concatenate(([similar_row], snapshot.similar.rows(similar_row)))
+profile.lap("similar")
 
 # Pagination logic
-total_movies = len(filtered_movies)
+total_movies = len(filtered_rows)
 total_pages = (total_movies + items_per_page - 1) // items_per_page
 
 # Initialize page number in session state if not exists
@@ -573,176 +427,245 @@ if st.session_state.page_number > total_pages and total_pages > 0:
 elif st.session_state.page_number < 1:
     st.session_state.page_number = 1
 
-if total_pages > 0:
-    current_page = st.session_state.page_number
-    
-    # Top page navigation
+def profiling_enabled():
+    return bool(st.session_state.get('profile_reruns')) and profiling.is_admin(st.session_state.get('roles'))
+
+def show_profile(sample):
+    """Log a profiled run and break it down in the sidebar."""
+    log = profiling.ProfileLog.shared()
+    log.append(sample)
+    with st.sidebar.expander(f"⏱️ Last rerun: {sample['total_ms']:.0f} ms", expanded=True):
+        rows = [{"Phase": name, "ms": ms} for name, ms in sample['phases'].items()]
+        rows += [{"Phase": f"· {name} ({timer['calls']}×)", "ms": timer['ms']} for name, timer in sample['timers'].items()]
+        st.dataframe(rows, hide_index=True, width='stretch')
+        for name, counts in sample['caches'].items():
+            st.caption(f"{name}: {counts['hits']} hit(s), {counts['misses']} miss(es)")
+        for scope in ("page", "grid"):
+            recent = log.percentiles(scope)
+            if recent:
+                st.caption(f"Recent {scope} runs: p50 {recent[0.5]:.0f} ms, p95 {recent[0.95]:.0f} ms")
+
+def go_to_page(page):
+    st.session_state.page_number = page
+
+def page_navigation(current_page, total_pages, key_prefix, prev_label):
+    """First/previous/next/last buttons; they only set the page, the fragment rerun redraws it."""
     col1, col2, col3, col4, col5 = st.columns([1, 1, 2, 1, 1])
     
     with col1:
-        if st.button("⏮️ First", width='stretch', disabled=(current_page == 1), key="top_first_btn"):
-            st.session_state.page_number = 1
-            st.rerun()
+        st.button("⏮️ First", width='stretch', disabled=(current_page == 1), key=f"{key_prefix}first_btn", on_click=go_to_page, args=(1,))
     
     with col2:
-        if st.button("⬅️ Prev", width='stretch', disabled=(current_page == 1), key="top_prev_btn"):
-            st.session_state.page_number = current_page - 1
-            st.rerun()
+        st.button(prev_label, width='stretch', disabled=(current_page == 1), key=f"{key_prefix}prev_btn", on_click=go_to_page, args=(current_page - 1,))
     
     with col3:
         st.markdown(f"<div style='text-align: center; padding-top: 8px;'><strong>Page {current_page} of {total_pages}</strong></div>", unsafe_allow_html=True)
     
     with col4:
-        if st.button("Next ➡️", width='stretch', disabled=(current_page == total_pages), key="top_next_btn"):
-            st.session_state.page_number = current_page + 1
-            st.rerun()
+        st.button("Next ➡️", width='stretch', disabled=(current_page == total_pages), key=f"{key_prefix}next_btn", on_click=go_to_page, args=(current_page + 1,))
     
     with col5:
-        if st.button("Last ⏭️", width='stretch', disabled=(current_page == total_pages), key="top_last_btn"):
-            st.session_state.page_number = total_pages
-            st.rerun()
-    
-    # Calculate start and end indices
-    start_idx = (current_page - 1) * items_per_page
-    end_idx = min(start_idx + items_per_page, total_movies)
+        st.button("Last ⏭️", width='stretch', disabled=(current_page == total_pages), key=f"{key_prefix}last_btn", on_click=go_to_page, args=(total_pages,))
+
+def card_in_flight(in_library, status, job):
+    """Whether a card's request or download can still change, so the card should keep refreshing."""
+    if in_library:
+        return False
+    if job and job.state in (QUEUED, ADDING):
+        return True
+    if not status:
+        return False
+    # A finished download turns into "In Library" once Jellyfin has found it
+    return not status.is_complete or datetime.now() - status.updated_at < timedelta(seconds=LOOKUP_TIMEOUT)
+
+def card_actions(movie, infohash, selection_mode, live=False):
+    """The library/progress/request widget of one card."""
+    # Check if movie exists in Jellyfin
+    exists_in_jellyfin = check_movie_in_jellyfin(movie.title, movie.year, movie.imdb_link)
+    downloading_status = get_torrent_poller().get([infohash]).get(infohash) if infohash else None
+    request_job = get_request_queue().job(infohash) if infohash else None
+    if live and not card_in_flight(exists_in_jellyfin, downloading_status, request_job):
+        # Nothing left to follow: redraw the grid, which shows this card without polling
+        st.rerun()
     
-    # Slice the filtered movies for current page
-    filtered_movies = filtered_movies[start_idx:end_idx]
+    if exists_in_jellyfin:
+        st.markdown("<div style='text-align: center; padding: 8px; background-color: #2d7f2d; border-radius: 5px;'>✅ In Library</div>", unsafe_allow_html=True)
+        return
     
-    st.markdown(f"**Showing {start_idx + 1}-{end_idx} of {total_movies} movies**")
-else:
-    st.markdown("**No movies found**")
-
-# Display movies in grid
-cols_per_row = 3
-for i in range(0, len(filtered_movies), cols_per_row):
-    cols = st.columns(cols_per_row)
-    for idx, col in enumerate(cols):
-        if i + idx < len(filtered_movies):
-            movie = filtered_movies[i + idx]
-            with col:
-                # Movie poster
-                if movie.get('poster') and movie['poster'].get('url'):
-                    st.image(movie['poster']['url'], width='stretch')
-                
-                # Movie title and year
-                st.markdown(f"### {movie['title']} ({movie['year']})")
-                
-                # IMDB Rating
-                if movie.get('imdb_rating'):
-                    st.markdown(f"⭐ **{movie['imdb_rating']}/10** IMDB")
-                
-                # Genres
-                if movie.get('genres'):
-                    genres_html = " ".join([f'<span class="genre-tag">{g}</span>' for g in movie['genres']])
-                    st.markdown(genres_html, unsafe_allow_html=True)
-                
-                # Synopsis
-                if movie.get('synopsis'):
-                    with st.expander("📖 Synopsis"):
-                        st.write(movie['synopsis'])
-                
-                # Director and Cast
-                if movie.get('director'):
-                    st.markdown(f"**Director:** {movie['director']}")
-                
-                if movie.get('cast'):
-                    with st.expander("🎭 Cast"):
-                        st.write(", ".join(movie['cast']))
-                
-                # Available qualities
-                if movie.get('magnet_links'):
-                    qualities = set(f"{link['quality']} {link['type']}" for link in movie['magnet_links'])
-                    quality_badges = " ".join([f'<span class="quality-badge">{q}</span>' for q in sorted(qualities)])
-                    st.markdown("**Available:**", unsafe_allow_html=True)
-                    st.markdown(quality_badges, unsafe_allow_html=True)
-                
-                # Links
-                col1, col3 = st.columns(2)
-                with col1:
-                    if movie.get('imdb_link'):
-                        st.link_button("↗️ IMDB", movie['imdb_link'], width='stretch')
-                
-                # with col2:
-                #     if movie.get('magnet_links'):
-                #         with st.popover("🧲 Magnets"):
-                #             for link in movie['magnet_links']:
-                #                 st.markdown(f"**{link['quality']} {link['type']}**")
-                #                 st.code(link['url'], language=None)
-                
-                with col3:
-                    if movie.get('magnet_links'):
-                        # Check if movie exists in Jellyfin
-                        exists_in_jellyfin = check_movie_in_jellyfin(movie['title'], movie['year'])
-                        
-                        if exists_in_jellyfin:
-                            st.markdown("<div style='text-align: center; padding: 8px; background-color: #2d7f2d; border-radius: 5px;'>✅ In Library</div>", unsafe_allow_html=True)
-                        else:
-                            # Check if currently downloading
-                            best_magnet = select_best_magnet(movie['magnet_links'])
-                            if best_magnet:
-                                torrent_id = best_magnet['url'].split('btih:')[1].split('&')[0].upper() if 'btih:' in best_magnet['url'] else None
-                                
-                                # Look up status in CSV
-                                downloading_status = None
-                                if torrent_id:
-                                    csv_file = "torrent_tracking.csv"
-                                    if Path(csv_file).exists():
-                                        try:
-                                            with open(csv_file, 'r') as f:
-                                                reader = csv.DictReader(f)
-                                                rows = list(reader)
-                                                # Get latest entry for this torrent
-                                                for row in reversed(rows):
-                                                    if row.get('torrent_id', '').upper() == torrent_id:
-                                                        downloading_status = row
-                                                        break
-                                        except Exception:
-                                            pass
-                                
-                                if downloading_status:
-                                    if float(downloading_status.get('completion_percent', '0')) < 100:
-                                        # Show completion percentage as a button to refresh status
-                                        completion = downloading_status.get('completion_percent', '0')
-                                        if st.button(f"🔄 {completion}%", width='stretch', key=f"update_status_{movie['slug']}"):
-                                            update_torrent_statuses_from_deluge()
-                                            st.rerun()
-                                    else:
-                                        completion = downloading_status.get('completion_percent', '0')
-                                        st.markdown("<div style='text-align: center; padding: 8px; background-color: #2d7f2d; border-radius: 5px;'>💯 Completed</div>", unsafe_allow_html=True) 
-                                else:
-                                    # Show request button
-                                    if st.button("📥 Request", width='stretch', key=f"request_{movie['slug']}"):
-                                        request_movie(best_magnet['url'], movie['title'], movie['year'])
-                
-                st.divider()
-
-# Page navigation at bottom
-if total_pages > 1:
-    st.divider()
-    col1, col2, col3, col4, col5 = st.columns([1, 1, 2, 1, 1])
+    # Check if currently downloading
+    best_magnet = select_best_magnet(movie.magnet_links)
+    if not best_magnet:
+        return
     
+    if downloading_status:
+        if not downloading_status.is_complete:
+            # Show completion percentage as a button to refresh status
+            completion = f"{downloading_status.completion:g}"
+            if st.button(f"🔄 {completion}%", width='stretch', key=f"update_status_{movie.slug}"):
+                get_torrent_poller().refresh_now()
+        else:
+            st.markdown("<div style='text-align: center; padding: 8px; background-color: #2d7f2d; border-radius: 5px;'>💯 Completed</div>", unsafe_allow_html=True) 
+    elif request_job and request_job.state != FAILED:
+        # Queued or being added by a worker
+        waiting_for = get_request_queue().waiting_for if request_job.state == QUEUED else None
+        reason = {'slot': "Waiting for a free download slot", 'disk': "Waiting for disk space"}.get(waiting_for)
+        st.button(f"⏳ {request_job.state.capitalize()}...", width='stretch', disabled=True, key=f"request_{movie.slug}", help=reason)
+    else:
+        if request_job:
+            st.caption(f"⚠️ Last request failed: {request_job.error}")
+        # Show request button
+        if st.button("📥 Request", width='stretch', key=f"request_{movie.slug}"):
+            request_movie(movie, best_magnet)
+        if selection_mode:
+            in_cart = st.checkbox("🛒 Add to cart", value=movie.slug in st.session_state.cart, key=f"cart_{movie.slug}")
+            if in_cart != (movie.slug in st.session_state.cart):
+                toggle_cart(movie.slug, movie.title, movie.year)
+                # The cart summary lives in the sidebar, outside this fragment
+                st.rerun()
+
+def finish_grid_profile(profile, fragment_run):
+    """Log a grid-only rerun's profile; a full run's grid time is part of the page profile."""
+    if fragment_run and profiling_enabled():
+        sample = profile.finish()
+        profiling.ProfileLog.shared().append(sample)
+        st.caption(f"⏱️ Grid rerun: {sample['total_ms']:.0f} ms")
+
+# A card's widget reruns on its own when clicked; cards with a download or
+# request in flight also refresh themselves as often as the poller updates,
+# until there is nothing left to follow.
+static_card_actions = st.fragment(card_actions)
+live_card_actions = st.fragment(card_actions, run_every=POLL_INTERVAL)
+
+@st.fragment
+def movie_grid(catalog, similar, filtered_rows, items_per_page, selection_mode):
+    """Navigation bars and the current page of cards; a page flip reruns only this."""
+    # A fragment rerun has no page profile of its own; time it separately
+    profile = profiling.current()
+    fragment_run = profile is None or profile.total is not None
+    if fragment_run:
+        profile = profiling.start("grid")
+    filtered_movies = catalog.view(filtered_rows)
+    total_movies = len(filtered_movies)
+    total_pages = (total_movies + items_per_page - 1) // items_per_page
+    if total_pages == 0:
+        st.markdown("**No movies found**")
+        finish_grid_profile(profile, fragment_run)
+        return
     current_page = st.session_state.page_number
     
-    with col1:
-        if st.button("⏮️ First", width='stretch', disabled=(current_page == 1), key="first_btn"):
-            st.session_state.page_number = 1
-            st.rerun()
-    
-    with col2:
-        if st.button("⬅️ Previous", width='stretch', disabled=(current_page == 1), key="prev_btn"):
-            st.session_state.page_number = current_page - 1
-            st.rerun()
+    # Top page navigation
+    page_navigation(current_page, total_pages, "top_", "⬅️ Prev")
     
-    with col3:
-        st.markdown(f"<div style='text-align: center; padding-top: 8px;'><strong>Page {current_page} of {total_pages}</strong></div>", unsafe_allow_html=True)
+    # Calculate start and end indices
+    start_idx = (current_page - 1) * items_per_page
+    end_idx = min(start_idx + items_per_page, total_movies)
     
-    with col4:
-        if st.button("Next ➡️", width='stretch', disabled=(current_page == total_pages), key="next_btn"):
-            st.session_state.page_number = current_page + 1
-            st.rerun()
+    # Slice the filtered movies for current page
+    page_movies = filtered_movies[start_idx:end_idx]
+
+    # Have the next page's thumbnails ready before it is opened
+    next_page = catalog.view(filtered_rows[end_idx:end_idx + items_per_page])
+    get_poster_cache().prefetch(movie.poster for movie in next_page)
     
-    with col5:
-        if st.button("Last ⏭️", width='stretch', disabled=(current_page == total_pages), key="last_btn"):
-            st.session_state.page_number = total_pages
-            st.rerun()
+    st.markdown(f"**Showing {start_idx + 1}-{end_idx} of {total_movies} movies**")
+
+    # Look up the torrent status of every visible movie in one query
+    visible_infohashes = {}
+    for movie in page_movies:
+        best_magnet = select_best_magnet(movie.magnet_links)
+        if best_magnet:
+            visible_infohashes[movie.slug] = infohash_from_magnet(best_magnet.url)
+    with profile.timed("status lookups"):
+        torrent_statuses = get_torrent_poller().get(visible_infohashes.values())
+        request_jobs = get_request_queue().jobs(visible_infohashes.values())
+    
+    # Display movies in grid
+    cols_per_row = 3
+    for i in range(0, len(page_movies), cols_per_row):
+        cols = st.columns(cols_per_row)
+        for idx, col in enumerate(cols):
+            if i + idx < len(page_movies):
+                movie = page_movies[i + idx]
+                with col:
+                    # Movie poster
+                    if movie.poster:
+                        poster_url = get_poster_cache().url(movie.poster)
+                        profile.cache("poster thumbnails", poster_url.startswith(THUMBNAIL_URL))
+                        st.image(poster_url, width='stretch')
+                    
+                    # Movie title and year
+                    st.markdown(f"### {movie.title} ({movie.year})")
+                    
+                    # IMDB Rating
+                    if movie.imdb_rating:
+                        st.markdown(f"⭐ **{movie.imdb_rating}/10** IMDB")
+                    
+                    # Genres
+                    if movie.genres:
+                        genres_html = " ".join([f'<span class="genre-tag">{g}</span>' for g in movie.genres])
+                        st.markdown(genres_html, unsafe_allow_html=True)
+                    
+                    # Synopsis
+                    if movie.synopsis:
+                        with st.expander("📖 Synopsis"):
+                            st.write(movie.synopsis)
+                    
+                    # Director and Cast
+                    if movie.director:
+                        st.markdown(f"**Director:** {movie.director}")
+                    
+                    if movie.cast:
+                        with st.expander("🎭 Cast"):
+                            st.write(", ".join(movie.cast))
+                    
+                    # Similar movies, looked up in the table built with the catalog
+                    similar_movies = [catalog.movies[row] for row in similar.rows(catalog.by_slug[movie.slug])[:3].tolist()]
+                    if similar_movies:
+                        st.caption("More like this: " + " · ".join(f"{m.title} ({m.year})" for m in similar_movies))
+                        if st.button("🎞️ More like this", width='stretch', key=f"similar_{movie.slug}"):
+                            st.session_state.similar_to = movie.slug
+                            st.session_state.page_number = 1
+                            st.rerun()
+                    
+                    # Available qualities
+                    if movie.magnet_links:
+                        qualities = set(f"{link.quality} {link.type}" for link in movie.magnet_links)
+                        quality_badges = " ".join([f'<span class="quality-badge">{q}</span>' for q in sorted(qualities)])
+                        st.markdown("**Available:**", unsafe_allow_html=True)
+                        st.markdown(quality_badges, unsafe_allow_html=True)
+                    
+                    # Links
+                    col1, col3 = st.columns(2)
+                    with col1:
+                        if movie.imdb_link:
+                            st.link_button("↗️ IMDB", movie.imdb_link, width='stretch')
+                    
+                    # with col2:
+                    #     if movie.magnet_links:
+                    #         with st.popover("🧲 Magnets"):
+                    #             for link in movie.magnet_links:
+                    #                 st.markdown(f"**{link.quality} {link.type}**")
+                    #                 st.code(link.url, language=None)
+                    
+                    with col3:
+                        if movie.magnet_links:
+                            infohash = visible_infohashes.get(movie.slug)
+                            in_library = check_movie_in_jellyfin(movie.title, movie.year, movie.imdb_link)
+                            live = card_in_flight(in_library, torrent_statuses.get(infohash), request_jobs.get(infohash))
+                            (live_card_actions if live else static_card_actions)(movie, infohash, selection_mode, live)
+                    
+                    st.divider()
+    
+    # Page navigation at bottom
+    if total_pages > 1:
+        st.divider()
+        page_navigation(current_page, total_pages, "", "⬅️ Previous")
+
+    finish_grid_profile(profile, fragment_run)
+
+movie_grid(catalog, snapshot.similar, filtered_rows, items_per_page, selection_mode)
+profile.lap("grid")
+
+# Per-phase breakdown of this run, for admins who switched profiling on
+if profiling_enabled():
+    show_profile(profile.finish())
@@ -0,0 +1,520 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+import json
+import os
+import threading
+
+from loguru import logger
+import numpy as np
+
+from sizes import estimate_size
+from search import CatalogSearch
+from similar import SimilarMovies
+
+
+CATALOG_FILE = Path("out.json")
+RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "30"))
+
+# Sort options that map to a precomputed catalog order: (column, descending)
+SORT_ORDERS = {
+	"Relevance": ('year', True),
+	"Title": ('title', False),
+	"Year (Newest)": ('year', True),
+	"Year (Oldest)": ('year', False),
+	"Rating (Highest)": ('rating', True),
+	"Rating (Lowest)": ('rating', False),
+}
+
+
+class MagnetRecord(NamedTuple):
+	quality: Optional[str]
+	type: Optional[str]
+	url: str
+
+
+class TorrentRecord(NamedTuple):
+	quality: Optional[str]
+	type: Optional[str]
+	path: str
+
+
+class PosterRecord(NamedTuple):
+	url: str
+	path: Optional[str] = None
+
+
+class Movie(NamedTuple):
+	"""One catalog entry; immutable so a single copy can be shared by every session."""
+
+	slug: str
+	title: str
+	year: int
+	genres: Tuple[str, ...]
+	imdb_link: Optional[str]
+	imdb_rating: Optional[float]
+	synopsis: Optional[str]
+	director: Optional[str]
+	cast: Tuple[str, ...]
+	poster: Optional[PosterRecord]
+	magnet_links: Tuple[MagnetRecord, ...]
+	# Only the .torrent files mirrored to disk; used for download size estimates.
+	torrent_files: Tuple[TorrentRecord, ...] = ()
+
+	@classmethod
+	def from_json(cls, entry: dict) -> Movie:
+		poster = entry.get('poster')
+		return cls(
+			slug=entry['slug'],
+			title=entry['title'],
+			year=entry['year'],
+			genres=tuple(entry.get('genres') or ()),
+			imdb_link=entry.get('imdb_link'),
+			imdb_rating=entry.get('imdb_rating'),
+			synopsis=entry.get('synopsis'),
+			director=entry.get('director'),
+			cast=tuple(entry.get('cast') or ()),
+			poster=PosterRecord(poster['url'], poster.get('path')) if poster and poster.get('url') else None,
+			magnet_links=tuple(
+				MagnetRecord(link.get('quality'), link.get('type'), link['url'])
+				for link in entry.get('magnet_links') or ()
+			),
+			torrent_files=tuple(
+				TorrentRecord(torrent.get('quality'), torrent.get('type'), torrent['path'])
+				for torrent in entry.get('torrent_files') or ()
+				if torrent.get('path')
+			),
+		)
+
+
+def download_size(movie: Movie, magnet: MagnetRecord) -> int:
+	"""Estimated size of the release behind ``magnet``, read from its .torrent file when there is one."""
+	torrent = next((torrent for torrent in movie.torrent_files if (torrent.quality, torrent.type) == (magnet.quality, magnet.type)), None)
+	return estimate_size(magnet.url, torrent.path if torrent else None, magnet.quality)
+
+
+def select_best_magnet(magnet_links: Sequence[MagnetRecord]) -> Optional[MagnetRecord]:
+	"""Select the best magnet link based on quality and type preferences."""
+	if not magnet_links:
+		return None
+
+	# Quality preference order
+	quality_order = ['1080p', '2160p', '720p', '480p', '3D']
+
+	# Type preference patterns (in order)
+	type_patterns = [
+		lambda t: t.startswith('WEB'),  # WEB*
+		lambda t: t == 'BluRay',        # BluRay
+		lambda t: t.startswith('DVD'),  # DVD*
+		lambda t: t.startswith('HD')    # HD*
+	]
+
+	# Score each magnet link
+	def score_link(link):
+		quality = link.quality or ''
+		link_type = link.type or ''
+
+		# Quality score (lower is better)
+		try:
+			quality_score = quality_order.index(quality)
+		except ValueError:
+			quality_score = len(quality_order)  # Unknown quality gets lowest priority
+
+		# Type score (lower is better)
+		type_score = len(type_patterns)  # Default to lowest priority
+		for idx, pattern in enumerate(type_patterns):
+			if pattern(link_type):
+				type_score = idx
+				break
+
+		# Return tuple for sorting (quality first, then type)
+		return (quality_score, type_score)
+
+	# Sort and return the best link
+	best_link = min(magnet_links, key=score_link)
+	return best_link
+
+
+class CatalogView:
+	"""An ordered selection of catalog rows; slicing it only touches the rows asked for."""
+
+	__slots__ = ('catalog', 'rows')
+
+	def __init__(self, catalog: Catalog, rows: np.ndarray) -> None:
+		self.catalog = catalog
+		self.rows = rows
+
+	def __len__(self) -> int:
+		return len(self.rows)
+
+	def __getitem__(self, index: Union[int, slice]) -> Union[Movie, List[Movie]]:
+		movies = self.catalog.movies
+		if isinstance(index, slice):
+			return [movies[row] for row in self.rows[index].tolist()]
+		return movies[int(self.rows[index])]
+
+	def __iter__(self) -> Iterator[Movie]:
+		movies = self.catalog.movies
+		return (movies[row] for row in self.rows.tolist())
+
+
+class Catalog:
+	"""The scraped ``out.json`` catalog, loaded once per process and shared read-only.
+
+	Movies are immutable records; per-movie values needed for sorting are kept
+	as NumPy columns, so filters and sorts work on row numbers and never copy
+	or reorder the movies themselves. Every sort order is also precomputed as a
+	permutation, so ordering a filter result needs no sorting at all.
+	"""
+
+	def __init__(self, movies: Sequence[Movie], supported_qualities: Sequence[str] = ()) -> None:
+		self.movies: Tuple[Movie, ...] = tuple(movies)
+		self.supported_qualities = tuple(supported_qualities)
+		self.by_slug: Dict[str, int] = {movie.slug: row for row, movie in enumerate(self.movies)}
+		self.years = np.fromiter((movie.year for movie in self.movies), dtype=np.int32, count=len(self.movies))
+		self.ratings = np.fromiter((movie.imdb_rating or 0 for movie in self.movies), dtype=np.float32, count=len(self.movies))
+		# Position of each movie in title order, so titles sort as integers.
+		title_order = sorted(range(len(self.movies)), key=lambda row: self.movies[row].title)
+		self.title_ranks = np.empty(len(self.movies), dtype=np.int32)
+		self.title_ranks[title_order] = np.arange(len(self.movies), dtype=np.int32)
+
+		# (key, descending) -> all rows in that order, ties in catalog order.
+		self.orders: Dict[Tuple[str, bool], np.ndarray] = {}
+		for key, column in self._columns().items():
+			self.orders[(key, False)] = np.argsort(column, kind='stable')
+			self.orders[(key, True)] = np.argsort(-column, kind='stable')
+
+	@classmethod
+	def load(cls, path: Path) -> Catalog:
+		with path.open('r', encoding='utf-8') as handle:
+			data = json.load(handle)
+		return cls([Movie.from_json(entry) for entry in data['media']], data.get('supported_qualities') or ())
+
+	def __len__(self) -> int:
+		return len(self.movies)
+
+	def movie(self, slug: str) -> Optional[Movie]:
+		row = self.by_slug.get(slug)
+		return self.movies[row] if row is not None else None
+
+	def _columns(self) -> Dict[str, np.ndarray]:
+		return {'year': self.years, 'title': self.title_ranks, 'rating': self.ratings}
+
+	def sort(self, rows: np.ndarray, key: str, descending: bool = False) -> np.ndarray:
+		"""``rows`` ordered by ``year``, ``title`` or ``rating``; ties keep their current order."""
+		column = self._columns()[key][rows]
+		return rows[np.argsort(-column if descending else column, kind='stable')]
+
+	def ordered(self, mask: np.ndarray, key: str, descending: bool = False) -> np.ndarray:
+		"""Rows selected by ``mask`` in the precomputed order, without sorting."""
+		order = self.orders[(key, descending)]
+		return order[mask[order]]
+
+	def view(self, rows: np.ndarray) -> CatalogView:
+		return CatalogView(self, rows)
+
+
+def pack(mask: np.ndarray) -> np.ndarray:
+	"""A boolean row mask as a bitset of 64-bit words (row ``i`` is bit ``i % 64`` of word ``i // 64``)."""
+	packed = np.packbits(mask, bitorder='little')
+	words = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+	words[:len(packed)] = packed
+	return words.view(np.uint64)
+
+
+def unpack(bits: np.ndarray, size: int) -> np.ndarray:
+	return np.unpackbits(bits.view(np.uint8), count=size, bitorder='little').view(bool)
+
+
+if hasattr(np, 'bitwise_count'):
+	def popcount(bits: np.ndarray) -> np.ndarray:
+		"""Set bits along the last axis."""
+		return np.bitwise_count(bits).sum(axis=-1)
+else:
+	# NumPy < 2 has no popcount ufunc; count per byte with a lookup table instead.
+	BYTE_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+	def popcount(bits: np.ndarray) -> np.ndarray:
+		"""Set bits along the last axis."""
+		return BYTE_COUNTS[bits.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+class Facet:
+	"""The rows having each value of one filter, as packed bitsets."""
+
+	def __init__(self, value_rows: Dict[object, List[int]], size: int) -> None:
+		self.values = list(value_rows)
+		self.positions = {value: position for position, value in enumerate(self.values)}
+		self.bits = np.zeros((len(self.values), -(-size // 64)), dtype=np.uint64)
+		column = np.zeros(size, dtype=bool)
+		for position, rows in enumerate(value_rows.values()):
+			column[:] = False
+			column[rows] = True
+			self.bits[position] = pack(column)
+
+	def any_of(self, values: Iterable) -> np.ndarray:
+		"""Rows having any of ``values``."""
+		positions = [self.positions[value] for value in values if value in self.positions]
+		if not positions:
+			return np.zeros(self.bits.shape[1], dtype=np.uint64)
+		return np.bitwise_or.reduce(self.bits[positions], axis=0)
+
+	def counts(self, within: np.ndarray) -> Dict[object, int]:
+		"""How many of the rows in ``within`` have each value."""
+		return dict(zip(self.values, popcount(self.bits & within).tolist()))
+
+
+class FilterIndex:
+	"""Bitsets for the sidebar filters, built once per catalog load.
+
+	Bit ``i`` of every bitset describes ``media[i]``. A filter combination is
+	evaluated as OR within a facet and AND across facets on 64 rows per word,
+	and the same bitsets give the number of results behind every filter
+	option with one popcount each.
+	"""
+
+	FACETS = ('year', 'genre', 'quality')
+
+	def __init__(self, media: Sequence[Movie]) -> None:
+		self.size = len(media)
+
+		year_rows: Dict[int, List[int]] = {}
+		genre_rows: Dict[str, List[int]] = {}
+		quality_rows: Dict[str, List[int]] = {}
+		ratings = np.zeros(self.size, dtype=np.float32)
+		for row, movie in enumerate(media):
+			year_rows.setdefault(movie.year, []).append(row)
+			for genre in set(movie.genres):
+				genre_rows.setdefault(genre, []).append(row)
+			for quality in {link.quality for link in movie.magnet_links}:
+				if quality:
+					quality_rows.setdefault(quality, []).append(row)
+			ratings[row] = movie.imdb_rating or 0
+
+		self.facets: Dict[str, Facet] = {
+			'year': Facet(year_rows, self.size),
+			'genre': Facet(genre_rows, self.size),
+			'quality': Facet(quality_rows, self.size),
+		}
+		self.all_rows = pack(np.ones(self.size, dtype=bool))
+
+		self.years = sorted(year_rows, reverse=True)
+		self.genres = sorted(genre_rows)
+
+		# Ratings sorted ascending with the matching row numbers, so a minimum
+		# rating becomes one binary search plus a slice.
+		self.rating_order = np.argsort(ratings, kind='stable')
+		self.sorted_ratings = ratings[self.rating_order]
+
+	def rating_at_least(self, min_rating: float) -> np.ndarray:
+		# float32 ratings are compared against a float32 threshold so 7.1 >= 7.1 holds.
+		start = np.searchsorted(self.sorted_ratings, np.float32(min_rating), side='left')
+		mask = np.zeros(self.size, dtype=bool)
+		mask[self.rating_order[start:]] = True
+		return mask
+
+	def _selected(self, years: Sequence[int], genres: Sequence[str], qualities: Sequence[str]) -> Dict[str, np.ndarray]:
+		"""Bitset of each facet with a selection (an empty selection matches all)."""
+		selections = zip(self.FACETS, (years, genres, qualities))
+		return {name: self.facets[name].any_of(values) for name, values in selections if values}
+
+	def _base(self, min_rating: float, within: Optional[np.ndarray]) -> np.ndarray:
+		bits = self.all_rows
+		if min_rating > 0:
+			bits = bits & pack(self.rating_at_least(min_rating))
+		if within is not None:
+			bits = bits & pack(within)
+		return bits
+
+	def mask(self, years: Sequence[int] = (), genres: Sequence[str] = (), qualities: Sequence[str] = (), min_rating: float = 0.0) -> np.ndarray:
+		"""Rows matching every selected facet (an empty selection matches all)."""
+		bits = self._base(min_rating, None)
+		for facet_bits in self._selected(years, genres, qualities).values():
+			bits = bits & facet_bits
+		return unpack(bits, self.size)
+
+	def rows(self, **filters) -> np.ndarray:
+		return np.flatnonzero(self.mask(**filters))
+
+	def counts(
+		self,
+		years: Sequence[int] = (),
+		genres: Sequence[str] = (),
+		qualities: Sequence[str] = (),
+		min_rating: float = 0.0,
+		within: Optional[np.ndarray] = None,
+	) -> Dict[str, Dict[object, int]]:
+		"""Results per year, genre and quality under all the *other* filters.
+
+		Each facet ignores its own selection, so the count next to an option is
+		what that option matches given everything else that is selected.
+		``within`` is a row mask to count in, e.g. the search results.
+		"""
+		base = self._base(min_rating, within)
+		selected = self._selected(years, genres, qualities)
+		counts = {}
+		for name, facet in self.facets.items():
+			bits = base
+			for other, other_bits in selected.items():
+				if other != name:
+					bits = bits & other_bits
+			counts[name] = facet.counts(bits)
+		return counts
+
+
+class CatalogSnapshot(NamedTuple):
+	"""A catalog with the indexes built from it; replaced as a whole, so a rerun never mixes versions."""
+
+	catalog: Catalog
+	filters: FilterIndex
+	search: CatalogSearch
+	similar: SimilarMovies
+	version: Optional[Tuple[int, int]]
+
+	def query(
+		self,
+		title: str = "",
+		cast: str = "",
+		director: str = "",
+		years: Sequence[int] = (),
+		genres: Sequence[str] = (),
+		qualities: Sequence[str] = (),
+		min_rating: float = 0.0,
+		sort: str = "Relevance",
+	) -> np.ndarray:
+		"""Rows matching the filters and search boxes, in ``sort`` order (a ``SORT_ORDERS`` key)."""
+		scores = self.search.scores(title=title, cast=cast, director=director)
+		return self._ordered(scores, self.filters.mask(years=years, genres=genres, qualities=qualities, min_rating=min_rating), sort)
+
+	def query_with_counts(
+		self,
+		title: str = "",
+		cast: str = "",
+		director: str = "",
+		years: Sequence[int] = (),
+		genres: Sequence[str] = (),
+		qualities: Sequence[str] = (),
+		min_rating: float = 0.0,
+		sort: str = "Relevance",
+	) -> Tuple[np.ndarray, Dict[str, Dict[object, int]]]:
+		"""``query`` plus the facet counts for the sidebar (see ``FilterIndex.counts``), sharing one search."""
+		scores = self.search.scores(title=title, cast=cast, director=director)
+		rows = self._ordered(scores, self.filters.mask(years=years, genres=genres, qualities=qualities, min_rating=min_rating), sort)
+		counts = self.filters.counts(
+			years=years, genres=genres, qualities=qualities, min_rating=min_rating,
+			within=None if scores is None else scores > 0,
+		)
+		return rows, counts
+
+	def _ordered(self, scores: Optional[np.ndarray], mask: np.ndarray, sort: str) -> np.ndarray:
+		key, descending = SORT_ORDERS[sort]
+		if scores is None:
+			# Intersect the filters with the precomputed order; no sorting needed
+			return self.catalog.ordered(mask, key, descending)
+		# Ranked search results (best match first)
+		rows = self.search.rank(scores, mask)
+		if sort == "Relevance":
+			return rows
+		# Search results are few; order them while keeping relevance for ties
+		return self.catalog.sort(rows, key, descending)
+
+
+def catalog_version(path: Path) -> Optional[Tuple[int, int]]:
+	"""``(mtime_ns, size)`` of the catalog file, or None when it is missing."""
+	try:
+		stat = path.stat()
+	except FileNotFoundError:
+		return None
+	return (stat.st_mtime_ns, stat.st_size)
+
+
+class CatalogReloader:
+	"""Keeps the newest ``out.json`` loaded, rebuilding it on a background thread.
+
+	Readers use ``current``. A changed file is loaded and indexed off the page's
+	thread and then swapped in with a single assignment, so running reruns keep
+	the snapshot they started with and nothing else is invalidated.
+	"""
+
+	_shared: Dict[Path, CatalogReloader] = {}
+	_shared_lock = threading.Lock()
+
+	def __init__(self, path: Path = CATALOG_FILE, interval: float = RELOAD_INTERVAL) -> None:
+		self.path = path
+		self.interval = interval
+		self.current = self._build(catalog_version(path))
+		self.last_error: Optional[str] = None
+		self._seen = self.current.version
+		self._failed: Optional[Tuple[int, int]] = None
+		self._force = False
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="catalog-reload", daemon=True)
+
+	@classmethod
+	def shared(cls, path: Path = CATALOG_FILE, **kwargs) -> CatalogReloader:
+		"""One reloader per catalog file and process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			reloader = cls._shared.get(path)
+			if reloader is None:
+				reloader = cls(path, **kwargs).start()
+				cls._shared[path] = reloader
+			return reloader
+
+	def start(self) -> CatalogReloader:
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		self._wake.set()
+		self._thread.join()
+
+	def refresh_now(self) -> None:
+		"""Reload on the background thread now, without waiting for the file to settle."""
+		self._force = True
+		self._wake.set()
+
+	def _build(self, version: Optional[Tuple[int, int]]) -> CatalogSnapshot:
+		catalog = Catalog.load(self.path)
+		movies = catalog.movies
+		return CatalogSnapshot(catalog, FilterIndex(movies), CatalogSearch(movies), SimilarMovies(movies), version)
+
+	def check_once(self, force: bool = False) -> bool:
+		"""Load the catalog again if the file changed; returns True when a new snapshot was swapped in.
+
+		``main.py`` output is usually redirected into ``out.json``, so a change
+		is only loaded once the file has looked the same for a whole interval.
+		A version that fails to load is not retried until the file changes again.
+		"""
+		version = catalog_version(self.path)
+		settled = version == self._seen
+		self._seen = version
+		if version is None or (not force and (version == self.current.version or version == self._failed or not settled)):
+			return False
+		try:
+			snapshot = self._build(version)
+		except (OSError, ValueError, KeyError, TypeError) as exc:
+			self._failed = version
+			self.last_error = str(exc)
+			logger.warning("Loading catalog {} failed, keeping the current one: {}", self.path, exc)
+			return False
+		if catalog_version(self.path) != version:
+			# Rewritten while loading; the next check picks up the final file.
+			return False
+		self.current = snapshot
+		self.last_error = None
+		logger.info("Loaded new catalog from {}: {} movies", self.path, len(snapshot.catalog))
+		return True
+
+	def _run(self) -> None:
+		while not self._stop.is_set():
+			self._wake.wait(self.interval)
+			self._wake.clear()
+			force, self._force = self._force, False
+			try:
+				self.check_once(force)
+			except Exception as exc:  # noqa: BLE001
+				self.last_error = str(exc)
+				logger.warning("Catalog reload failed: {}", exc)
@@ -0,0 +1,239 @@
+"""Deluge daemon RPC client with a small pool of logged-in connections.
+
+Replaces shelling out to ``docker compose exec deluge deluge-console`` for
+every add and status check. Connections are opened lazily, reused across
+calls and threads, and dropped when they fail.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import os
+import queue
+import socket
+import struct
+import threading
+import zlib
+
+from deluge_client import DelugeRPCClient
+from deluge_client.client import RPC_ERROR, RPC_RESPONSE, ConnectionLostException, DelugeClientException, RemoteException
+from deluge_client.rencode import dumps, loads
+from loguru import logger
+from pydantic import BaseModel
+
+from torrent_store import infohash_from_magnet, normalize_infohash
+
+
+DEFAULT_PORT = 58846
+POOL_SIZE = int(os.getenv("DELUGE_POOL_SIZE", "4"))
+CALL_TIMEOUT = 10
+DOWNLOAD_PATH = "/8tb_hdd"
+MOVE_COMPLETED_PATH = "/8tb_hdd/Movies"
+STATUS_KEYS = ["name", "progress", "state", "total_size", "download_payload_rate", "eta"]
+# Deluge 2 frames each message as a protocol version byte and a body length.
+MESSAGE_HEADER = struct.Struct("!BI")
+
+Call = Tuple[str, tuple, dict]
+
+
+class DelugeError(Exception):
+	pass
+
+
+class TorrentInfo(BaseModel):
+	infohash: str
+	name: Optional[str] = None
+	progress: float = 0.0
+	state: Optional[str] = None
+	total_size: int = 0
+	download_payload_rate: int = 0
+	eta: int = 0
+
+
+class PooledClient(DelugeRPCClient):
+	def _create_socket(self, *args, **kwargs) -> None:
+		super()._create_socket(*args, **kwargs)
+		# Requests are written as a header and a body; with Nagle's algorithm
+		# on, each call would stall on a delayed ACK for ~40 ms.
+		self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+	def _recv_exact(self, size: int) -> bytes:
+		data = b''
+		while len(data) < size:
+			chunk = self._socket.recv(size - len(data))
+			if not chunk:
+				raise ConnectionLostException()
+			data += chunk
+		return data
+
+	def call_many(self, calls: Sequence[Call]) -> List[object]:
+		"""Run several calls in one request message and one round trip.
+
+		Returns one entry per call, in order: its result, or the
+		``RemoteException`` the daemon raised for it. Daemons speaking an older
+		protocol get the calls one at a time.
+		"""
+		if self.deluge_version != 2 or self.deluge_protocol_version != 1:
+			results: List[object] = []
+			for method, args, kwargs in calls:
+				try:
+					results.append(self.call(method, *args, **kwargs))
+				except RemoteException as exc:
+					results.append(exc)
+			return results
+
+		first_id = self.request_id + 1
+		self.request_id += len(calls)
+		request = tuple((first_id + offset, method, args, kwargs) for offset, (method, args, kwargs) in enumerate(calls))
+		body = zlib.compress(dumps(request))
+		self._socket.sendall(MESSAGE_HEADER.pack(1, len(body)) + body)
+
+		# Replies to asynchronous calls (such as adding a torrent) may arrive in any order.
+		results: Dict[int, object] = {}
+		while len(results) < len(calls):
+			_, length = MESSAGE_HEADER.unpack(self._recv_exact(MESSAGE_HEADER.size))
+			message = loads(zlib.decompress(self._recv_exact(length)), decode_utf8=True)
+			kind, request_id = message[0], message[1]
+			if kind == RPC_RESPONSE:
+				results[request_id] = message[2]
+			elif kind == RPC_ERROR:
+				exception_type, exception_args = message[2], message[3]
+				exception = type(str(exception_type), (RemoteException,), {})
+				results[request_id] = exception(', '.join(map(str, exception_args)))
+		return [results[first_id + offset] for offset in range(len(calls))]
+
+
+class DelugePool:
+	"""Up to ``size`` authenticated daemon connections shared by all callers."""
+
+	def __init__(self, host: str, port: int, username: str, password: str, size: int = POOL_SIZE, timeout: float = CALL_TIMEOUT) -> None:
+		self.host = host
+		self.port = port
+		self.username = username
+		self.password = password
+		self.timeout = timeout
+		self._idle: queue.LifoQueue = queue.LifoQueue()
+		self._slots = threading.BoundedSemaphore(size)
+
+	@classmethod
+	def from_env(cls) -> Optional[DelugePool]:
+		"""Pool configured from ``DELUGE_HOST``/``DELUGE_PORT``/credentials, or None when unset."""
+		username = os.getenv("DELUGE_USERNAME")
+		password = os.getenv("DELUGE_PASSWORD")
+		if not username or not password:
+			return None
+		return cls(
+			os.getenv("DELUGE_HOST", "127.0.0.1"),
+			int(os.getenv("DELUGE_PORT", str(DEFAULT_PORT))),
+			username,
+			password,
+		)
+
+	def _connect(self) -> DelugeRPCClient:
+		client = PooledClient(self.host, self.port, self.username, self.password, decode_utf8=True, timeout=self.timeout)
+		client.connect()
+		logger.debug("Connected to deluge daemon at {}:{}", self.host, self.port)
+		return client
+
+	@contextmanager
+	def client(self) -> Iterator[DelugeRPCClient]:
+		"""Borrow a connection; it goes back to the pool unless the call broke it."""
+		if not self._slots.acquire(timeout=self.timeout):
+			raise DelugeError("No deluge connection available")
+		client = None
+		try:
+			try:
+				client = self._idle.get_nowait()
+			except queue.Empty:
+				client = self._connect()
+			yield client
+		except RemoteException:
+			# The daemon rejected the call; the connection itself is fine.
+			self._idle.put(client)
+			raise
+		except Exception:
+			if client is not None:
+				try:
+					client.disconnect()
+				except Exception:  # noqa: BLE001
+					pass
+			raise
+		else:
+			self._idle.put(client)
+		finally:
+			self._slots.release()
+
+	def call(self, method: str, *args, **kwargs):
+		try:
+			with self.client() as client:
+				return client.call(method, *args, **kwargs)
+		except (DelugeClientException, OSError) as exc:
+			raise DelugeError(f"{method} failed: {exc}") from exc
+
+	def call_many(self, calls: Sequence[Call]) -> List[object]:
+		"""Several calls in one round trip; failed calls come back as ``DelugeError`` values."""
+		if not calls:
+			return []
+		try:
+			with self.client() as client:
+				results = client.call_many(calls)
+		except (DelugeClientException, OSError) as exc:
+			raise DelugeError(f"{len(calls)} calls failed: {exc}") from exc
+		return [
+			DelugeError(f"{method} failed: {result}") if isinstance(result, RemoteException) else result
+			for (method, _, _), result in zip(calls, results)
+		]
+
+	def add_magnet(self, magnet_url: str, download_location: str = DOWNLOAD_PATH, move_completed_path: str = MOVE_COMPLETED_PATH) -> str:
+		"""Add a magnet link and return its infohash (also when it was already added)."""
+		result = self.add_magnets([magnet_url], download_location, move_completed_path)[0]
+		if isinstance(result, DelugeError):
+			raise result
+		return result
+
+	def add_magnets(self, magnet_urls: Sequence[str], download_location: str = DOWNLOAD_PATH, move_completed_path: str = MOVE_COMPLETED_PATH) -> List[Union[str, DelugeError]]:
+		"""Add several magnet links in one round trip.
+
+		Returns the infohash of each link (also when it was already added), or
+		the ``DelugeError`` that adding it raised.
+		"""
+		options = {
+			'download_location': download_location,
+			'move_completed': True,
+			'move_completed_path': move_completed_path,
+		}
+		results = self.call_many([('core.add_torrent_magnet', (url, options), {}) for url in magnet_urls])
+		infohashes: List[Union[str, DelugeError]] = []
+		for url, result in zip(magnet_urls, results):
+			if isinstance(result, DelugeError) and 'already' in str(result).lower():
+				result = infohash_from_magnet(url)
+			if isinstance(result, DelugeError):
+				infohashes.append(result)
+			elif not result:
+				infohashes.append(DelugeError("Deluge did not return an infohash for the magnet link"))
+			else:
+				infohashes.append(normalize_infohash(result))
+		return infohashes
+
+	def status(self, infohashes: Iterable[str], keys: List[str] = STATUS_KEYS) -> Dict[str, TorrentInfo]:
+		"""Status of the given torrents in one call; torrents unknown to deluge are left out."""
+		ids = [key for key in map(normalize_infohash, infohashes) if key]
+		if not ids:
+			return {}
+		result = self.call('core.get_torrents_status', {'id': ids}, keys)
+		return {infohash: TorrentInfo(infohash=infohash, **fields) for infohash, fields in result.items()}
+
+	def remove(self, infohash: str, remove_data: bool = False) -> bool:
+		return bool(self.call('core.remove_torrent', normalize_infohash(infohash), remove_data))
+
+	def close(self) -> None:
+		while True:
+			try:
+				client = self._idle.get_nowait()
+			except queue.Empty:
+				return
+			try:
+				client.disconnect()
+			except Exception:  # noqa: BLE001
+				pass
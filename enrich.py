@@ -1,25 +1,44 @@
 import json
 import random
-import re
 import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Iterable
 from urllib.parse import urljoin
 
 import click
 import requests
-from bs4 import BeautifulSoup
 from loguru import logger
 from tqdm import tqdm
 
+from extract import QUALITY_PATTERN, TYPE_PATTERN, MoviePage, extract_movie_page
+from metrics import SIZE_BUCKETS, Registry, TextfileReporter
+
 
 BASE_URL = "https://www.yts-official.top/movies/"
 INPUT_FILE = Path("movies.json")
 OUTPUT_FILE = Path("enriched-movies.json")
+METRICS_FILE = Path("enrich-metrics.prom")
+SUMMARY_FILE = Path("enrich-summary.json")
 REQUEST_TIMEOUT = 20
-
-QUALITY_PATTERN = re.compile(r"\b(2160p|1080p|720p|480p|3D)\b", re.IGNORECASE)
-TYPE_PATTERN = re.compile(r"\b(WEB[\- ]?DL|WEBRIP|WEB|BLURAY|DVDRIP|HDRIP)\b", re.IGNORECASE)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# A server's Retry-After is honoured up to this many ``backoff`` units.
+MAX_RETRY_AFTER_BACKOFFS = 60
+
+METRICS = Registry(prefix="enrich_")
+REQUEST_LATENCY = METRICS.histogram("request_latency_seconds", "Latency of movie page requests, per attempt")
+RESPONSE_BYTES = METRICS.histogram("response_bytes", "Size of movie page responses", SIZE_BUCKETS)
+RESPONSES = METRICS.counter("responses_total", "Movie page responses by HTTP status code", ["code"])
+REQUEST_ERRORS = METRICS.counter("request_errors_total", "Requests that failed without a response", ["reason"])
+RETRIES = METRICS.counter("retries_total", "Requests retried after throttling or a transient error", ["reason"])
+BACKOFF_SECONDS = METRICS.counter("backoff_seconds_total", "Time spent waiting before retries")
+PACING_SECONDS = METRICS.counter("pacing_sleep_seconds_total", "Time spent in the random pause between movies")
+PARSE_TIME = METRICS.histogram("parse_seconds", "Time to extract fields from a movie page")
+WRITE_TIME = METRICS.histogram("write_seconds", "Time to rewrite the output file")
+QUEUE_DEPTH = METRICS.gauge("queue_depth", "Movies still waiting to be enriched")
+MOVIES = METRICS.counter("movies_total", "Movies processed by outcome", ["outcome"])
+THROUGHPUT = METRICS.gauge("movies_per_second", "Enrichment throughput since the run started")
 
 
 def unique_preserve_order(items: Iterable[str]) -> list[str]:
@@ -61,88 +80,84 @@ def normalize_type(text: str | None) -> str | None:
 	return None
 
 
-def text_or_none(node) -> str | None:
-	if not node:
-		return None
-	text = node.get_text(strip=True)
-	return text if text else None
-
-
-def fetch_html(url: str) -> str | None:
+def retry_delay(response: requests.Response | None, attempt: int, backoff: float) -> float:
+	"""Seconds to wait before the next attempt: the server's Retry-After (seconds or an HTTP date), capped, or exponential backoff."""
+	if response is not None:
+		retry_after = response.headers.get("Retry-After", "").strip()
+		delay = None
+		if retry_after.isdigit():
+			delay = float(retry_after)
+		elif retry_after:
+			try:
+				delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+			except (TypeError, ValueError):
+				pass
+		if delay is not None:
+			return min(max(delay, 0.0), backoff * MAX_RETRY_AFTER_BACKOFFS)
+	return backoff * (2 ** attempt)
+
+
+def fetch_html(url: str, retries: int = 0, backoff: float = 1.0) -> str | None:
 	headers = {"User-Agent": "Mozilla/5.0 (compatible; media-request/1.0)"}
-	try:
-		response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-		if response.status_code == 404:
-			logger.warning("Page not found (404): {}", url)
-			return None
-		response.raise_for_status()
-		return response.text
-	except requests.RequestException as exc:
-		logger.error("Failed to fetch {}: {}", url, exc)
-		return None
-
-
-def select_cast(soup: BeautifulSoup) -> list[str]:
-	cast_container = soup.select_one("#crew > div:nth-of-type(2)")
-	if not cast_container:
-		return []
-
-	cast_names = [text_or_none(span) for span in cast_container.select("a span span")]
-	cast = [name for name in cast_names if name]
-	if not cast:
-		cast = [text_or_none(link) for link in cast_container.select("a") if text_or_none(link)]
-	if not cast:
-		cast = [text_or_none(span) for span in cast_container.select("span") if text_or_none(span)]
-
-	return unique_preserve_order(cast)
-
-
-def infer_quality_type(tag) -> tuple[str | None, str | None]:
-	texts = []
-	current = tag
-	for _ in range(5):
-		if not current:
-			break
-		texts.append(" ".join(current.stripped_strings))
-		current = current.parent
-	combined = " ".join(texts)
-	quality = normalize_quality(combined)
-	media_type = normalize_type(combined)
-	return quality, media_type
-
+	for attempt in range(retries + 1):
+		response = None
+		try:
+			with REQUEST_LATENCY.time():
+				response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+			RESPONSES.inc(code=response.status_code)
+			RESPONSE_BYTES.observe(len(response.content))
+			if response.status_code == 404:
+				logger.warning("Page not found (404): {}", url)
+				return None
+			if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+				reason = f"http_{response.status_code}"
+			else:
+				response.raise_for_status()
+				return response.text
+		except requests.RequestException as exc:
+			reason = type(exc).__name__
+			if response is None:
+				REQUEST_ERRORS.inc(reason=reason)
+			if attempt >= retries or (response is not None and response.status_code not in RETRY_STATUS_CODES):
+				logger.error("Failed to fetch {}: {}", url, exc)
+				return None
+
+		delay = retry_delay(response, attempt, backoff)
+		RETRIES.inc(reason=reason)
+		BACKOFF_SECONDS.inc(delay)
+		logger.warning("Retrying {} in {:.1f}s ({})", url, delay, reason)
+		time.sleep(delay)
+	return None
 
-def select_magnet_links(soup: BeautifulSoup) -> list[dict]:
-	container = soup.select_one("#movie-content > div:nth-of-type(1) > div:nth-of-type(3) > div > div:nth-of-type(2)")
-	if not container:
-		container = soup
 
+def select_magnet_links(page: MoviePage) -> list[dict]:
 	magnets: list[dict] = []
 	seen = set()
-	for anchor in container.select("a[href^='magnet:']"):
-		url = anchor.get("href")
-		if not url or url in seen:
+	for context in page.magnet_contexts:
+		if context.url in seen:
 			continue
-		seen.add(url)
-		quality, media_type = infer_quality_type(anchor)
+		seen.add(context.url)
 		magnets.append({
-			"quality": quality,
-			"type": media_type,
-			"url": url,
+			"quality": normalize_quality(context.quality_text),
+			"type": normalize_type(context.type_text),
+			"url": context.url,
 		})
 	return magnets
 
 
-def enrich_movie(movie: dict, base_url: str) -> dict:
+def enrich_movie(movie: dict, base_url: str, retries: int = 0) -> dict:
 	slug = movie.get("slug")
 	if not slug:
 		logger.warning("Movie missing slug: {}", movie.get("title", "<no title>"))
+		MOVIES.inc(outcome="skipped")
 		return movie
 
 	url = urljoin(base_url, f"{slug}/")
 	logger.debug("Fetching movie page: {}", url)
-	html = fetch_html(url)
+	html = fetch_html(url, retries=retries)
 	if not html:
 		logger.warning("Could not fetch HTML for slug: {}", slug)
+		MOVIES.inc(outcome="fetch_failed")
 		movie.update({
 			"imdb_link": None,
 			"synopsis": None,
@@ -152,22 +167,16 @@ def enrich_movie(movie: dict, base_url: str) -> dict:
 		})
 		return movie
 
-	soup = BeautifulSoup(html, "html.parser")
+	with PARSE_TIME.time():
+		page = extract_movie_page(html, magnet_context=True)
 
-	imdb_link = None
-	imdb_anchor = soup.select_one("#movie-info > div:nth-of-type(2) > div:nth-of-type(2) > a")
-	if imdb_anchor and imdb_anchor.get("href"):
-		imdb_link = imdb_anchor.get("href")
-
-	synopsis = text_or_none(soup.select_one("#synopsis > p:nth-of-type(2)"))
-
-	director = text_or_none(
-		soup.select_one("#crew > div:nth-of-type(1) > div > div:nth-of-type(2) > a > span > span")
-	)
-
-	cast = select_cast(soup)
-	magnet_links = select_magnet_links(soup)
+	imdb_link = page.imdb_link
+	synopsis = page.synopsis
+	director = page.director
+	cast = unique_preserve_order(page.cast)
+	magnet_links = select_magnet_links(page)
 
+	MOVIES.inc(outcome="enriched")
 	logger.success("Enriched movie: {} ({})", movie.get("title"), slug)
 	movie.update({
 		"imdb_link": imdb_link,
@@ -180,7 +189,7 @@ def enrich_movie(movie: dict, base_url: str) -> dict:
 
 
 def write_output(items: list[dict], output_path: Path) -> None:
-	with output_path.open("w", encoding="utf-8") as handle:
+	with WRITE_TIME.time(), output_path.open("w", encoding="utf-8") as handle:
 		json.dump(items, handle, indent=2, ensure_ascii=True)
 
 
@@ -205,6 +214,10 @@ def load_existing_output(output_path: Path) -> dict[str, dict]:
 @click.option("--sleep-max", default=0.6, show_default=True)
 @click.option("--limit", default=0, show_default=True, help="Limit number of movies to process")
 @click.option("--start", "start", default=1, show_default=True, help="1-based movie number to start from")
+@click.option("--retries", default=2, show_default=True, help="Retries per page on throttling or transient errors")
+@click.option("--metrics-file", "metrics_file", default=str(METRICS_FILE), show_default=True, help="Prometheus textfile to refresh during the run (empty to disable)")
+@click.option("--metrics-interval", default=5.0, show_default=True, help="Seconds between metrics textfile refreshes")
+@click.option("--summary-file", "summary_file", default=str(SUMMARY_FILE), show_default=True, help="JSON summary written at the end of the run (empty to disable)")
 def enrich_movies(
 	input_file: str,
 	output_file: str,
@@ -213,6 +226,10 @@ def enrich_movies(
 	sleep_max: float,
 	limit: int,
 	start: int,
+	retries: int,
+	metrics_file: str,
+	metrics_interval: float,
+	summary_file: str,
 ) -> None:
 	logger.remove()
 	logger.add(lambda msg: tqdm.write(msg, end=""), colorize=True)
@@ -257,22 +274,43 @@ def enrich_movies(
 	logger.info("Processing {} movies ({} already enriched, {} to enrich)", 
 		len(items), len(items) - len(to_process), len(to_process))
 	
-	with tqdm(total=len(to_process), desc="Enriching movies", unit="movie") as progress:
-		for idx, list_index in enumerate(to_process, start=1):
-			movie = output_list[list_index]
-			logger.info("Processing: {}", movie.get("title", movie.get("slug")))
-			enriched = enrich_movie(movie, base_url)
-			output_list[list_index] = enriched
-			progress.update(1)
-			logger.info("[{}/{}] Completed: {}", idx, len(to_process), enriched.get("title", enriched.get("slug")))
-
-			# Write after each enrichment
-			write_output(output_list, output_path)
-			
-			if sleep_max > 0:
-				pause = random.uniform(max(0.0, sleep_min), max(sleep_min, sleep_max))
-				logger.debug("Sleeping {:.2f} seconds", pause)
-				time.sleep(pause)
+	QUEUE_DEPTH.set(len(to_process))
+	MOVIES.inc(len(items) - len(to_process), outcome="already_enriched")
+	reporter = TextfileReporter(METRICS, Path(metrics_file), metrics_interval).start() if metrics_file else None
+	run_started = time.perf_counter()
+
+	try:
+		with tqdm(total=len(to_process), desc="Enriching movies", unit="movie") as progress:
+			for idx, list_index in enumerate(to_process, start=1):
+				movie = output_list[list_index]
+				logger.info("Processing: {}", movie.get("title", movie.get("slug")))
+				enriched = enrich_movie(movie, base_url, retries=retries)
+				output_list[list_index] = enriched
+				QUEUE_DEPTH.set(len(to_process) - idx)
+				THROUGHPUT.set(idx / max(time.perf_counter() - run_started, 1e-9))
+				progress.update(1)
+				progress.set_postfix(
+					latency=f"{REQUEST_LATENCY.quantile(0.5) or 0:.2f}s",
+					parse=f"{PARSE_TIME.quantile(0.5) or 0:.3f}s",
+					write=f"{WRITE_TIME.quantile(0.5) or 0:.3f}s",
+					retries=int(RETRIES.total()),
+				)
+				logger.info("[{}/{}] Completed: {}", idx, len(to_process), enriched.get("title", enriched.get("slug")))
+
+				# Write after each enrichment
+				write_output(output_list, output_path)
+
+				if sleep_max > 0:
+					pause = random.uniform(max(0.0, sleep_min), max(sleep_min, sleep_max))
+					logger.debug("Sleeping {:.2f} seconds", pause)
+					PACING_SECONDS.inc(pause)
+					time.sleep(pause)
+	finally:
+		if reporter:
+			reporter.stop()
+		if summary_file:
+			METRICS.write_summary(Path(summary_file))
+			logger.info("Wrote run summary to: {}", summary_file)
 
 	logger.success("Successfully wrote {} enriched movies to: {}", len(output_list), output_path)
 
@@ -0,0 +1,508 @@
+"""Single-pass extraction of movie page fields.
+
+Every field of a movie page is described by a ``Rule`` (a small CSS selector
+plus an optional scope). The rules are compiled once into a dispatch table keyed
+by tag name, and a page is then streamed through ``html.parser`` a single time:
+each element is matched against the rules that can apply to it when it opens,
+and its text is recorded as a slice of one shared list of strings. Reading the
+text of a matched element afterwards never walks the document again.
+
+Both ``main.py`` (local httrack mirror) and ``enrich.py`` (live site) go through
+``extract_movie_page`` so the two entry points agree on what a page contains.
+"""
+
+from __future__ import annotations
+
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Sequence
+import re
+
+from pydantic import BaseModel
+
+
+VOID_TAGS = frozenset({
+	"area", "base", "br", "col", "embed", "hr", "img", "input",
+	"link", "meta", "param", "source", "track", "wbr",
+})
+SKIPPED_TEXT_TAGS = frozenset({"script", "style"})
+
+QUALITY_PATTERN = re.compile(r"\b(2160p|1080p|720p|480p|3D)\b", re.IGNORECASE)
+TYPE_PATTERN = re.compile(r"\b(WEB[\- ]?DL|WEBRIP|WEB|BLURAY|DVDRIP|HDRIP)\b", re.IGNORECASE)
+
+# How many levels (the anchor itself included) are searched for the quality and
+# release type of a magnet link that is not inside a download modal.
+MAGNET_CONTEXT_LEVELS = 5
+
+
+class Node:
+	"""An element seen while streaming a page.
+
+	Only the parent link is kept, so closed subtrees are released as soon as no
+	open element or match refers to them.
+	"""
+
+	__slots__ = ("tag", "attrs", "classes", "parent", "nth_of_type", "seq", "text_start", "text_end", "child_counts", "scopes")
+
+	def __init__(self, tag: Optional[str], attrs: Dict[str, str], parent: Optional[Node], seq: int, text_start: int) -> None:
+		self.tag = tag
+		self.attrs = attrs
+		self.classes = frozenset(attrs.get("class", "").split())
+		self.parent = parent
+		self.seq = seq
+		self.text_start = text_start
+		self.text_end: Optional[int] = None
+		self.child_counts: Dict[str, int] = {}
+		self.scopes: Optional[set] = None
+		if parent is not None and tag is not None:
+			count = parent.child_counts.get(tag, 0) + 1
+			parent.child_counts[tag] = count
+			self.nth_of_type = count
+		else:
+			self.nth_of_type = 1
+
+	def get(self, name: str) -> Optional[str]:
+		return self.attrs.get(name)
+
+
+class Compound:
+	"""One compound selector such as ``a.download-torrent[href]``."""
+
+	__slots__ = ("tag", "id", "classes", "attrs", "nth")
+
+	def __init__(self, tag: str, id: Optional[str], classes: frozenset, attrs: tuple, nth: Optional[int]) -> None:
+		self.tag = tag
+		self.id = id
+		self.classes = classes
+		self.attrs = attrs
+		self.nth = nth
+
+	def matches(self, node: Node) -> bool:
+		if node.tag is None:
+			return False
+		if self.tag != "*" and node.tag != self.tag:
+			return False
+		if self.id is not None and node.attrs.get("id") != self.id:
+			return False
+		if self.classes and not self.classes <= node.classes:
+			return False
+		if self.nth is not None and node.nth_of_type != self.nth:
+			return False
+		for name, op, value in self.attrs:
+			actual = node.attrs.get(name)
+			if actual is None:
+				return False
+			if op == "=" and actual != value:
+				return False
+			if op == "^=" and not actual.startswith(value):
+				return False
+			if op == "$=" and not actual.endswith(value):
+				return False
+			if op == "*=" and value not in actual:
+				return False
+		return True
+
+
+SIMPLE_SELECTOR_PATTERN = re.compile(
+	r"(?P<tag>[A-Za-z][\w-]*|\*)"
+	r"|\#(?P<id>[\w-]+)"
+	r"|\.(?P<cls>[\w-]+)"
+	r"|\[(?P<attr>[\w-]+)(?:(?P<op>[\^\$\*]?=)['\"]?(?P<value>[^'\"\]]*)['\"]?)?\]"
+	r"|:nth-of-type\((?P<nth>\d+)\)"
+)
+COMBINATOR_PATTERN = re.compile(r"\s*(>)\s*|\s+")
+
+
+def compile_compound(text: str) -> Compound:
+	tag = "*"
+	id_value = None
+	classes = set()
+	attrs = []
+	nth = None
+	position = 0
+	while position < len(text):
+		match = SIMPLE_SELECTOR_PATTERN.match(text, position)
+		if not match or match.end() == position:
+			raise ValueError(f"Unsupported selector: {text!r}")
+		if match.group("tag"):
+			if position:
+				raise ValueError(f"Tag must come first in selector: {text!r}")
+			tag = match.group("tag").lower()
+		elif match.group("id"):
+			id_value = match.group("id")
+		elif match.group("cls"):
+			classes.add(match.group("cls"))
+		elif match.group("attr"):
+			attrs.append((match.group("attr").lower(), match.group("op"), match.group("value") or ""))
+		else:
+			nth = int(match.group("nth"))
+		position = match.end()
+	return Compound(tag, id_value, frozenset(classes), tuple(attrs), nth)
+
+
+class Selector:
+	"""A compiled selector supporting descendant and child combinators.
+
+	Matching runs right to left from the element being opened, which only needs
+	the chain of open ancestors the streaming parser already keeps.
+	"""
+
+	__slots__ = ("text", "steps")
+
+	def __init__(self, text: str) -> None:
+		self.text = text
+		parts = COMBINATOR_PATTERN.split(text.strip())
+		compounds = [compile_compound(part) for part in parts[0::2]]
+		combinators = [">" if part else " " for part in parts[1::2]]
+		# Steps run right to left; each holds the combinator linking it to the next step.
+		steps = []
+		for index in range(len(compounds) - 1, -1, -1):
+			steps.append((compounds[index], combinators[index - 1] if index else None))
+		self.steps = tuple(steps)
+
+	@property
+	def key_tag(self) -> str:
+		return self.steps[0][0].tag
+
+	def matches(self, node: Node) -> bool:
+		return self._match(node, 0)
+
+	def _match(self, node: Node, index: int) -> bool:
+		compound, combinator = self.steps[index]
+		if not compound.matches(node):
+			return False
+		if combinator is None:
+			return True
+		ancestor = node.parent
+		if combinator == ">":
+			return ancestor is not None and self._match(ancestor, index + 1)
+		while ancestor is not None:
+			if self._match(ancestor, index + 1):
+				return True
+			ancestor = ancestor.parent
+		return False
+
+
+class Rule:
+	"""A named field rule.
+
+	When ``scope`` names another rule, matches are grouped under the nearest
+	enclosing element matched by that rule (e.g. the links inside one download
+	modal).
+	"""
+
+	__slots__ = ("name", "selector", "scope")
+
+	def __init__(self, name: str, selector: str, scope: Optional[str] = None) -> None:
+		self.name = name
+		self.selector = Selector(selector)
+		self.scope = scope
+
+
+class Document:
+	"""Result of one extraction pass: matched nodes per rule plus page text."""
+
+	def __init__(self, texts: List[str], matches: Dict[str, List[Node]], scoped: Dict[str, Dict[int, List[Node]]]) -> None:
+		self.texts = texts
+		self.matches = matches
+		self.scoped = scoped
+		self._strings_cache: Dict[int, str] = {}
+		self._context_cache: Dict[tuple, Optional[str]] = {}
+
+	def first(self, *names: str) -> Optional[Node]:
+		"""First node matched by the first of ``names`` that matched anything."""
+		for name in names:
+			nodes = self.matches.get(name)
+			if nodes:
+				return nodes[0]
+		return None
+
+	def all(self, name: str) -> List[Node]:
+		return self.matches.get(name, [])
+
+	def within(self, name: str, scope_node: Optional[Node]) -> List[Node]:
+		if scope_node is None:
+			return []
+		return self.scoped.get(name, {}).get(scope_node.seq, [])
+
+	def text(self, node: Optional[Node]) -> Optional[str]:
+		"""Equivalent of ``get_text(strip=True)``; None when there is no node."""
+		if node is None:
+			return None
+		return "".join(self.texts[node.text_start:node.text_end])
+
+	def strings(self, node: Node) -> str:
+		"""Equivalent of ``" ".join(node.stripped_strings)``, computed once per node."""
+		cached = self._strings_cache.get(node.seq)
+		if cached is None:
+			cached = " ".join(self.texts[node.text_start:node.text_end])
+			self._strings_cache[node.seq] = cached
+		return cached
+
+	def search_context(self, node: Node, pattern: re.Pattern, levels: int) -> Optional[str]:
+		"""First ``pattern`` match in the text of ``node`` or its nearest ancestors.
+
+		Results are cached per (pattern, ancestor), so sibling nodes sharing a
+		container only scan that container's text once.
+		"""
+		current: Optional[Node] = node
+		for _ in range(levels):
+			if current is None or current.tag is None:
+				break
+			key = (pattern.pattern, current.seq)
+			if key in self._context_cache:
+				found = self._context_cache[key]
+			else:
+				match = pattern.search(self.strings(current))
+				found = match.group(1) if match else None
+				self._context_cache[key] = found
+			if found is not None:
+				return found
+			current = current.parent
+		return None
+
+
+class _Walker(HTMLParser):
+	def __init__(self, extractor: Extractor) -> None:
+		super().__init__(convert_charrefs=True)
+		self.extractor = extractor
+		self.texts: List[str] = []
+		self.root = Node(None, {}, None, 0, 0)
+		self.stack: List[Node] = [self.root]
+		self.seq = 0
+		self.matches: Dict[str, List[Node]] = {}
+		self.scoped: Dict[str, Dict[int, List[Node]]] = {}
+
+	def handle_starttag(self, tag: str, attrs: list) -> None:
+		self.seq += 1
+		node = Node(tag, {name: value or "" for name, value in attrs}, self.stack[-1], self.seq, len(self.texts))
+		for rule in self.extractor.candidates(tag):
+			if not rule.selector.matches(node):
+				continue
+			if rule.scope is None:
+				self.matches.setdefault(rule.name, []).append(node)
+			else:
+				scope_node = self._enclosing_scope(node, rule.scope)
+				if scope_node is not None:
+					self.scoped.setdefault(rule.name, {}).setdefault(scope_node.seq, []).append(node)
+			if rule.name in self.extractor.scope_names:
+				if node.scopes is None:
+					node.scopes = set()
+				node.scopes.add(rule.name)
+		if tag in VOID_TAGS:
+			node.text_end = len(self.texts)
+		else:
+			self.stack.append(node)
+
+	def handle_startendtag(self, tag: str, attrs: list) -> None:
+		self.handle_starttag(tag, attrs)
+		if tag not in VOID_TAGS:
+			self.handle_endtag(tag)
+
+	def handle_endtag(self, tag: str) -> None:
+		for depth in range(len(self.stack) - 1, 0, -1):
+			if self.stack[depth].tag == tag:
+				break
+		else:
+			return
+		end = len(self.texts)
+		while len(self.stack) > depth:
+			self.stack.pop().text_end = end
+
+	def handle_data(self, data: str) -> None:
+		if self.stack[-1].tag in SKIPPED_TEXT_TAGS:
+			return
+		text = data.strip()
+		if text:
+			self.texts.append(text)
+
+	def finish(self) -> Document:
+		self.close()
+		end = len(self.texts)
+		for node in self.stack:
+			node.text_end = end
+		self.stack = [self.root]
+		return Document(self.texts, self.matches, self.scoped)
+
+	@staticmethod
+	def _enclosing_scope(node: Node, scope: str) -> Optional[Node]:
+		current: Optional[Node] = node
+		while current is not None:
+			if current.scopes and scope in current.scopes:
+				return current
+			current = current.parent
+		return None
+
+
+class Extractor:
+	"""A set of rules compiled for single-pass matching."""
+
+	def __init__(self, rules: Sequence[Rule]) -> None:
+		self.rules = tuple(rules)
+		self.scope_names = frozenset(rule.scope for rule in self.rules if rule.scope)
+		self._candidates: Dict[str, tuple] = {}
+
+	def candidates(self, tag: str) -> tuple:
+		cached = self._candidates.get(tag)
+		if cached is None:
+			# Keep declaration order so a scope rule is applied before the rules scoped to it.
+			cached = tuple(rule for rule in self.rules if rule.selector.key_tag in (tag, "*"))
+			self._candidates[tag] = cached
+		return cached
+
+	def run(self, html: str) -> Document:
+		walker = _Walker(self)
+		walker.feed(html)
+		return walker.finish()
+
+
+MAGNET_CONTAINER = "#movie-content > div:nth-of-type(1) > div:nth-of-type(3) > div > div:nth-of-type(2)"
+CREW_CAST_CONTAINER = "#crew > div:nth-of-type(2)"
+
+MOVIE_PAGE_RULES = [
+	Rule("title", "#movie-content h1"),
+	Rule("title_fallback", "h1[itemprop='name']"),
+	Rule("h2", "h2"),
+	Rule("imdb_link", "a[href*='imdb.com/title']"),
+	Rule("imdb_link_fallback", "#movie-info > div:nth-of-type(2) > div:nth-of-type(2) > a"),
+	Rule("rating", "span[itemprop='ratingValue']"),
+	Rule("synopsis", "div#synopsis p.hidden-xs"),
+	Rule("synopsis_second", "#synopsis > p:nth-of-type(2)"),
+	Rule("synopsis_any", "div#synopsis p"),
+	Rule("director", "div.directors span[itemprop='name']"),
+	Rule("director_fallback", "#crew > div:nth-of-type(1) > div > div:nth-of-type(2) > a > span > span"),
+	Rule("cast", "div.actors span[itemprop='name']"),
+	Rule("crew_cast", CREW_CAST_CONTAINER),
+	Rule("crew_cast_names", f"{CREW_CAST_CONTAINER} a span span", scope="crew_cast"),
+	Rule("crew_cast_links", f"{CREW_CAST_CONTAINER} a", scope="crew_cast"),
+	Rule("crew_cast_spans", f"{CREW_CAST_CONTAINER} span", scope="crew_cast"),
+	Rule("poster", "#movie-poster img[itemprop='image']"),
+	Rule("poster_fallback", "#movie-poster img"),
+	Rule("modal", ".modal-torrent"),
+	Rule("modal_quality_span", ".modal-torrent .modal-quality span", scope="modal"),
+	Rule("modal_quality", ".modal-torrent .modal-quality", scope="modal"),
+	Rule("modal_size", ".modal-torrent p.quality-size", scope="modal"),
+	Rule("modal_magnet", ".modal-torrent a[href^='magnet:']", scope="modal"),
+	Rule("modal_torrent", ".modal-torrent a.download-torrent[href]", scope="modal"),
+	Rule("magnet", "a[href^='magnet:']"),
+	Rule("torrent", "a.download-torrent[href]"),
+	Rule("magnet_container", MAGNET_CONTAINER),
+	Rule("container_magnet", f"{MAGNET_CONTAINER} a[href^='magnet:']", scope="magnet_container"),
+]
+
+MOVIE_PAGE_EXTRACTOR = Extractor(MOVIE_PAGE_RULES)
+
+
+class RawDownload(BaseModel):
+	quality_text: Optional[str]
+	type_text: Optional[str]
+	magnet_url: Optional[str]
+	torrent_href: Optional[str]
+
+
+class MagnetContext(BaseModel):
+	url: str
+	quality_text: Optional[str]
+	type_text: Optional[str]
+
+
+class MoviePage(BaseModel):
+	title: Optional[str]
+	year_text: Optional[str]
+	genre_text: Optional[str]
+	imdb_link: Optional[str]
+	rating_text: Optional[str]
+	synopsis: Optional[str]
+	director: Optional[str]
+	cast: List[str]
+	poster_src: Optional[str]
+	downloads: List[RawDownload]
+	magnet_urls: List[str]
+	torrent_hrefs: List[str]
+	magnet_contexts: List[MagnetContext]
+
+
+def non_empty(values: Iterable[Optional[str]]) -> List[str]:
+	return [value for value in values if value]
+
+
+def first_non_empty_text(doc: Document, groups: Iterable[List[Node]]) -> List[str]:
+	for nodes in groups:
+		texts = non_empty(doc.text(node) for node in nodes)
+		if texts:
+			return texts
+	return []
+
+
+def extract_movie_page(html: str, magnet_context: bool = False) -> MoviePage:
+	"""Extract every field of a movie page in one pass over ``html``.
+
+	Values are returned as raw text; callers normalise them into their own
+	models. ``magnet_context`` additionally infers quality and release type for
+	each magnet link from the text around it, which only ``enrich.py`` needs.
+	"""
+	doc = MOVIE_PAGE_EXTRACTOR.run(html)
+
+	title_node = doc.first("title", "title_fallback")
+	headings = doc.all("h2")
+	sibling_headings = []
+	if title_node is not None:
+		sibling_headings = [node for node in headings if node.parent is title_node.parent and node.seq > title_node.seq]
+	year_node = sibling_headings[0] if sibling_headings else (headings[0] if headings else None)
+	genre_node = sibling_headings[1] if len(sibling_headings) > 1 else None
+
+	imdb_node = doc.first("imdb_link", "imdb_link_fallback")
+	synopsis_node = doc.first("synopsis", "synopsis_second", "synopsis_any")
+	director_node = doc.first("director", "director_fallback")
+
+	crew_cast = doc.first("crew_cast")
+	cast = first_non_empty_text(doc, [
+		doc.all("cast"),
+		doc.within("crew_cast_names", crew_cast),
+		doc.within("crew_cast_links", crew_cast),
+		doc.within("crew_cast_spans", crew_cast),
+	])
+
+	poster_node = doc.first("poster", "poster_fallback")
+
+	downloads = []
+	for modal in doc.all("modal"):
+		quality_nodes = doc.within("modal_quality_span", modal) or doc.within("modal_quality", modal)
+		size_nodes = doc.within("modal_size", modal)
+		magnet_nodes = [node for node in doc.within("modal_magnet", modal) if node.get("href")]
+		torrent_nodes = [node for node in doc.within("modal_torrent", modal) if node.get("href")]
+		downloads.append(RawDownload(
+			quality_text=doc.text(quality_nodes[0]) if quality_nodes else None,
+			type_text=doc.text(size_nodes[0]) if size_nodes else None,
+			magnet_url=magnet_nodes[0].get("href") if magnet_nodes else None,
+			torrent_href=torrent_nodes[0].get("href") if torrent_nodes else None,
+		))
+
+	magnet_contexts = []
+	if magnet_context:
+		container = doc.first("magnet_container")
+		anchors = doc.within("container_magnet", container) if container is not None else doc.all("magnet")
+		for anchor in anchors:
+			url = anchor.get("href")
+			if not url:
+				continue
+			magnet_contexts.append(MagnetContext(
+				url=url,
+				quality_text=doc.search_context(anchor, QUALITY_PATTERN, MAGNET_CONTEXT_LEVELS),
+				type_text=doc.search_context(anchor, TYPE_PATTERN, MAGNET_CONTEXT_LEVELS),
+			))
+
+	return MoviePage(
+		title=doc.text(title_node),
+		year_text=doc.text(year_node),
+		genre_text=doc.text(genre_node),
+		imdb_link=(imdb_node.get("href") or None) if imdb_node is not None else None,
+		rating_text=doc.text(doc.first("rating")),
+		synopsis=doc.text(synopsis_node) or None,
+		director=doc.text(director_node) or None,
+		cast=cast,
+		poster_src=(poster_node.get("src") or None) if poster_node is not None else None,
+		downloads=downloads,
+		magnet_urls=non_empty(node.get("href") for node in doc.all("magnet")),
+		torrent_hrefs=non_empty(node.get("href") for node in doc.all("torrent")),
+		magnet_contexts=magnet_contexts,
+	)
@@ -0,0 +1,252 @@
+"""Local stand-in for the Deluge daemon RPC interface this app uses.
+
+Speaks Deluge 2's TLS/rencode protocol (version 1 framing) and implements
+``daemon.login``, ``core.add_torrent_magnet``, ``core.get_torrents_status``
+and ``core.remove_torrent``. Added torrents progress at ``--rate`` percent per
+second so status polling can be exercised. With ``--bandwidth`` they instead
+share that many MB/s equally, like a real link, and take as long as their
+size (the magnet's ``xl``, or 2 GB) needs:
+
+	python fake_deluge.py --port 58846 --rate 5
+	DELUGE_HOST=127.0.0.1 DELUGE_USERNAME=user DELUGE_PASSWORD=pass streamlit run app.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import socketserver
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+
+import click
+from deluge_client.rencode import dumps, loads
+
+from sizes import magnet_size
+from torrent_store import infohash_from_magnet
+
+
+RPC_RESPONSE = 1
+RPC_ERROR = 2
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!BI")
+DEFAULT_SIZE = 2_000_000_000
+
+
+class RPCError(Exception):
+	def __init__(self, kind: str, message: str) -> None:
+		super().__init__(message)
+		self.kind = kind
+
+
+class FakeDaemon:
+	def __init__(self, username: str = "user", password: str = "pass", rate: float = 5.0, latency: float = 0.0, bandwidth: float = 0.0) -> None:
+		self.username = username
+		self.password = password
+		self.rate = rate
+		self.latency = latency
+		# Bytes per second shared by all downloading torrents; 0 uses ``rate`` per torrent.
+		self.bandwidth = bandwidth
+		self.advanced = time.monotonic()
+		self.torrents: Dict[str, dict] = {}
+		self.lock = threading.Lock()
+		self.calls: Dict[str, int] = {}
+		self.logins = 0
+
+	def progress(self, torrent: dict) -> float:
+		if self.bandwidth:
+			return 100.0 * torrent['done'] / torrent['size']
+		return min(100.0, (time.monotonic() - torrent['added']) * self.rate)
+
+	def advance(self) -> None:
+		"""Move shared-bandwidth downloads forward to now (called with the lock held)."""
+		now = time.monotonic()
+		elapsed, self.advanced = now - self.advanced, now
+		while self.bandwidth and elapsed > 0:
+			downloading = [torrent for torrent in self.torrents.values() if torrent['done'] < torrent['size']]
+			if not downloading:
+				return
+			share = self.bandwidth / len(downloading)
+			step = min(elapsed, min(torrent['size'] - torrent['done'] for torrent in downloading) / share)
+			for torrent in downloading:
+				torrent['done'] = min(torrent['size'], torrent['done'] + share * step)
+			elapsed -= step
+
+	def status_of(self, infohash: str, keys) -> dict:
+		torrent = self.torrents[infohash]
+		progress = self.progress(torrent)
+		fields = {
+			'name': torrent['name'],
+			'progress': progress,
+			'state': 'Seeding' if progress >= 100 else 'Downloading',
+			'total_size': torrent['size'],
+			'download_payload_rate': 0 if progress >= 100 else 5_000_000,
+			'eta': 0 if progress >= 100 else int((100 - progress) / self.rate) if self.rate else -1,
+			'download_location': torrent['options'].get('download_location'),
+		}
+		return {key: fields[key] for key in keys if key in fields} if keys else fields
+
+	def dispatch(self, session: dict, method: str, args: tuple, kwargs: dict):
+		with self.lock:
+			self.calls[method] = self.calls.get(method, 0) + 1
+		if self.latency:
+			time.sleep(self.latency)
+		if method == 'daemon.info':
+			return '2.1.1'
+		if method == 'daemon.login':
+			if tuple(args[:2]) != (self.username, self.password):
+				raise RPCError('BadLoginError', 'Username does not exist or password is incorrect')
+			session['authenticated'] = True
+			self.logins += 1
+			return 10
+		if not session.get('authenticated'):
+			raise RPCError('NotAuthorizedError', 'Not authenticated')
+		with self.lock:
+			self.advance()
+			if method == 'core.add_torrent_magnet':
+				uri, options = args[0], (args[1] if len(args) > 1 else {})
+				infohash = infohash_from_magnet(uri)
+				if infohash is None:
+					raise RPCError('InvalidTorrentError', 'Invalid magnet uri')
+				if infohash in self.torrents:
+					raise RPCError('AddTorrentError', f'Torrent already in session ({infohash}).')
+				name = uri.split('dn=')[1].split('&')[0] if 'dn=' in uri else infohash
+				self.torrents[infohash] = {'name': name, 'options': options, 'added': time.monotonic(), 'size': magnet_size(uri) or DEFAULT_SIZE, 'done': 0.0}
+				return infohash
+			if method == 'core.get_torrents_status':
+				filter_dict, keys = args[0] or {}, args[1] if len(args) > 1 else []
+				ids = filter_dict.get('id')
+				ids = [ids] if isinstance(ids, str) else ids
+				wanted = [key for key in (ids if ids is not None else self.torrents) if key in self.torrents]
+				return {infohash: self.status_of(infohash, keys) for infohash in wanted}
+			if method == 'core.get_torrent_status':
+				if args[0] not in self.torrents:
+					return {}
+				return self.status_of(args[0], args[1] if len(args) > 1 else [])
+			if method == 'core.remove_torrent':
+				if args[0] not in self.torrents:
+					raise RPCError('InvalidTorrentError', 'torrent_id not in session')
+				del self.torrents[args[0]]
+				return True
+		raise RPCError('AttributeError', f'RPC method {method} does not exist')
+
+
+def split_messages(buffer: bytes) -> Tuple[list, bytes]:
+	"""Complete version-1 messages in ``buffer`` plus the unconsumed rest.
+
+	Clients probe the daemon with a Deluge 1 message (bare zlib) and a
+	pre-release ``D`` framed one before the real one; both are skipped
+	without a reply, as a Deluge 2 daemon would.
+	"""
+	messages = []
+	while buffer:
+		if buffer[0] == PROTOCOL_VERSION:
+			if len(buffer) < HEADER.size:
+				break
+			_, length = HEADER.unpack_from(buffer)
+			if len(buffer) < HEADER.size + length:
+				break
+			messages.append(buffer[HEADER.size:HEADER.size + length])
+			buffer = buffer[HEADER.size + length:]
+		elif buffer[:1] == b'D':
+			if len(buffer) < 5:
+				break
+			length = struct.unpack('!i', buffer[1:5])[0]
+			if len(buffer) < 5 + length:
+				break
+			buffer = buffer[5 + length:]
+		else:
+			decompressor = zlib.decompressobj()
+			try:
+				decompressor.decompress(buffer)
+			except zlib.error:
+				return messages, b''
+			if not decompressor.eof:
+				break
+			buffer = decompressor.unused_data
+	return messages, buffer
+
+
+def make_handler(daemon: FakeDaemon, context: ssl.SSLContext):
+	class Handler(socketserver.BaseRequestHandler):
+		def _reply(self, connection, message: tuple) -> None:
+			body = zlib.compress(dumps(message))
+			connection.sendall(HEADER.pack(PROTOCOL_VERSION, len(body)) + body)
+
+		def handle(self) -> None:
+			try:
+				connection = context.wrap_socket(self.request, server_side=True)
+			except (ssl.SSLError, OSError):
+				return
+			session: dict = {}
+			buffer = b''
+			while True:
+				try:
+					chunk = connection.recv(65536)
+				except (ssl.SSLError, OSError):
+					return
+				if not chunk:
+					return
+				messages, buffer = split_messages(buffer + chunk)
+				for message in messages:
+					for request_id, method, args, kwargs in loads(zlib.decompress(message), decode_utf8=True):
+						try:
+							result = daemon.dispatch(session, method, tuple(args), dict(kwargs))
+						except RPCError as exc:
+							self._reply(connection, (RPC_ERROR, request_id, exc.kind, (str(exc),), {}, f'{exc.kind}: {exc}'))
+						else:
+							self._reply(connection, (RPC_RESPONSE, request_id, result))
+
+	return Handler
+
+
+def self_signed_context(directory: Path) -> ssl.SSLContext:
+	cert, key = directory / "cert.pem", directory / "key.pem"
+	subprocess.run(
+		["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+		 "-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert)],
+		check=True, capture_output=True,
+	)
+	context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+	context.load_cert_chain(cert, key)
+	return context
+
+
+class Server(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+def serve(daemon: FakeDaemon, host: str = "127.0.0.1", port: int = 0, certificate_dir: Optional[Path] = None) -> Server:
+	"""Start the stand-in on a background thread; ``port=0`` picks a free port."""
+	certificate_dir = certificate_dir or Path(tempfile.mkdtemp(prefix="fake-deluge-"))
+	server = Server((host, port), make_handler(daemon, self_signed_context(certificate_dir)))
+	threading.Thread(target=server.serve_forever, name="fake-deluge", daemon=True).start()
+	return server
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=58846, show_default=True)
+@click.option("--username", default="user", show_default=True)
+@click.option("--password", default="pass", show_default=True)
+@click.option("--rate", default=5.0, show_default=True, help="Download progress in percent per second")
+@click.option("--latency", default=0.0, show_default=True, help="Seconds of delay added to every call")
+@click.option("--bandwidth", default=0.0, show_default=True, help="MB/s shared by all downloads (0: each progresses at --rate)")
+def main(host: str, port: int, username: str, password: str, rate: float, latency: float, bandwidth: float) -> None:
+	server = serve(FakeDaemon(username, password, rate, latency, bandwidth * 1_000_000), host, port)
+	click.echo(f"Fake deluge daemon listening on {host}:{server.server_address[1]}")
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
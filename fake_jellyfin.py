@@ -0,0 +1,264 @@
+"""Local stand-in for the parts of the Jellyfin HTTP API this app uses.
+
+Run it and point ``JELLYFIN_URL`` at it to exercise the library sync without a
+real server:
+
+	python fake_jellyfin.py --movies 5000 --port 8096
+	JELLYFIN_URL=http://127.0.0.1:8096 JELLYFIN_API_KEY=test streamlit run app.py
+
+Movies can be added or changed while it runs with
+``POST /standin/movies`` and a JSON body of ``{"name", "year", "imdb_id"}``.
+
+``POST /standin/files`` with ``{"path", "name", "year", "imdb_id"}`` instead
+drops a file on disk that Jellyfin has not scanned yet: it only shows up
+after ``POST /Library/Media/Updated`` reports a folder containing it (plus
+``--scan-delay`` seconds), or at the next scheduled scan (``--scan-interval``).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import threading
+import time
+import uuid
+
+import click
+
+
+class FakeLibrary:
+	def __init__(self, scan_delay: float = 2.0) -> None:
+		self.items: List[dict] = []
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.scan_delay = scan_delay
+		# Files on disk that no scan has picked up yet.
+		self.unscanned: List[dict] = []
+		self.scans: List[str] = []
+
+	def add(self, name: str, year: Optional[int], item_type: str = "Movie", imdb_id: Optional[str] = None) -> dict:
+		with self.lock:
+			for item in self.items:
+				if item["Type"] == item_type and item["Name"] == name and item["ProductionYear"] == year:
+					break
+			else:
+				item = {
+					"Id": str(uuid.uuid4()),
+					"Name": name,
+					"ProductionYear": year,
+					"Type": item_type,
+					"MediaType": "Video" if item_type in ("Movie", "Episode") else "Unknown",
+				}
+				self.items.append(item)
+			item["ProviderIds"] = {"Imdb": imdb_id} if imdb_id else {}
+			item["DateLastSaved"] = datetime.now(timezone.utc).isoformat()
+			return item
+
+	def drop_file(self, path: str, name: str, year: Optional[int], imdb_id: Optional[str] = None) -> None:
+		with self.lock:
+			self.unscanned.append({"path": path, "name": name, "year": year, "imdb_id": imdb_id})
+
+	def scan(self, folder: str = "/") -> int:
+		"""Turn the unscanned files under ``folder`` into items; returns how many."""
+		prefix = folder.rstrip("/") + "/"
+		with self.lock:
+			found = [file for file in self.unscanned if file["path"].startswith(prefix) or file["path"] == folder]
+			self.unscanned = [file for file in self.unscanned if file not in found]
+			self.scans.append(folder)
+		for file in found:
+			self.add(file["name"], file["year"], imdb_id=file["imdb_id"])
+		return len(found)
+
+	def media_updated(self, paths: List[str]) -> None:
+		"""Scan the reported paths after ``scan_delay``, as Jellyfin's library monitor does."""
+		for path in paths:
+			timer = threading.Timer(self.scan_delay, self.scan, (path,))
+			timer.daemon = True
+			timer.start()
+
+	def remove(self, item_id: str) -> bool:
+		with self.lock:
+			before = len(self.items)
+			self.items = [item for item in self.items if item["Id"] != item_id]
+			return len(self.items) != before
+
+	def seed(self, movies: int, others: int) -> None:
+		rng = random.Random(0)
+		words = "dark knight matrix love story war peace alien star life night city blue red last first king queen".split()
+		for number in range(movies):
+			name = " ".join(rng.sample(words, 2)).title() + f" {number}"
+			self.add(name, rng.randint(1950, 2025), imdb_id=f"tt{1000000 + number}")
+		for number in range(others):
+			self.add(f"Episode {number}", rng.randint(1990, 2025), item_type=rng.choice(["Episode", "Series", "Season", "Folder"]))
+
+
+def render_item(item: dict, fields: set, images: bool, user_data: bool) -> dict:
+	"""Shape an item like BaseItemDto, including the bulky parts unless disabled."""
+	rendered = {key: value for key, value in item.items() if key not in ("ProviderIds", "DateLastSaved")}
+	rendered["ServerId"] = "standin"
+	rendered["IsFolder"] = item["Type"] not in ("Movie", "Episode")
+	if "ProviderIds" in fields:
+		rendered["ProviderIds"] = item["ProviderIds"]
+	if images:
+		tag = uuid.uuid5(uuid.NAMESPACE_OID, item["Id"]).hex
+		rendered["ImageTags"] = {"Primary": tag, "Logo": tag, "Thumb": tag}
+		rendered["BackdropImageTags"] = [tag]
+		rendered["ImageBlurHashes"] = {"Primary": {tag: "dF98I{?txVx[.QtQMyV[IVM|ICM|IBV[tQof8yRQx[of"}}
+	if user_data:
+		rendered["UserData"] = {"PlaybackPositionTicks": 0, "PlayCount": 0, "IsFavorite": False, "Played": False, "Key": item["Id"]}
+	return rendered
+
+
+def query_list(query: Dict[str, List[str]], name: str) -> List[str]:
+	values: List[str] = []
+	for raw in query.get(name, []):
+		values.extend(part for part in raw.split(",") if part)
+	return values
+
+
+def query_flag(query: Dict[str, List[str]], name: str, default: bool = True) -> bool:
+	values = query.get(name)
+	return default if not values else values[0].lower() == "true"
+
+
+def make_handler(library: FakeLibrary, api_key: Optional[str], latency: float):
+	class Handler(BaseHTTPRequestHandler):
+		def log_message(self, format, *args):  # noqa: A002
+			pass
+
+		def _send(self, status: int, payload: object) -> None:
+			body = json.dumps(payload).encode()
+			self.send_response(status)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def _authorized(self) -> bool:
+			if not api_key:
+				return True
+			header = self.headers.get("Authorization", "") + self.headers.get("X-Emby-Token", "")
+			return api_key in header
+
+		def _items(self, query: Dict[str, List[str]]) -> dict:
+			types = {value.lower() for value in query_list(query, "includeItemTypes")}
+			ids = set(query_list(query, "ids"))
+			fields = set(query_list(query, "fields"))
+			years = {int(year) for year in query_list(query, "years")}
+			search = query.get("searchTerm", [""])[0].lower()
+			since = query.get("minDateLastSaved", [None])[0]
+			with library.lock:
+				items = list(library.items)
+			if types:
+				items = [item for item in items if item["Type"].lower() in types]
+			if ids:
+				items = [item for item in items if item["Id"] in ids]
+			if years:
+				items = [item for item in items if item["ProductionYear"] in years]
+			if search:
+				items = [item for item in items if search in item["Name"].lower()]
+			if since:
+				threshold = datetime.fromisoformat(since.replace("Z", "+00:00"))
+				if threshold.tzinfo is None:
+					threshold = threshold.replace(tzinfo=timezone.utc)
+				items = [item for item in items if datetime.fromisoformat(item["DateLastSaved"]) >= threshold]
+			total = len(items)
+			start = int(query.get("startIndex", ["0"])[0])
+			limit = query.get("limit", [None])[0]
+			items = items[start:start + int(limit)] if limit is not None else items[start:]
+			images = query_flag(query, "enableImages")
+			user_data = query_flag(query, "enableUserData")
+			return {
+				"Items": [render_item(item, fields, images, user_data) for item in items],
+				"TotalRecordCount": total,
+				"StartIndex": start,
+			}
+
+		def do_GET(self) -> None:  # noqa: N802
+			library.requests += 1
+			if latency:
+				time.sleep(latency)
+			if not self._authorized():
+				self._send(401, {"error": "unauthorized"})
+				return
+			url = urlparse(self.path)
+			query = parse_qs(url.query)
+			if url.path.rstrip("/").lower() == "/items":
+				self._send(200, self._items(query))
+			elif url.path.lower().startswith("/system/info"):
+				self._send(200, {"ServerName": "standin", "Version": "10.10.0", "Id": "standin"})
+			else:
+				self._send(404, {"error": "not found"})
+
+		def do_POST(self) -> None:  # noqa: N802
+			library.requests += 1
+			url = urlparse(self.path)
+			length = int(self.headers.get("Content-Length") or 0)
+			body = json.loads(self.rfile.read(length) or b"{}")
+			if url.path == "/standin/movies":
+				item = library.add(body["name"], body.get("year"), imdb_id=body.get("imdb_id"))
+				self._send(200, item)
+			elif url.path == "/standin/files":
+				library.drop_file(body["path"], body["name"], body.get("year"), body.get("imdb_id"))
+				self._send(200, {"unscanned": len(library.unscanned)})
+			elif not self._authorized():
+				self._send(401, {"error": "unauthorized"})
+			elif url.path.lower() == "/library/media/updated":
+				library.media_updated([update["Path"] for update in body.get("Updates") or [] if update.get("Path")])
+				self.send_response(204)
+				self.end_headers()
+			else:
+				self._send(404, {"error": "not found"})
+
+		def do_DELETE(self) -> None:  # noqa: N802
+			library.requests += 1
+			url = urlparse(self.path)
+			if url.path.startswith("/standin/movies/"):
+				removed = library.remove(url.path.rsplit("/", 1)[-1])
+				self._send(200 if removed else 404, {"removed": removed})
+			else:
+				self._send(404, {"error": "not found"})
+
+	return Handler
+
+
+def serve(library: FakeLibrary, host: str = "127.0.0.1", port: int = 0, api_key: Optional[str] = None, latency: float = 0.0, scan_interval: Optional[float] = None) -> ThreadingHTTPServer:
+	"""Start the stand-in on a background thread; ``port=0`` picks a free port."""
+	server = ThreadingHTTPServer((host, port), make_handler(library, api_key, latency))
+	threading.Thread(target=server.serve_forever, name="fake-jellyfin", daemon=True).start()
+	if scan_interval:
+		def scheduled_scans() -> None:
+			while True:
+				time.sleep(scan_interval)
+				library.scan()
+		threading.Thread(target=scheduled_scans, name="fake-jellyfin-scans", daemon=True).start()
+	return server
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8096, show_default=True)
+@click.option("--movies", default=1000, show_default=True, help="Synthetic movies to seed")
+@click.option("--others", default=0, show_default=True, help="Synthetic non-movie items (episodes, folders) to seed")
+@click.option("--api-key", default="", help="Require this API key (any key is accepted when empty)")
+@click.option("--latency", default=0.0, show_default=True, help="Seconds of delay added to every GET")
+@click.option("--scan-delay", default=2.0, show_default=True, help="Seconds a reported folder takes to scan")
+@click.option("--scan-interval", default=3600.0, show_default=True, help="Seconds between scheduled full scans")
+def main(host: str, port: int, movies: int, others: int, api_key: str, latency: float, scan_delay: float, scan_interval: float) -> None:
+	library = FakeLibrary(scan_delay)
+	library.seed(movies, others)
+	server = serve(library, host, port, api_key or None, latency, scan_interval)
+	click.echo(f"Fake Jellyfin serving {len(library.items)} items on http://{host}:{server.server_address[1]}")
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
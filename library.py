@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import json
+import os
+import re
+import threading
+import time
+
+from loguru import logger
+
+from metrics import write_atomic
+from search import fold
+
+
+IMDB_ID_PATTERN = re.compile(r"\b(tt\d{5,})\b")
+# Release years often differ by one between yts and Jellyfin's metadata providers.
+YEAR_TOLERANCE = 1
+
+MIRROR_FILE = Path("jellyfin_library.json")
+SYNC_INTERVAL = float(os.getenv("JELLYFIN_SYNC_INTERVAL", "300"))
+# Delta queries cannot see deletions, so the mirror is rebuilt from scratch this often.
+FULL_SYNC_INTERVAL = timedelta(hours=24)
+# Delta queries reach back a little before the last sync to absorb clock skew.
+SYNC_OVERLAP = timedelta(minutes=5)
+# Full refreshes are fetched in pages of this many movies, this many pages at a time.
+FETCH_PAGE_SIZE = 500
+FETCH_WORKERS = 4
+# Where finished downloads land, as Jellyfin sees the folder.
+MOVIES_PATH = os.getenv("JELLYFIN_MOVIES_PATH", "/8tb_hdd/Movies")
+# After reporting new media, look the movies up after 1, 2, 4... seconds, for at most this long.
+LOOKUP_TIMEOUT = 120.0
+
+
+def imdb_id_from(text: Optional[str]) -> Optional[str]:
+	"""Extract an IMDb title id (``tt0133093``) from an id or an IMDb URL."""
+	if not text:
+		return None
+	match = IMDB_ID_PATTERN.search(text)
+	return match.group(1) if match else None
+
+
+def normalize_title(title: Optional[str]) -> str:
+	return " ".join(fold(title or "").split())
+
+
+class LibraryIndex:
+	"""Hashed lookups over the movies in the Jellyfin library.
+
+	Built once per library refresh. A movie is in the library when its IMDb id
+	is known to Jellyfin, or when its normalised title matches an item of the
+	same year (falling back to neighbouring years).
+	"""
+
+	def __init__(self, items: Iterable[dict]) -> None:
+		self.by_title_year: Set[Tuple[str, int]] = set()
+		self.by_imdb_id: Dict[str, dict] = {}
+		self.size = 0
+		for item in items:
+			self.add(item)
+
+	def extended(self, items: Iterable[dict]) -> LibraryIndex:
+		"""A copy with ``items`` added; the index itself is never changed once published."""
+		index = LibraryIndex(())
+		index.by_title_year = set(self.by_title_year)
+		index.by_imdb_id = dict(self.by_imdb_id)
+		index.size = self.size
+		for item in items:
+			index.add(item)
+		return index
+
+	def add(self, item: dict) -> None:
+		self.size += 1
+		title = normalize_title(item.get('name'))
+		if title and item.get('year'):
+			self.by_title_year.add((title, int(item['year'])))
+		imdb_id = imdb_id_from(item.get('imdb_id'))
+		if imdb_id:
+			self.by_imdb_id[imdb_id] = item
+
+	def contains(self, title: str, year: Optional[int], imdb_link: Optional[str] = None, year_tolerance: int = YEAR_TOLERANCE) -> bool:
+		imdb_id = imdb_id_from(imdb_link)
+		if imdb_id and imdb_id in self.by_imdb_id:
+			return True
+		key = normalize_title(title)
+		if not key or not year:
+			return False
+		year = int(year)
+		if (key, year) in self.by_title_year:
+			return True
+		return any(
+			(key, year + offset) in self.by_title_year or (key, year - offset) in self.by_title_year
+			for offset in range(1, year_tolerance + 1)
+		)
+
+
+def connect_jellyfin():
+	"""Create a Jellyfin API client from the environment, or None when unavailable."""
+	url = os.getenv("JELLYFIN_URL")
+	api_key = os.getenv("JELLYFIN_API_KEY")
+	if not url or not api_key:
+		return None
+	try:
+		import jellyfin
+	except ImportError:
+		return None
+	return jellyfin.api(url, api_key)
+
+
+def query_movies(api, **params) -> dict:
+	"""Movies matching ``params`` as the raw ``/Items`` JSON, with only the fields we use.
+
+	Filtering to movies happens on the server, images and user data are left
+	out of the payload, and the response is read as plain JSON rather than
+	being validated into ``BaseItemDto`` models.
+	"""
+	from jellyfin.generated.api_10_10.models.base_item_kind import BaseItemKind
+	from jellyfin.generated.api_10_10.models.item_fields import ItemFields
+
+	response = api.items.items_api.get_items_without_preload_content(
+		recursive=True,
+		include_item_types=[BaseItemKind.MOVIE],
+		fields=[ItemFields.PROVIDERIDS],
+		enable_images=False,
+		enable_user_data=False,
+		image_type_limit=0,
+		**params,
+	)
+	if response.status >= 400:
+		raise RuntimeError(f"Jellyfin returned HTTP {response.status} for /Items")
+	return json.loads(response.data)
+
+
+def fetch_movie_page(api, start: int, limit: int, since: Optional[datetime] = None, count: bool = False) -> dict:
+	"""One page of movies, optionally only those saved since ``since``."""
+	from jellyfin.generated.api_10_10.models.item_sort_by import ItemSortBy
+
+	return query_movies(
+		api,
+		enable_total_record_count=count,
+		min_date_last_saved=since,
+		# A fixed order keeps concurrently fetched pages from overlapping.
+		sort_by=[ItemSortBy.SORTNAME],
+		start_index=start,
+		limit=limit,
+	)
+
+
+def movie_from(item: dict) -> dict:
+	return {
+		'id': item['Id'],
+		'name': item.get('Name'),
+		'year': item.get('ProductionYear'),
+		'imdb_id': (item.get('ProviderIds') or {}).get('Imdb'),
+	}
+
+
+def fetch_movies(api, since: Optional[datetime] = None, page_size: int = FETCH_PAGE_SIZE, workers: int = FETCH_WORKERS) -> List[dict]:
+	"""Movies in the library, optionally only those saved since ``since``.
+
+	The first page also returns the total count; the remaining pages are then
+	fetched concurrently by at most ``workers`` threads.
+	"""
+	first = fetch_movie_page(api, 0, page_size, since, count=True)
+	pages = [first]
+	starts = range(page_size, first.get('TotalRecordCount') or 0, page_size)
+	if starts:
+		with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jellyfin-fetch") as pool:
+			pages.extend(pool.map(lambda start: fetch_movie_page(api, start, page_size, since), starts))
+	return [movie_from(item) for page in pages for item in page.get('Items') or []]
+
+
+def find_movies(api, title: str, year: Optional[int]) -> List[dict]:
+	"""Library movies found by a title search, limited to years close to ``year``."""
+	years = list(range(int(year) - YEAR_TOLERANCE, int(year) + YEAR_TOLERANCE + 1)) if year else None
+	page = query_movies(api, search_term=title, years=years, enable_total_record_count=False)
+	return [movie_from(item) for item in page.get('Items') or []]
+
+
+def report_new_media(api, paths: Iterable[str]) -> None:
+	"""Tell Jellyfin files appeared under ``paths`` (``POST /Library/Media/Updated``), so it scans only there."""
+	generated = api.generated
+	updates = [generated.MediaUpdateInfoPathDto(path=path, update_type="Created") for path in paths]
+	response = generated.LibraryApi(api.client).post_updated_media_without_preload_content(generated.MediaUpdateInfoDto(updates=updates))
+	if response.status >= 400:
+		raise RuntimeError(f"Jellyfin returned HTTP {response.status} for /Library/Media/Updated")
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+	return datetime.fromisoformat(value) if value else None
+
+
+class LibraryMirror:
+	"""Local copy of the Jellyfin movie library, persisted as JSON.
+
+	The first sync seeds it with a full fetch. Later syncs only ask Jellyfin for
+	items saved since the previous sync, with a periodic full fetch to drop
+	deleted items.
+	"""
+
+	def __init__(self, path: Path = MIRROR_FILE) -> None:
+		self.path = path
+		self.items: Dict[str, dict] = {}
+		self.synced_at: Optional[datetime] = None
+		self.full_synced_at: Optional[datetime] = None
+
+	def load(self) -> LibraryMirror:
+		if not self.path.exists():
+			return self
+		try:
+			with self.path.open('r', encoding='utf-8') as handle:
+				state = json.load(handle)
+			self.items = {item['id']: item for item in state.get('items', [])}
+			self.synced_at = parse_timestamp(state.get('synced_at'))
+			self.full_synced_at = parse_timestamp(state.get('full_synced_at'))
+		except (json.JSONDecodeError, KeyError, ValueError, OSError) as exc:
+			logger.warning("Ignoring unreadable Jellyfin mirror {}: {}", self.path, exc)
+		return self
+
+	def save(self) -> None:
+		state = {
+			'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+			'full_synced_at': self.full_synced_at.isoformat() if self.full_synced_at else None,
+			'items': list(self.items.values()),
+		}
+		write_atomic(self.path, json.dumps(state))
+
+	def needs_full_sync(self, now: datetime) -> bool:
+		return self.full_synced_at is None or now - self.full_synced_at >= FULL_SYNC_INTERVAL
+
+	def sync(self, api, fetch: Callable = fetch_movies) -> int:
+		"""Bring the mirror up to date; returns the number of items fetched."""
+		now = datetime.now(timezone.utc)
+		if self.needs_full_sync(now):
+			movies = fetch(api)
+			self.items = {movie['id']: movie for movie in movies}
+			self.full_synced_at = now
+		else:
+			movies = fetch(api, since=self.synced_at - SYNC_OVERLAP)
+			for movie in movies:
+				self.items[movie['id']] = movie
+		self.synced_at = now
+		self.save()
+		return len(movies)
+
+	def add(self, movies: Iterable[dict]) -> None:
+		for movie in movies:
+			self.items[movie['id']] = movie
+		self.save()
+
+	def index(self) -> LibraryIndex:
+		return LibraryIndex(self.items.values())
+
+
+class LibrarySync:
+	"""Keeps a ``LibraryMirror`` fresh from a background thread.
+
+	Readers use ``index``, which always holds the index of the last completed
+	sync (loaded from disk at startup), so they never wait on Jellyfin.
+
+	``movies_completed`` is called when downloads finish. The thread then
+	reports the movies folder to Jellyfin, so it scans just that folder, and
+	looks the new movies up until they appear. The scheduled sync does not
+	have to run first, and keeps its schedule while lookups are pending.
+
+	Without a Jellyfin connection it only reloads the mirror file when
+	another process has rewritten it.
+	"""
+
+	_shared: Dict[Path, LibrarySync] = {}
+	_shared_lock = threading.Lock()
+
+	def __init__(self, mirror: LibraryMirror, connect: Callable = connect_jellyfin, interval: float = SYNC_INTERVAL) -> None:
+		self.mirror = mirror
+		self.connect = connect
+		self.interval = interval
+		self.index = mirror.index()
+		self._mirror_mtime = self._mirror_version()
+		self.last_error: Optional[str] = None
+		self._api = None
+		# ``(title, year)`` of finished downloads not yet found in the library.
+		self._completed: List[Tuple[str, Optional[int]]] = []
+		self._completed_lock = threading.Lock()
+		# Guards the mirror and index, which syncs and lookups both update.
+		self._update_lock = threading.Lock()
+		self._wake = threading.Event()
+		self._refresh = threading.Event()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="jellyfin-sync", daemon=True)
+
+	@classmethod
+	def shared(cls, path: Path = MIRROR_FILE, **kwargs) -> LibrarySync:
+		"""One running sync per mirror file and process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			sync = cls._shared.get(path)
+			if sync is None:
+				sync = cls(LibraryMirror(path).load(), **kwargs).start()
+				cls._shared[path] = sync
+			return sync
+
+	def start(self) -> LibrarySync:
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		self._wake.set()
+		self._thread.join()
+
+	def refresh_now(self) -> None:
+		"""Ask the background thread to sync without waiting for the interval."""
+		self._refresh.set()
+		self._wake.set()
+
+	def movies_completed(self, torrents: Iterable) -> None:
+		"""Have the background thread bring finished downloads (``title``, ``year``) into the index."""
+		with self._completed_lock:
+			self._completed.extend((torrent.title, torrent.year) for torrent in torrents if torrent.title)
+		self._wake.set()
+
+	def _api_client(self):
+		if self._api is None:
+			self._api = self.connect()
+		return self._api
+
+	def _mirror_version(self) -> Optional[int]:
+		try:
+			return self.mirror.path.stat().st_mtime_ns
+		except OSError:
+			return None
+
+	def follow_mirror(self) -> None:
+		"""Reload the mirror file if another process has rewritten it."""
+		version = self._mirror_version()
+		if version is None or version == self._mirror_mtime:
+			return
+		self._mirror_mtime = version
+		with self._update_lock:
+			self.mirror.load()
+			self.index = self.mirror.index()
+
+	def sync_once(self) -> None:
+		try:
+			if self._api_client() is None:
+				self.follow_mirror()
+				return
+			with self._update_lock:
+				fetched = self.mirror.sync(self._api)
+				self.index = self.mirror.index()
+			self.last_error = None
+			logger.debug("Jellyfin sync fetched {} items, mirror has {}", fetched, len(self.mirror.items))
+		except Exception as exc:  # noqa: BLE001
+			self.last_error = str(exc)
+			logger.warning("Jellyfin sync failed: {}", exc)
+
+	def find_completed(self, timeout: float = LOOKUP_TIMEOUT) -> int:
+		"""Report new media to Jellyfin and look up the finished downloads; returns how many were found.
+
+		Movies still missing after ``timeout`` are left to the scheduled sync.
+		"""
+		with self._completed_lock:
+			wanted, self._completed = self._completed, []
+		if not wanted or self._api_client() is None:
+			return 0
+		started = time.monotonic()
+		delay = 1.0
+		found = 0
+		try:
+			report_new_media(self._api, [MOVIES_PATH])
+			while wanted and not self._stop.is_set():
+				missing = []
+				for title, year in wanted:
+					movies = find_movies(self._api, title, year)
+					if LibraryIndex(movies).contains(title, year):
+						with self._update_lock:
+							self.mirror.add(movies)
+							self.index = self.index.extended(movies)
+						found += 1
+						logger.info("{} ({}) is in the library {:.1f}s after it finished downloading", title, year, time.monotonic() - started)
+					else:
+						missing.append((title, year))
+				wanted = missing
+				if wanted and time.monotonic() - started + delay > timeout:
+					logger.info("Not in the library yet, leaving to the next sync: {}", ", ".join(f"{title} ({year})" for title, year in wanted))
+					break
+				if wanted:
+					self._stop.wait(delay)
+					delay *= 2
+		except Exception as exc:  # noqa: BLE001
+			self.last_error = str(exc)
+			logger.warning("Jellyfin lookup of finished downloads failed: {}", exc)
+		return found
+
+	def _run(self) -> None:
+		next_sync = time.monotonic()
+		while not self._stop.is_set():
+			self._wake.clear()
+			# Lookups of finished downloads run between syncs, never in place of one.
+			if self._refresh.is_set() or time.monotonic() >= next_sync:
+				self._refresh.clear()
+				self.sync_once()
+				next_sync = time.monotonic() + self.interval
+			if self._completed:
+				self.find_completed()
+			self._wake.wait(max(0.0, next_sync - time.monotonic()))
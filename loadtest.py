@@ -0,0 +1,424 @@
+"""Measure how the Streamlit page holds up under many concurrent users.
+
+Builds a synthetic catalog of the requested size in a scratch directory,
+starts the Jellyfin and Deluge stand-ins and a Streamlit server on app.py
+there, then opens one websocket session per simulated user, the way a
+browser tab does. Every user is logged in through a session cookie and
+keeps searching, filtering, paging and now and then requesting a movie, with
+some think time between actions, until the run is over:
+
+	python loadtest.py --movies 100000 --users 20 --duration 60
+
+It reports rerun latency percentiles per action, how often an action was
+skipped or showed no movies, and the server's CPU and memory use, so
+capacity can be compared between changes. Live card
+fragments (``run_every``) are not polled by the simulated tabs.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import jwt
+import numpy as np
+import yaml
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+import fake_deluge
+import fake_jellyfin
+from main import Quality, ReleaseType
+from prewarm import run_session, wait_until_healthy
+
+
+APP = Path(__file__).resolve().parent / "app.py"
+WORDS = (
+	"dark knight matrix love story war peace alien star life night city blue red last first king queen "
+	"ghost river storm iron golden silent lost hidden wild secret broken winter summer shadow heart road"
+).split()
+GENRES = (
+	"Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family",
+	"Fantasy", "Horror", "Music", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western",
+)
+# Stand-in hash; the harness logs in with cookies, never with a password.
+UNUSABLE_PASSWORD = "$2b$12$" + "." * 53
+WIDGET_TYPES = ("button", "text_input", "multiselect")
+ACTIONS = ("load", "search", "page", "filter", "request")
+NO_RESULTS = "**No movies found**"
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_catalog(movies: int, seed: int = 0) -> dict:
+	"""An ``out.json`` payload with ``movies`` made-up entries, shaped like main.py's output."""
+	rng = random.Random(seed)
+	qualities = [quality.value for quality in Quality if quality is not Quality.P3D]
+	types = [release.value for release in ReleaseType if release is not ReleaseType.UNKNOWN]
+	# Roughly one person per two movies, as in the scraped catalog; a few are very prolific.
+	people = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son {number}" for number in range(max(100, movies // 2))]
+	prolific = people[:len(people) // 100]
+	media = []
+	for number in range(movies):
+		links = [
+			{'quality': quality, 'type': rng.choice(types), 'url': f"magnet:?xt=urn:btih:{rng.getrandbits(160):040x}&dn=movie-{number}"}
+			for quality in rng.sample(qualities, rng.randint(1, len(qualities)))
+		]
+		media.append({
+			'slug': f"movie-{number}",
+			'title': " ".join(rng.sample(WORDS, rng.randint(1, 3))).title() + f" {number}",
+			'year': rng.randint(1950, 2025),
+			'genres': rng.sample(GENRES, rng.randint(1, 3)),
+			'imdb_link': f"https://www.imdb.com/title/tt{1000000 + number}/",
+			'imdb_rating': round(rng.uniform(1.0, 9.5), 1) if rng.random() < 0.9 else None,
+			'synopsis': " ".join(rng.choices(WORDS, k=40)),
+			'director': rng.choice(prolific if rng.random() < 0.1 else people),
+			'cast': [rng.choice(prolific if rng.random() < 0.1 else people) for _ in range(4)],
+			'poster': None,
+			'magnet_links': links,
+			'torrent_files': [],
+		})
+	return {
+		'supported_qualities': [quality.value for quality in Quality],
+		'supported_types': [release.value for release in ReleaseType],
+		'seen_qualities': sorted(qualities),
+		'seen_types': sorted(types),
+		'media': media,
+	}
+
+
+def write_config(directory: Path, users: int) -> dict:
+	config = {
+		'cookie': {'name': "loadtest_auth", 'key': secrets.token_hex(16), 'expiry_days': 1},
+		'credentials': {'usernames': {
+			f"user{number}": {'email': f"user{number}@loadtest.invalid", 'name': f"Load test user {number}", 'password': UNUSABLE_PASSWORD}
+			for number in range(users)
+		}},
+	}
+	with (directory / "config.yaml").open("w") as file:
+		yaml.safe_dump(config, file)
+	return config
+
+
+def session_cookie(config: dict, username: str) -> str:
+	"""The re-authentication cookie streamlit-authenticator would have set after a login."""
+	token = jwt.encode({'username': username, 'exp_date': time.time() + 86400}, config['cookie']['key'], algorithm="HS256")
+	return f"{config['cookie']['name']}={token}"
+
+
+def free_port() -> int:
+	with socket.socket() as probe:
+		probe.bind(("127.0.0.1", 0))
+		return probe.getsockname()[1]
+
+
+def process_usage(pid: int) -> Tuple[float, int]:
+	"""CPU seconds used so far and resident memory in bytes of ``pid``, from /proc."""
+	with open(f"/proc/{pid}/stat") as handle:
+		fields = handle.read().rsplit(")", 1)[1].split()
+	cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+	with open(f"/proc/{pid}/statm") as handle:
+		rss = int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	return cpu, rss
+
+
+class Widget(NamedTuple):
+	id: str
+	fragment_id: str
+	disabled: bool
+	options: Tuple[str, ...]
+
+
+class UserSession:
+	"""One simulated browser tab on the app's websocket."""
+
+	def __init__(self, base_url: str, cookie: str, timeout: float) -> None:
+		self.base_url = base_url
+		self.cookie = cookie
+		self.timeout = timeout
+		self.connection = None
+		# Latest widget for each label, and the widgets drawn by the last run.
+		self.widgets: Dict[str, Widget] = {}
+		self.last_run: Dict[str, List[Widget]] = {}
+		# Whether the last run showed no movies at all.
+		self.found_nothing = False
+		self.errors = 0
+
+	async def connect(self) -> None:
+		request = HTTPRequest(
+			self.base_url.replace("http", "ws", 1) + "/_stcore/stream",
+			headers={"Sec-WebSocket-Protocol": "streamlit", "Cookie": self.cookie},
+			request_timeout=self.timeout,
+		)
+		self.connection = await websocket_connect(request)
+
+	def close(self) -> None:
+		if self.connection is not None:
+			self.connection.close()
+
+	async def rerun(self, widget: Optional[Widget] = None, text: Optional[str] = None, selected: Optional[List[str]] = None) -> float:
+		"""Change or click ``widget`` (or just rerun) and return the seconds until the script finished."""
+		message = BackMsg()
+		message.rerun_script.query_string = ""
+		message.rerun_script.page_script_hash = ""
+		if widget is not None:
+			state = message.rerun_script.widget_states.widgets.add()
+			state.id = widget.id
+			if text is not None:
+				state.string_value = text
+			elif selected is not None:
+				state.string_array_value.data.extend(selected)
+			else:
+				state.trigger_value = True
+				message.rerun_script.fragment_id = widget.fragment_id
+		started = time.perf_counter()
+		await self.connection.write_message(message.SerializeToString(), binary=True)
+		self.last_run = {}
+		self.found_nothing = False
+		while True:
+			raw = await asyncio.wait_for(self.connection.read_message(), self.timeout)
+			if raw is None:
+				raise ConnectionError("Streamlit closed the session")
+			reply = ForwardMsg()
+			reply.ParseFromString(raw)
+			kind = reply.WhichOneof("type")
+			if kind == "delta":
+				self._collect(reply)
+			# A callback's st.rerun() ends the run early and starts the next one.
+			elif kind == "script_finished" and reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+				return time.perf_counter() - started
+
+	def _collect(self, reply: ForwardMsg) -> None:
+		element = reply.delta.new_element
+		kind = element.WhichOneof("type")
+		if kind == "exception":
+			self.errors += 1
+		elif kind == "markdown" and element.markdown.body == NO_RESULTS:
+			self.found_nothing = True
+		if kind not in WIDGET_TYPES:
+			return
+		proto = getattr(element, kind)
+		widget = Widget(proto.id, reply.delta.fragment_id, proto.disabled, tuple(getattr(proto, "options", ())))
+		self.widgets[proto.label] = widget
+		self.last_run.setdefault(proto.label, []).append(widget)
+
+	def buttons(self, label: str) -> List[Widget]:
+		return [widget for widget in self.last_run.get(label, []) if not widget.disabled]
+
+
+class LoadResults:
+	def __init__(self) -> None:
+		self.latencies: Dict[str, List[float]] = {action: [] for action in ACTIONS}
+		# Actions a user meant to take but could not, e.g. a request with no Request button on the page.
+		self.skipped: Counter = Counter()
+		# Reruns of each action that showed no movies.
+		self.empty: Counter = Counter()
+		self.errors = 0
+
+	def record(self, action: str, seconds: float, found_nothing: bool = False) -> None:
+		self.latencies.setdefault(action, []).append(seconds)
+		if found_nothing:
+			self.empty[action] += 1
+
+	def summary(self) -> Dict[str, dict]:
+		groups = dict(self.latencies)
+		groups['all'] = [seconds for values in self.latencies.values() for seconds in values]
+		self.skipped['all'] = sum(self.skipped[action] for action in self.latencies)
+		self.empty['all'] = sum(self.empty[action] for action in self.latencies)
+		return {
+			action: dict(
+				reruns=len(values), skipped=self.skipped[action], empty=self.empty[action],
+				**{f"p{q}_ms": round(float(np.percentile(values, q)) * 1000, 1) if values else None for q in PERCENTILES},
+			)
+			for action, values in groups.items()
+		}
+
+
+async def simulate_user(session: UserSession, results: LoadResults, rng: random.Random, deadline: float, think: float, request_rate: float) -> None:
+	"""Search, filter, page and occasionally request, like a person browsing, until ``deadline``."""
+
+	async def act(action: str, widget: Optional[Widget] = None, **change) -> bool:
+		if time.monotonic() >= deadline:
+			return False
+		await asyncio.sleep(rng.uniform(0.5, 1.5) * think)
+		seconds = await session.rerun(widget, **change)
+		results.record(action, seconds, session.found_nothing)
+		return True
+
+	await session.connect()
+	try:
+		results.record('load', await session.rerun())
+		while time.monotonic() < deadline:
+			if not await act('search', session.widgets["🔍 Search by title"], text=rng.choice(WORDS)):
+				break
+			for _ in range(rng.randint(1, 3)):
+				next_buttons = session.buttons("Next ➡️")
+				if not next_buttons or not await act('page', next_buttons[0]):
+					break
+			await act('search', session.widgets["🔍 Search by title"], text="")
+			# The genre labels carry live counts, so pick from the options drawn for the cleared search.
+			genre = session.widgets["Genre"]
+			await act('filter', genre, selected=[rng.choice(genre.options)])
+			if rng.random() < request_rate:
+				request_buttons = session.buttons("📥 Request")
+				if request_buttons:
+					await act('request', rng.choice(request_buttons))
+				else:
+					results.skipped['request'] += 1
+			await act('filter', genre, selected=[])
+	finally:
+		results.errors += session.errors
+		session.close()
+
+
+async def sample_usage(pid: int, samples: List[Tuple[float, int]], stop: asyncio.Event) -> None:
+	while not stop.is_set():
+		samples.append(process_usage(pid))
+		try:
+			await asyncio.wait_for(stop.wait(), 0.5)
+		except asyncio.TimeoutError:
+			pass
+	samples.append(process_usage(pid))
+
+
+async def run_load(base_url: str, pid: int, config: dict, users: int, duration: float, ramp: float, think: float, request_rate: float, seed: int, timeout: float) -> dict:
+	results = LoadResults()
+	await wait_until_healthy(base_url, timeout)
+	# The first run loads and indexes the catalog; keep it out of the numbers.
+	await run_session(base_url, timeout)
+	idle_cpu, idle_rss = process_usage(pid)
+	samples: List[Tuple[float, int]] = []
+	stop = asyncio.Event()
+	sampler = asyncio.create_task(sample_usage(pid, samples, stop))
+	started = time.monotonic()
+	deadline = started + duration
+	tasks = []
+	for number, username in enumerate(config['credentials']['usernames']):
+		if number:
+			await asyncio.sleep(ramp / users)
+		session = UserSession(base_url, session_cookie(config, username), timeout)
+		tasks.append(asyncio.create_task(simulate_user(session, results, random.Random(seed + number), deadline, think, request_rate)))
+	outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+	elapsed = time.monotonic() - started
+	stop.set()
+	await sampler
+	failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+	for outcome in failed[:3]:
+		click.echo(f"Session failed: {outcome!r}", err=True)
+	busy_cpu = samples[-1][0] - idle_cpu
+	peak_rss = max(rss for _, rss in samples)
+	summary = results.summary()
+	reruns = summary['all']['reruns'] if 'all' in summary else 0
+	return {
+		'users': users,
+		'duration_s': round(elapsed, 1),
+		'failed_sessions': len(failed),
+		'errors': results.errors,
+		'request_rate': request_rate,
+		'reruns_per_s': round(reruns / elapsed, 2),
+		'latency': summary,
+		'server': {
+			'cpu_cores': round(busy_cpu / elapsed, 2),
+			'cpu_ms_per_rerun': round(busy_cpu * 1000 / reruns, 1) if reruns else None,
+			'idle_rss_mb': round(idle_rss / 2**20, 1),
+			'peak_rss_mb': round(peak_rss / 2**20, 1),
+			'rss_mb_per_session': round((peak_rss - idle_rss) / 2**20 / users, 2),
+		},
+	}
+
+
+def print_report(report: dict) -> None:
+	click.echo(f"{'action':<10}{'reruns':>8}{'skipped':>9}{'empty':>7}" + "".join(f"{f'p{q} ms':>10}" for q in PERCENTILES))
+	for action, stats in report['latency'].items():
+		click.echo(
+			f"{action:<10}{stats['reruns']:>8}{stats['skipped']:>9}{stats['empty']:>7}"
+			+ "".join(f"{stats[f'p{q}_ms']:>10.1f}" if stats[f'p{q}_ms'] is not None else f"{'-':>10}" for q in PERCENTILES)
+		)
+	server = report['server']
+	requests = report['latency']['request']
+	click.echo(f"Requests: {requests['reruns']} sent, {requests['skipped']} skipped with no Request button on the page, at --request-rate {report['request_rate']}")
+	if not requests['reruns']:
+		click.echo("Warning: no request was sent, so the request queue was not exercised", err=True)
+	click.echo(f"Throughput: {report['reruns_per_s']} reruns/s over {report['duration_s']}s, {report['errors']} error(s), {report['failed_sessions']} failed session(s)")
+	click.echo(f"Server CPU: {server['cpu_cores']} cores on average, {server['cpu_ms_per_rerun']} ms per rerun")
+	click.echo(f"Server memory: {server['idle_rss_mb']} MB idle, {server['peak_rss_mb']} MB peak, {server['rss_mb_per_session']} MB per session")
+
+
+@click.command()
+@click.option("--movies", default=10000, show_default=True, help="Synthetic catalog size")
+@click.option("--users", default=10, show_default=True, help="Concurrent simulated users")
+@click.option("--duration", default=60.0, show_default=True, help="Seconds to keep the users busy")
+@click.option("--ramp", default=5.0, show_default=True, help="Seconds over which the users arrive")
+@click.option("--think", default=1.0, show_default=True, help="Mean seconds a user pauses between actions")
+@click.option("--request-rate", default=0.3, show_default=True, help="Chance that a browsing round ends in a request")
+@click.option("--in-library", default=1000, show_default=True, help="Catalog movies the Jellyfin stand-in already has")
+@click.option("--seed", default=0, show_default=True)
+@click.option("--timeout", default=120.0, show_default=True, help="Seconds to wait for the server and for any one rerun")
+@click.option("--workdir", type=click.Path(file_okay=False, path_type=Path), default=None, help="Where to put the catalog, config and databases (a temporary directory by default)")
+@click.option("--report", "report_path", type=click.Path(dir_okay=False, path_type=Path), default=None, help="Also write the results as JSON")
+def main(movies: int, users: int, duration: float, ramp: float, think: float, request_rate: float, in_library: int, seed: int, timeout: float, workdir: Optional[Path], report_path: Optional[Path]) -> None:
+	"""Run app.py under simulated concurrent users and report rerun latency and server load."""
+	directory = workdir or Path(tempfile.mkdtemp(prefix="loadtest-"))
+	directory.mkdir(parents=True, exist_ok=True)
+	catalog = synthetic_catalog(movies, seed)
+	with (directory / "out.json").open("w") as file:
+		json.dump(catalog, file)
+	config = write_config(directory, users)
+	# Streamlit reads .streamlit/config.toml from its working directory.
+	shutil.copytree(APP.parent / ".streamlit", directory / ".streamlit", dirs_exist_ok=True)
+
+	library = fake_jellyfin.FakeLibrary()
+	for entry in random.Random(seed).sample(catalog['media'], min(in_library, movies)):
+		library.add(entry['title'], entry['year'], imdb_id=f"tt{1000000 + int(entry['slug'].rsplit('-', 1)[1])}")
+	del catalog
+	jellyfin = fake_jellyfin.serve(library)
+	deluge = fake_deluge.serve(fake_deluge.FakeDaemon())
+
+	port = free_port()
+	env = dict(
+		os.environ,
+		JELLYFIN_URL=f"http://127.0.0.1:{jellyfin.server_address[1]}",
+		JELLYFIN_API_KEY="loadtest",
+		DELUGE_HOST="127.0.0.1",
+		DELUGE_PORT=str(deluge.server_address[1]),
+		DELUGE_USERNAME="user",
+		DELUGE_PASSWORD="pass",
+	)
+	env.pop("QUERY_API_PORT", None)
+	command = [
+		sys.executable, "-m", "streamlit", "run", str(APP),
+		"--server.headless=true", "--server.address=127.0.0.1", f"--server.port={port}",
+		"--browser.gatherUsageStats=false",
+	]
+	click.echo(f"Serving {movies} synthetic movies from {directory} on port {port}, {users} users for {duration:.0f}s")
+	with (directory / "streamlit.log").open("wb") as log:
+		server = subprocess.Popen(command, cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+		try:
+			report = asyncio.run(run_load(f"http://127.0.0.1:{port}", server.pid, config, users, duration, ramp, think, request_rate, seed, timeout))
+		finally:
+			server.terminate()
+			server.wait(timeout=30)
+			jellyfin.shutdown()
+			deluge.shutdown()
+	report['movies'] = movies
+	print_report(report)
+	if report_path:
+		report_path.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -10,9 +10,10 @@ import re
 from enum import Enum
 import sys
 
-from bs4 import BeautifulSoup
 from pydantic import BaseModel
 
+from extract import MoviePage, extract_movie_page
+
 
 ROOT_BASE = Path.home() / "websites" / "yts" / "www.yts-official.cc"
 MOVIES_ROOT = ROOT_BASE / "movies"
@@ -192,125 +193,77 @@ def resolve_poster_path(poster_href: str) -> Optional[Path]:
 	return poster_path if poster_path.is_file() else None
 
 
-def parse_downloads(soup: BeautifulSoup, base_url: str) -> tuple[List[MagnetLink], List[TorrentFile]]:
+def parse_downloads(page: MoviePage, base_url: str) -> tuple[List[MagnetLink], List[TorrentFile]]:
 	magnet_objects: List[MagnetLink] = []
 	torrent_objects: List[TorrentFile] = []
 
-	for modal in soup.select(".modal-torrent"):
-		quality_span = modal.select_one(".modal-quality span") or modal.select_one(".modal-quality")
-		quality = normalize_quality(quality_span.get_text(strip=True) if quality_span else None)
-		type_text = modal.select_one("p.quality-size")
-		type_value = normalize_type(type_text.get_text(strip=True) if type_text else None) or ReleaseType.UNKNOWN
-
-		magnet_anchor = modal.select_one("a[href^='magnet:']")
-		if magnet_anchor and magnet_anchor.get("href"):
-			magnet_objects.append(MagnetLink(quality=quality, type=type_value, url=magnet_anchor.get("href")))
-
-		torrent_anchor = modal.select_one("a.download-torrent[href]")
-		if torrent_anchor and torrent_anchor.get("href"):
-			torrent_href = torrent_anchor.get("href")
-			torrent_url = urljoin(base_url, torrent_href)
-			torrent_path = resolve_torrent_path(torrent_href)
+	for download in page.downloads:
+		quality = normalize_quality(download.quality_text)
+		type_value = normalize_type(download.type_text) or ReleaseType.UNKNOWN
+
+		if download.magnet_url:
+			magnet_objects.append(MagnetLink(quality=quality, type=type_value, url=download.magnet_url))
+
+		if download.torrent_href:
+			torrent_url = urljoin(base_url, download.torrent_href)
+			torrent_path = resolve_torrent_path(download.torrent_href)
 			torrent_objects.append(TorrentFile(quality=quality, type=type_value, url=torrent_url, path=torrent_path))
 
 	if not magnet_objects:
-		fallback_magnets = [a.get("href") for a in soup.select("a[href^='magnet:']") if a.get("href")]
-		magnet_objects = [MagnetLink(quality=None, type=ReleaseType.UNKNOWN, url=url) for url in unique_preserve_order(fallback_magnets)]
+		magnet_objects = [MagnetLink(quality=None, type=ReleaseType.UNKNOWN, url=url) for url in unique_preserve_order(page.magnet_urls)]
 
 	if not torrent_objects:
-		fallback_torrents = [a.get("href") for a in soup.select("a.download-torrent[href]") if a.get("href")]
-		torrent_objects = [TorrentFile(quality=None, type=ReleaseType.UNKNOWN, url=urljoin(base_url, href), path=resolve_torrent_path(href)) for href in unique_preserve_order(fallback_torrents)]
+		torrent_objects = [TorrentFile(quality=None, type=ReleaseType.UNKNOWN, url=urljoin(base_url, href), path=resolve_torrent_path(href)) for href in unique_preserve_order(page.torrent_hrefs)]
 
 	return unique_by_url(magnet_objects), unique_by_url(torrent_objects)
 
 
 def parse_media(index_path: Path) -> Media:
 	html = index_path.read_text(encoding="utf-8", errors="ignore")
-	soup = BeautifulSoup(html, "html.parser")
+	page = extract_movie_page(html)
 
 	slug = index_path.parent.name
 	base_url = f"https://www.yts-official.cc/movies/{slug}/"
 
-	title_tag = soup.select_one("#movie-content h1") or soup.find("h1", attrs={"itemprop": "name"})
-	if not title_tag:
+	if page.title is None:
 		raise ValueError(f"No title found in {index_path}")
-	title = title_tag.get_text(strip=True)
+	title = page.title
 	if not title:
 		raise ValueError(f"Empty title in {index_path}")
 
-	year_tag = None
-	if title_tag and title_tag.find_next_sibling("h2"):
-		year_tag = title_tag.find_next_sibling("h2")
-	if not year_tag:
-		year_tag = soup.find("h2")
-	year = parse_year(year_tag.get_text(strip=True) if year_tag else None)
+	year = parse_year(page.year_text)
 	if year is None:
 		raise ValueError(f"No year found in {index_path}")
 
-	# Extract genres from second h2 (after year)
 	genres: List[Genre] = []
-	genre_tag = title_tag.find_next_sibling("h2").find_next_sibling("h2") if title_tag else None
-	if genre_tag:
-		genre_text = genre_tag.get_text(strip=True)
-		genres = [normalize_genre(g.strip()) or Genre.UNKNOWN for g in genre_text.split("/") if g.strip()]
-
-	imdb_anchor = soup.find("a", href=re.compile(r"imdb\.com/title"))
-	imdb_link = imdb_anchor.get("href") if imdb_anchor else None
+	if page.genre_text:
+		genres = [normalize_genre(g.strip()) or Genre.UNKNOWN for g in page.genre_text.split("/") if g.strip()]
 
-	# Extract IMDb rating
 	imdb_rating = None
-	rating_span = soup.find("span", attrs={"itemprop": "ratingValue"})
-	if rating_span:
+	if page.rating_text:
 		try:
-			imdb_rating = float(rating_span.get_text(strip=True))
-		except (ValueError, AttributeError):
+			imdb_rating = float(page.rating_text)
+		except ValueError:
 			pass
 
-	# Extract synopsis
-	synopsis = None
-	synopsis_div = soup.find("div", id="synopsis")
-	if synopsis_div:
-		synopsis_p = synopsis_div.find("p", class_="hidden-xs")
-		if not synopsis_p:
-			synopsis_p = synopsis_div.find("p")
-		if synopsis_p:
-			synopsis = synopsis_p.get_text(strip=True)
-
-	# Extract director
-	director = None
-	director_div = soup.find("div", class_="directors")
-	if director_div:
-		director_span = director_div.find("span", attrs={"itemprop": "name"})
-		if director_span:
-			director = director_span.get_text(strip=True)
-
-	# Extract cast
-	cast = []
-	cast_div = soup.find("div", class_="actors")
-	if cast_div:
-		cast_spans = cast_div.find_all("span", attrs={"itemprop": "name"})
-		cast = [span.get_text(strip=True) for span in cast_spans if span.get_text(strip=True)]
-
-	poster_img = soup.select_one("#movie-poster img[itemprop='image']") or soup.select_one("#movie-poster img")
-	poster_src = poster_img.get("src") if poster_img else None
 	poster = None
-	if poster_src:
-		poster_url = urljoin(base_url, poster_src)
-		poster_path = resolve_poster_path(poster_src)
+	if page.poster_src:
+		poster_url = urljoin(base_url, page.poster_src)
+		poster_path = resolve_poster_path(page.poster_src)
 		poster = Poster(url=poster_url, path=poster_path)
 
-	magnet_links, torrent_files = parse_downloads(soup, base_url)
+	magnet_links, torrent_files = parse_downloads(page, base_url)
 
 	return Media(
 		slug=slug,
 		title=title,
 		year=year,
 		genres=genres,
-		imdb_link=imdb_link,
+		imdb_link=page.imdb_link,
 		imdb_rating=imdb_rating,
-		synopsis=synopsis,
-		director=director,
-		cast=cast,
+		synopsis=page.synopsis,
+		director=page.director,
+		cast=page.cast,
 		poster=poster,
 		magnet_links=magnet_links,
 		torrent_files=torrent_files,
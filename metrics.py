@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import bisect
+import json
+import math
+import os
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+
+def format_labels(labelnames: Sequence[str], values: Tuple[str, ...]) -> str:
+	if not labelnames:
+		return ""
+	pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+	return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+	if value == math.inf:
+		return "+Inf"
+	if float(value).is_integer():
+		return str(int(value))
+	return repr(float(value))
+
+
+class Metric:
+	kind = "untyped"
+
+	def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+		self._lock = threading.Lock()
+
+	def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+		return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+	def header(self) -> List[str]:
+		return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+	kind = "counter"
+
+	def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+		super().__init__(name, help, labelnames)
+		self._values: Dict[Tuple[str, ...], float] = {}
+
+	def inc(self, amount: float = 1, **labels: object) -> None:
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+	def total(self) -> float:
+		with self._lock:
+			return sum(self._values.values())
+
+	def render(self) -> List[str]:
+		with self._lock:
+			values = sorted(self._values.items())
+		lines = self.header()
+		if not values and not self.labelnames:
+			values = [((), 0)]
+		for key, value in values:
+			lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+		return lines
+
+	def summary(self) -> object:
+		with self._lock:
+			if not self.labelnames:
+				return self._values.get((), 0)
+			return {",".join(key): value for key, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+	kind = "gauge"
+
+	def set(self, value: float, **labels: object) -> None:
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = value
+
+
+class Histogram(Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+		super().__init__(name, help)
+		self.buckets = tuple(sorted(buckets)) + (math.inf,)
+		self._counts = [0] * len(self.buckets)
+		self._sum = 0.0
+		self._count = 0
+		self._min = math.inf
+		self._max = -math.inf
+
+	def observe(self, value: float) -> None:
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			self._counts[index] += 1
+			self._sum += value
+			self._count += 1
+			self._min = min(self._min, value)
+			self._max = max(self._max, value)
+
+	def time(self) -> Timer:
+		return Timer(self)
+
+	def quantile(self, q: float) -> Optional[float]:
+		"""Estimate a quantile by linear interpolation inside its bucket."""
+		with self._lock:
+			counts = list(self._counts)
+			total = self._count
+			low, high = self._min, self._max
+		if not total:
+			return None
+		rank = q * total
+		cumulative = 0
+		lower = 0.0
+		for bound, count in zip(self.buckets, counts):
+			if count and cumulative + count >= rank:
+				upper = min(bound, high)
+				lower = max(lower, low)
+				return lower + (upper - lower) * ((rank - cumulative) / count)
+			cumulative += count
+			lower = bound
+		return high
+
+	def render(self) -> List[str]:
+		with self._lock:
+			counts = list(self._counts)
+			total_sum = self._sum
+			total = self._count
+		lines = self.header()
+		cumulative = 0
+		for bound, count in zip(self.buckets, counts):
+			cumulative += count
+			lines.append(f'{self.name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+		lines.append(f"{self.name}_sum {format_value(total_sum)}")
+		lines.append(f"{self.name}_count {total}")
+		return lines
+
+	def summary(self) -> object:
+		with self._lock:
+			total = self._count
+			total_sum = self._sum
+			low, high = self._min, self._max
+		if not total:
+			return {"count": 0}
+		return {
+			"count": total,
+			"sum": round(total_sum, 6),
+			"mean": round(total_sum / total, 6),
+			"min": round(low, 6),
+			"max": round(high, 6),
+			"p50": round(self.quantile(0.5), 6),
+			"p95": round(self.quantile(0.95), 6),
+			"p99": round(self.quantile(0.99), 6),
+		}
+
+
+class Timer:
+	def __init__(self, histogram: Histogram) -> None:
+		self.histogram = histogram
+		self.start = 0.0
+		self.elapsed = 0.0
+
+	def __enter__(self) -> Timer:
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc_info: object) -> None:
+		self.elapsed = time.perf_counter() - self.start
+		self.histogram.observe(self.elapsed)
+
+
+class Registry:
+	"""A set of metrics that can be rendered as a Prometheus textfile or a JSON summary."""
+
+	def __init__(self, prefix: str = "") -> None:
+		self.prefix = prefix
+		self.metrics: List[Metric] = []
+		self.started = time.time()
+
+	def _add(self, metric: Metric) -> Metric:
+		self.metrics.append(metric)
+		return metric
+
+	def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+		return self._add(Counter(self.prefix + name, help, labelnames))
+
+	def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+		return self._add(Gauge(self.prefix + name, help, labelnames))
+
+	def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+		return self._add(Histogram(self.prefix + name, help, buckets))
+
+	def render(self) -> str:
+		lines: List[str] = []
+		for metric in self.metrics:
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+	def summary(self) -> dict:
+		return {
+			"started": self.started,
+			"elapsed_seconds": round(time.time() - self.started, 3),
+			"metrics": {metric.name: metric.summary() for metric in self.metrics},
+		}
+
+	def write_textfile(self, path: Path) -> None:
+		"""Atomically replace ``path`` so node_exporter never reads a partial file."""
+		write_atomic(path, self.render())
+
+	def write_summary(self, path: Path) -> None:
+		write_atomic(path, json.dumps(self.summary(), indent=2) + "\n")
+
+
+def write_atomic(path: Path, text: str) -> None:
+	tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+	with tmp_path.open("w", encoding="utf-8") as handle:
+		handle.write(text)
+	os.replace(tmp_path, path)
+
+
+class TextfileReporter:
+	"""Background thread that rewrites a Prometheus textfile every ``interval`` seconds."""
+
+	def __init__(self, registry: Registry, path: Path, interval: float = 5.0) -> None:
+		self.registry = registry
+		self.path = path
+		self.interval = interval
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+
+	def start(self) -> TextfileReporter:
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		self._thread.join()
+		self.registry.write_textfile(self.path)
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			try:
+				self.registry.write_textfile(self.path)
+			except OSError:
+				pass
@@ -0,0 +1,194 @@
+"""Poster thumbnails for the movie grid, kept in a size-bounded disk cache.
+
+A thumbnail is made from the poster in the local httrack mirror when
+``Poster.path`` points at one, otherwise from the remote poster, which is
+downloaded once in the background. Thumbnails are written under
+``static/posters`` and served by Streamlit's static file handler
+(``server.enableStaticServing``). File names are derived from the poster URL,
+so a thumbnail never changes under its URL and the ``?v=`` query makes the
+handler send far-future cache headers.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+import os
+import threading
+import time
+
+from loguru import logger
+
+from catalog import PosterRecord
+
+
+THUMBNAIL_DIR = Path("static/posters")
+THUMBNAIL_URL = "/app/static/posters"
+# Wide enough for a grid column at three per row, at the posters' 2:3 ratio.
+THUMBNAIL_SIZE = (400, 600)
+THUMBNAIL_QUALITY = 80
+CACHE_LIMIT = int(os.getenv("POSTER_CACHE_MB", "512")) * 1024 * 1024
+FETCH_WORKERS = 4
+FETCH_TIMEOUT = 10
+# Posters that could not be fetched are not tried again for this long.
+RETRY_AFTER = 3600.0
+
+
+def poster_key(poster: PosterRecord) -> str:
+	return sha1(poster.url.encode("utf-8")).hexdigest()[:20]
+
+
+def make_thumbnail(source: Union[Path, BytesIO], destination: Path, size: Tuple[int, int] = THUMBNAIL_SIZE) -> int:
+	"""Write a WebP thumbnail of ``source`` to ``destination``; returns its size in bytes."""
+	# Pillow is only needed once a thumbnail is missing, so it is not imported with the page.
+	from PIL import Image, ImageOps
+
+	with Image.open(source) as image:
+		# Lets JPEG decode straight at a reduced scale instead of full size.
+		image.draft("RGB", size)
+		thumbnail = ImageOps.exif_transpose(image).convert("RGB")
+	thumbnail.thumbnail(size, Image.Resampling.LANCZOS)
+	tmp_path = destination.with_name(f".{destination.name}.{threading.get_ident()}.tmp")
+	thumbnail.save(tmp_path, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+	os.replace(tmp_path, destination)
+	return destination.stat().st_size
+
+
+class PosterCache:
+	"""Thumbnails on disk, evicted least recently used first above ``max_bytes``.
+
+	``url`` never waits on the network or on resizing: a poster without a
+	thumbnail yet is shown from its remote URL while a worker thread makes it.
+	"""
+
+	_shared: Optional[PosterCache] = None
+	_shared_lock = threading.Lock()
+
+	def __init__(self, directory: Path = THUMBNAIL_DIR, max_bytes: int = CACHE_LIMIT, workers: int = FETCH_WORKERS, timeout: float = FETCH_TIMEOUT) -> None:
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.timeout = timeout
+		self.directory.mkdir(parents=True, exist_ok=True)
+		self._lock = threading.Lock()
+		self._pending: set = set()
+		self._failed: Dict[str, float] = {}
+		self._executor = ThreadPoolExecutor(workers, thread_name_prefix="poster-fetch")
+		self._session = None
+		# Least recently used first; file modification times carry the order across restarts.
+		stats = ((path.stem, path.stat()) for path in self.directory.glob("*.webp"))
+		files = sorted((stat.st_mtime, key, stat.st_size) for key, stat in stats)
+		self._entries: OrderedDict[str, int] = OrderedDict((key, size) for _, key, size in files)
+		self._bytes = sum(self._entries.values())
+
+	@classmethod
+	def shared(cls, **kwargs) -> PosterCache:
+		"""One cache and fetch pool per process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			if cls._shared is None:
+				cls._shared = cls(**kwargs)
+			return cls._shared
+
+	def path(self, key: str) -> Path:
+		return self.directory / f"{key}.webp"
+
+	def url(self, poster: PosterRecord) -> str:
+		"""Where the grid should load ``poster`` from.
+
+		The local thumbnail when there is one. Otherwise the remote URL, and the
+		thumbnail is made in the background (from the local mirror file when
+		there is one) for the next render.
+		"""
+		key = poster_key(poster)
+		if self._touch(key):
+			return f"{THUMBNAIL_URL}/{key}.webp?v={key}"
+		self.prefetch([poster])
+		return poster.url
+
+	def prefetch(self, posters: Iterable[Optional[PosterRecord]]) -> None:
+		"""Make thumbnails for ``posters`` on the worker threads, e.g. for the next page."""
+		now = time.monotonic()
+		for poster in posters:
+			if poster is None:
+				continue
+			key = poster_key(poster)
+			with self._lock:
+				if key in self._entries or key in self._pending or now < self._failed.get(key, 0):
+					continue
+				self._pending.add(key)
+			self._executor.submit(self._fetch, key, poster)
+
+	def _touch(self, key: str) -> bool:
+		with self._lock:
+			if key not in self._entries:
+				return False
+			self._entries.move_to_end(key)
+		try:
+			os.utime(self.path(key))
+		except OSError:
+			# Evicted or removed behind our back; it will be made again.
+			with self._lock:
+				self._bytes -= self._entries.pop(key, 0)
+			return False
+		return True
+
+	def _make(self, key: str, source: Union[Path, BytesIO]) -> bool:
+		if isinstance(source, Path) and not source.is_file():
+			return False
+		from PIL.Image import DecompressionBombError
+
+		try:
+			size = make_thumbnail(source, self.path(key))
+		except (OSError, ValueError, DecompressionBombError) as exc:
+			logger.warning("Could not make a poster thumbnail from {}: {}", source, exc)
+			return False
+		self._add(key, size)
+		return True
+
+	def _fetch(self, key: str, poster: PosterRecord) -> None:
+		import requests
+
+		if self._session is None:
+			self._session = requests.Session()
+		try:
+			if poster.path and self._make(key, Path(poster.path)):
+				return
+			try:
+				response = self._session.get(poster.url, timeout=self.timeout)
+				response.raise_for_status()
+			except requests.RequestException as exc:
+				logger.warning("Fetching poster {} failed: {}", poster.url, exc)
+				made = False
+			else:
+				made = self._make(key, BytesIO(response.content))
+			if not made:
+				with self._lock:
+					self._failed[key] = time.monotonic() + RETRY_AFTER
+		finally:
+			with self._lock:
+				self._pending.discard(key)
+
+	def _add(self, key: str, size: int) -> None:
+		evicted = []
+		with self._lock:
+			self._bytes += size - self._entries.pop(key, 0)
+			self._entries[key] = size
+			self._failed.pop(key, None)
+			while self._bytes > self.max_bytes and len(self._entries) > 1:
+				old_key, old_size = self._entries.popitem(last=False)
+				self._bytes -= old_size
+				evicted.append(old_key)
+		for old_key in evicted:
+			self.path(old_key).unlink(missing_ok=True)
+		if evicted:
+			logger.debug("Evicted {} poster thumbnails", len(evicted))
+
+	@property
+	def size_bytes(self) -> int:
+		return self._bytes
+
+	def __len__(self) -> int:
+		return len(self._entries)
@@ -0,0 +1,85 @@
+"""Run app.py once in a freshly started Streamlit server, before anyone visits.
+
+Streamlit only executes the script when a browser session connects, so the
+first visitor after a restart used to wait for the catalog to be loaded and
+indexed. This opens a session over the same websocket the browser uses, asks
+for one script run and waits for it to finish:
+
+	python prewarm.py --port 4229
+
+It prints how long the cold run took and how long a second, warm session
+takes to render, i.e. time to first paint before and after warming.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import click
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+
+
+async def wait_until_healthy(base_url: str, timeout: float) -> None:
+	client = AsyncHTTPClient()
+	deadline = time.monotonic() + timeout
+	while True:
+		try:
+			response = await client.fetch(f"{base_url}/_stcore/health", raise_error=False, request_timeout=5)
+			if response.code == 200:
+				return
+		except OSError:
+			pass
+		if time.monotonic() > deadline:
+			raise click.ClickException(f"Streamlit at {base_url} did not become healthy within {timeout:.0f}s")
+		await asyncio.sleep(0.5)
+
+
+async def run_session(base_url: str, timeout: float) -> float:
+	"""Open a session, run the script once and return the seconds until it finished."""
+	request = HTTPRequest(
+		base_url.replace("http", "ws", 1) + "/_stcore/stream",
+		headers={"Sec-WebSocket-Protocol": "streamlit"},
+		request_timeout=timeout,
+	)
+	connection = await websocket_connect(request)
+	try:
+		started = time.perf_counter()
+		message = BackMsg()
+		message.rerun_script.query_string = ""
+		message.rerun_script.page_script_hash = ""
+		await connection.write_message(message.SerializeToString(), binary=True)
+		deadline = time.monotonic() + timeout
+		while time.monotonic() < deadline:
+			raw = await asyncio.wait_for(connection.read_message(), timeout)
+			if raw is None:
+				raise click.ClickException("Streamlit closed the session before the script finished")
+			reply = ForwardMsg()
+			reply.ParseFromString(raw)
+			if reply.WhichOneof("type") == "script_finished":
+				return time.perf_counter() - started
+		raise click.ClickException(f"The script did not finish within {timeout:.0f}s")
+	finally:
+		connection.close()
+
+
+async def prewarm(base_url: str, timeout: float) -> None:
+	await wait_until_healthy(base_url, timeout)
+	cold = await run_session(base_url, timeout)
+	warm = await run_session(base_url, timeout)
+	click.echo(f"Prewarmed {base_url}: first run {cold:.2f}s, next session {warm:.2f}s")
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8501, show_default=True)
+@click.option("--timeout", default=120.0, show_default=True, help="Seconds to wait for the server and for each run")
+def main(host: str, port: int, timeout: float) -> None:
+	asyncio.run(prewarm(f"http://{host}:{port}", timeout))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,145 @@
+"""Lightweight per-rerun profiling for the Streamlit page.
+
+A ``RerunProfile`` records how long each phase of a script run took (laps
+between checkpoints), time spent in repeated calls such as library lookups,
+and hits and misses of the app's own caches. Recording is cheap enough to
+do on every run; only runs with profiling switched on (an admin toggle in
+the sidebar) are shown and appended to the rolling ``ProfileLog``.
+
+Streamlit runs each rerun on a fresh thread, so the profile of the current
+run is kept in a thread-local and helpers deep in the page can reach it via
+``current()``.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+
+LOG_FILE = Path("profile_log.jsonl")
+# The log is rotated to ``<name>.1`` once it grows past this size.
+LOG_MAX_BYTES = int(os.getenv("PROFILE_LOG_MAX_KB", "5120")) * 1024
+RECENT_SAMPLES = 500
+ADMIN_ROLE = "admin"
+
+_local = threading.local()
+
+
+class RerunProfile:
+	def __init__(self, scope: str) -> None:
+		self.scope = scope
+		self.started = time.perf_counter()
+		self._last = self.started
+		self.phases: Dict[str, float] = {}
+		self.timers: Dict[str, Tuple[int, float]] = {}
+		self.caches: Dict[str, List[int]] = {}
+		self.total: Optional[float] = None
+
+	def lap(self, phase: str) -> None:
+		"""Close ``phase``: everything since the previous lap (or the start) is charged to it."""
+		now = time.perf_counter()
+		self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+		self._last = now
+
+	@contextmanager
+	def timed(self, name: str) -> Iterator[None]:
+		"""Add the time spent in the block to ``name``; repeated calls are summed and counted."""
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			calls, seconds = self.timers.get(name, (0, 0.0))
+			self.timers[name] = (calls + 1, seconds + time.perf_counter() - started)
+
+	def cache(self, name: str, hit: bool) -> None:
+		counts = self.caches.setdefault(name, [0, 0])
+		counts[0 if hit else 1] += 1
+
+	def finish(self) -> dict:
+		"""Stop the clock and return the run as a log sample (times in milliseconds)."""
+		if self.total is None:
+			self.total = time.perf_counter() - self.started
+		return {
+			'at': datetime.now().isoformat(timespec='seconds'),
+			'scope': self.scope,
+			'total_ms': round(self.total * 1000, 2),
+			'phases': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+			'timers': {name: {'calls': calls, 'ms': round(seconds * 1000, 2)} for name, (calls, seconds) in self.timers.items()},
+			'caches': {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in self.caches.items()},
+		}
+
+
+def start(scope: str) -> RerunProfile:
+	"""Begin profiling the current script run (or fragment run) on this thread."""
+	_local.profile = RerunProfile(scope)
+	return _local.profile
+
+
+def current() -> Optional[RerunProfile]:
+	return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+	"""``RerunProfile.timed`` on the current profile; a no-op when nothing is being profiled."""
+	profile = current()
+	if profile is None:
+		yield
+		return
+	with profile.timed(name):
+		yield
+
+
+def is_admin(roles: Optional[List[str]]) -> bool:
+	return ADMIN_ROLE in (roles or ())
+
+
+class ProfileLog:
+	"""Profiled runs appended to a JSON-lines file, with the latest kept in memory for the panel."""
+
+	_shared: Optional[ProfileLog] = None
+	_shared_lock = threading.Lock()
+
+	def __init__(self, path: Path = LOG_FILE, max_bytes: int = LOG_MAX_BYTES, recent: int = RECENT_SAMPLES) -> None:
+		self.path = path
+		self.max_bytes = max_bytes
+		self.recent: Deque[dict] = deque(maxlen=recent)
+		self._lock = threading.Lock()
+
+	@classmethod
+	def shared(cls, **kwargs) -> ProfileLog:
+		"""One log per process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			if cls._shared is None:
+				cls._shared = cls(**kwargs)
+			return cls._shared
+
+	def append(self, sample: dict) -> None:
+		line = json.dumps(sample, separators=(",", ":")) + "\n"
+		with self._lock:
+			self.recent.append(sample)
+			try:
+				if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+					os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+				with self.path.open("a", encoding="utf-8") as handle:
+					handle.write(line)
+			except OSError as exc:
+				logger.warning("Could not write profile sample to {}: {}", self.path, exc)
+
+	def percentiles(self, scope: str, quantiles: Tuple[float, ...] = (0.5, 0.95)) -> Optional[Dict[float, float]]:
+		"""Total run time percentiles (ms) of the recent samples of ``scope``."""
+		with self._lock:
+			totals = sorted(sample['total_ms'] for sample in self.recent if sample['scope'] == scope)
+		if not totals:
+			return None
+		return {q: totals[min(len(totals) - 1, int(q * len(totals)))] for q in quantiles}
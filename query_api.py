@@ -0,0 +1,334 @@
+"""Read-only HTTP/JSON API over the catalog, library and torrent state.
+
+Serves the same search, filters and sort orders as the Streamlit page from
+the shared in-process indexes, without rendering anything:
+
+	GET /movies?q=matrix&genre=Action&year=1999,2003&quality=1080p&min_rating=7&sort=rating&page=1&per_page=20
+	GET /movies/<slug>
+	GET /torrents
+	GET /library?title=The+Matrix&year=1999&imdb=tt0133093
+	GET /health
+
+Run it inside the app process by setting ``QUERY_API_PORT`` before starting
+Streamlit, or on its own with ``python query_api.py --port 8765``. On its own
+it only reads: torrent statuses from torrents.db and the library from the
+Jellyfin mirror file, both kept current by the app, so it never polls deluge
+or syncs Jellyfin itself. Responses
+are cached until the catalog, library index or torrent statuses change and
+carry an ``ETag``, so repeated queries are answered from memory or with a
+``304 Not Modified``.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+import json
+import os
+import threading
+import time
+
+import click
+from loguru import logger
+
+from catalog import CatalogReloader, CatalogSnapshot, Movie, select_best_magnet
+from library import LibraryMirror, LibrarySync
+from torrent_poller import TorrentPoller
+from torrent_store import TorrentStatus, TorrentStore, infohash_from_magnet
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+# Distinct responses kept in memory between state changes.
+CACHE_SIZE = 1024
+# How often the standalone server re-reads the torrent store and library mirror.
+FOLLOW_INTERVAL = 10.0
+
+# URL-friendly names for the page's sort options.
+SORTS = {
+	'relevance': "Relevance",
+	'title': "Title",
+	'newest': "Year (Newest)",
+	'oldest': "Year (Oldest)",
+	'rating': "Rating (Highest)",
+	'rating_asc': "Rating (Lowest)",
+}
+
+
+class QueryError(ValueError):
+	pass
+
+
+def query_list(query: Dict[str, List[str]], name: str) -> List[str]:
+	values: List[str] = []
+	for raw in query.get(name, []):
+		values.extend(part for part in raw.split(",") if part)
+	return values
+
+
+def query_value(query: Dict[str, List[str]], name: str, default: str = "") -> str:
+	return query.get(name, [default])[0]
+
+
+def query_number(query: Dict[str, List[str]], name: str, default, cast=int, low=None, high=None):
+	raw = query_value(query, name)
+	if not raw:
+		return default
+	try:
+		value = cast(raw)
+	except ValueError:
+		raise QueryError(f"{name} must be a number") from None
+	if low is not None and value < low:
+		raise QueryError(f"{name} must be at least {low}")
+	if high is not None and value > high:
+		raise QueryError(f"{name} must be at most {high}")
+	return value
+
+
+def torrent_json(status: Optional[TorrentStatus]) -> Optional[dict]:
+	if status is None:
+		return None
+	return {'status': status.status, 'completion': status.completion, 'updated_at': status.updated_at.isoformat()}
+
+
+class QueryService:
+	"""Builds API responses from the shared catalog, library and torrent state.
+
+	The catalog snapshot, library index and status dict are each replaced, never
+	mutated, when they change, so together they identify the state a response
+	was built from. Cached responses are dropped as soon as any of them changes.
+	"""
+
+	def __init__(self, catalog: CatalogReloader, library: Optional[LibrarySync] = None, poller: Optional[TorrentPoller] = None, cache_size: int = CACHE_SIZE) -> None:
+		self.catalog = catalog
+		self.library = library
+		self.poller = poller
+		self.cache_size = cache_size
+		self._lock = threading.Lock()
+		self._state: Tuple = ()
+		# key -> (etag, body)
+		self._cache: OrderedDict[str, Tuple[str, bytes]] = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def _current(self) -> Tuple:
+		return (
+			self.catalog.current,
+			self.library.index if self.library else None,
+			self.poller.statuses if self.poller else {},
+		)
+
+	def get(self, path: str, query: Dict[str, List[str]], key: str) -> Tuple[int, str, bytes]:
+		"""``(status, etag, body)`` for a request; ``key`` identifies it in the cache."""
+		state = self._current()
+		with self._lock:
+			if len(state) != len(self._state) or any(new is not old for new, old in zip(state, self._state)):
+				self._state = state
+				self._cache.clear()
+			cached = self._cache.get(key)
+			if cached is not None:
+				self._cache.move_to_end(key)
+				self.hits += 1
+				return (200, *cached)
+		self.misses += 1
+		try:
+			status, payload = self.route(state, path, query)
+		except QueryError as exc:
+			status, payload = 400, {'error': str(exc)}
+		body = json.dumps(payload, separators=(",", ":")).encode()
+		etag = f'"{sha1(body).hexdigest()[:20]}"'
+		if status == 200:
+			with self._lock:
+				if self._state is state:
+					self._cache[key] = (etag, body)
+					if len(self._cache) > self.cache_size:
+						self._cache.popitem(last=False)
+		return status, etag, body
+
+	def route(self, state: Tuple, path: str, query: Dict[str, List[str]]) -> Tuple[int, object]:
+		snapshot, index, statuses = state
+		parts = [unquote(part) for part in path.strip("/").split("/") if part]
+		if parts == ['movies']:
+			return 200, self.movies(snapshot, index, statuses, query)
+		if len(parts) == 2 and parts[0] == 'movies':
+			row = snapshot.catalog.by_slug.get(parts[1])
+			if row is None:
+				return 404, {'error': 'movie not found'}
+			data = self.movie_json(snapshot.catalog.movies[row], index, statuses, detail=True)
+			data['similar'] = [snapshot.catalog.movies[other].slug for other in snapshot.similar.rows(row).tolist()]
+			return 200, data
+		if parts == ['torrents']:
+			return 200, {'torrents': [dict(infohash=key, title=status.title, year=status.year, **torrent_json(status)) for key, status in statuses.items()]}
+		if parts == ['library']:
+			title = query_value(query, 'title')
+			if not title and not query_value(query, 'imdb'):
+				raise QueryError("title or imdb is required")
+			year = query_number(query, 'year', None)
+			return 200, {'in_library': bool(index and index.contains(title, year, query_value(query, 'imdb') or None))}
+		if parts == ['health']:
+			return 200, {
+				'movies': len(snapshot.catalog),
+				'catalog_version': list(snapshot.version) if snapshot.version else None,
+				'library_items': index.size if index else None,
+				'torrents': len(statuses),
+			}
+		return 404, {'error': 'not found'}
+
+	def movies(self, snapshot: CatalogSnapshot, index, statuses: Dict[str, TorrentStatus], query: Dict[str, List[str]]) -> dict:
+		sort = SORTS.get(query_value(query, 'sort', 'relevance'))
+		if sort is None:
+			raise QueryError(f"sort must be one of {', '.join(SORTS)}")
+		try:
+			years = [int(year) for year in query_list(query, 'year')]
+		except ValueError:
+			raise QueryError("year must be a number") from None
+		rows = snapshot.query(
+			title=query_value(query, 'q'),
+			cast=query_value(query, 'cast'),
+			director=query_value(query, 'director'),
+			years=years,
+			genres=query_list(query, 'genre'),
+			qualities=query_list(query, 'quality'),
+			min_rating=query_number(query, 'min_rating', 0.0, float, 0, 10),
+			sort=sort,
+		)
+		page = query_number(query, 'page', 1, low=1)
+		per_page = query_number(query, 'per_page', PER_PAGE, low=1, high=MAX_PER_PAGE)
+		start = (page - 1) * per_page
+		movies = snapshot.catalog.view(rows)[start:start + per_page]
+		return {
+			'total': len(rows),
+			'page': page,
+			'per_page': per_page,
+			'pages': (len(rows) + per_page - 1) // per_page,
+			'movies': [self.movie_json(movie, index, statuses) for movie in movies],
+		}
+
+	def movie_json(self, movie: Movie, index, statuses: Dict[str, TorrentStatus], detail: bool = False) -> dict:
+		best = select_best_magnet(movie.magnet_links)
+		infohash = infohash_from_magnet(best.url) if best else None
+		data = {
+			'slug': movie.slug,
+			'title': movie.title,
+			'year': movie.year,
+			'genres': list(movie.genres),
+			'imdb_rating': movie.imdb_rating,
+			'imdb_link': movie.imdb_link,
+			'poster': movie.poster.url if movie.poster else None,
+			'qualities': sorted({link.quality for link in movie.magnet_links if link.quality}),
+			'in_library': bool(index and index.contains(movie.title, movie.year, movie.imdb_link)),
+			'torrent': torrent_json(statuses.get(infohash)) if infohash else None,
+		}
+		if detail:
+			data.update(
+				synopsis=movie.synopsis,
+				director=movie.director,
+				cast=list(movie.cast),
+				best_magnet=best.url if best else None,
+				magnet_links=[link._asdict() for link in movie.magnet_links],
+			)
+		return data
+
+
+def make_handler(service: QueryService, token: Optional[str]):
+	class Handler(BaseHTTPRequestHandler):
+		# Keep-alive, so clients polling the API do not reconnect for every query.
+		protocol_version = "HTTP/1.1"
+		# Headers and body go out as separate writes; without this each
+		# response would wait on the client's delayed ACK.
+		disable_nagle_algorithm = True
+
+		def log_message(self, format, *args):  # noqa: A002
+			pass
+
+		def _send(self, status: int, body: bytes, etag: Optional[str] = None) -> None:
+			self.send_response(status)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			if etag:
+				self.send_header("ETag", etag)
+				self.send_header("Cache-Control", "no-cache")
+			self.end_headers()
+			self.wfile.write(body)
+
+		def do_GET(self) -> None:  # noqa: N802
+			if token and self.headers.get("Authorization", "") != f"Bearer {token}":
+				self._send(401, b'{"error":"unauthorized"}')
+				return
+			url = urlparse(self.path)
+			try:
+				status, etag, body = service.get(url.path, parse_qs(url.query), self.path)
+			except Exception:  # noqa: BLE001
+				logger.exception("Query API request failed: {}", self.path)
+				self._send(500, b'{"error":"internal error"}')
+				return
+			if status == 200 and etag in self.headers.get("If-None-Match", ""):
+				self._send(304, b"", etag)
+			else:
+				self._send(status, body, etag if status == 200 else None)
+
+	return Handler
+
+
+class QueryServer(ThreadingHTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	_shared: Optional[QueryServer] = None
+	_shared_lock = threading.Lock()
+
+	@classmethod
+	def shared(cls, service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, token: Optional[str] = None) -> QueryServer:
+		"""One server per process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			if cls._shared is None:
+				cls._shared = serve(service, host, port, token)
+			return cls._shared
+
+
+def serve(service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, token: Optional[str] = None) -> QueryServer:
+	"""Start the API on a background thread; ``port=0`` picks a free port."""
+	server = QueryServer((host, port), make_handler(service, token))
+	threading.Thread(target=server.serve_forever, name="query-api", daemon=True).start()
+	logger.info("Query API listening on http://{}:{}", host, server.server_address[1])
+	return server
+
+
+def from_env(service: QueryService) -> Optional[QueryServer]:
+	"""Start the shared server when ``QUERY_API_PORT`` is set (``QUERY_API_HOST``/``QUERY_API_TOKEN`` optional)."""
+	port = os.getenv("QUERY_API_PORT")
+	if not port:
+		return None
+	return QueryServer.shared(service, os.getenv("QUERY_API_HOST", DEFAULT_HOST), int(port), os.getenv("QUERY_API_TOKEN") or None)
+
+
+@click.command()
+@click.option("--host", default=DEFAULT_HOST, show_default=True)
+@click.option("--port", default=DEFAULT_PORT, show_default=True)
+@click.option("--catalog", "catalog_path", type=click.Path(dir_okay=False, path_type=str), default="out.json", show_default=True)
+@click.option("--token", envvar="QUERY_API_TOKEN", default="", help="Require 'Authorization: Bearer <token>'")
+def main(host: str, port: int, catalog_path: str, token: str) -> None:
+	"""Serve the query API on its own, following the state app.py writes."""
+	service = QueryService(
+		CatalogReloader.shared(Path(catalog_path)),
+		# Without a connection or deluge pool these only re-read the app's files.
+		LibrarySync(LibraryMirror().load(), connect=lambda: None, interval=FOLLOW_INTERVAL).start(),
+		TorrentPoller(TorrentStore(), None, interval=FOLLOW_INTERVAL).start(),
+	)
+	server = serve(service, host, port, token or None)
+	click.echo(f"Query API serving {len(service.catalog.current.catalog)} movies on http://{host}:{server.server_address[1]}")
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,334 @@
+"""Durable queue of movie requests, processed by background worker threads.
+
+Jobs live in the ``request_jobs`` table of the torrent store database, keyed by
+infohash, so a request survives restarts and clicking Request twice (or from
+two sessions) refers to the same job. Jobs wait in the queue until the
+``AdmissionPolicy`` has a download slot and disk space for them.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+
+from loguru import logger
+from pydantic import BaseModel
+
+from admission import NORMAL, AdmissionPolicy, Download, free_space
+from deluge_rpc import DelugeError, DelugePool
+from sizes import DEFAULT_SIZE, GB
+from torrent_poller import TorrentPoller
+from torrent_store import TorrentStore, infohash_from_magnet, normalize_infohash
+
+
+WORKERS = int(os.getenv("REQUEST_WORKERS", "2"))
+MAX_ATTEMPTS = 3
+# A worker adds up to this many queued jobs to deluge in a single round trip.
+BATCH_SIZE = 50
+RETRY_DELAY = timedelta(seconds=10)
+# Workers also wake up this often to pick up retries that have become due.
+IDLE_WAIT = 5.0
+# Downloads without progress for this long no longer hold a download slot.
+STALLED_AFTER = timedelta(minutes=float(os.getenv("STALLED_DOWNLOAD_MINUTES", "120")))
+
+QUEUED = 'queued'
+ADDING = 'adding'
+ADDED = 'added'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_jobs (
+	infohash TEXT PRIMARY KEY,
+	magnet_url TEXT NOT NULL,
+	title TEXT,
+	year INTEGER,
+	username TEXT,
+	priority INTEGER NOT NULL DEFAULT 0,
+	size_bytes INTEGER,
+	state TEXT NOT NULL,
+	attempts INTEGER NOT NULL DEFAULT 0,
+	error TEXT,
+	not_before TEXT NOT NULL,
+	created_at TEXT NOT NULL,
+	updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS request_jobs_state ON request_jobs (state, not_before);
+"""
+# Columns added after the table was first released, created on older databases.
+ADDED_COLUMNS = {
+	'username': "TEXT",
+	'priority': "INTEGER NOT NULL DEFAULT 0",
+	'size_bytes': "INTEGER",
+}
+
+
+class RequestJob(BaseModel):
+	infohash: str
+	magnet_url: str
+	title: Optional[str] = None
+	year: Optional[int] = None
+	username: Optional[str] = None
+	priority: int = NORMAL
+	size_bytes: Optional[int] = None
+	state: str
+	attempts: int = 0
+	error: Optional[str] = None
+	created_at: datetime
+	updated_at: datetime
+
+
+class RequestQueue:
+	"""Adds requested magnets to deluge off the page's thread.
+
+	``submit`` only writes a row and returns. Worker threads claim the queued
+	jobs the admission policy lets start, add them to deluge in one round
+	trip, retry transient failures a few times and hand added torrents to the
+	``TorrentPoller``. A finished download wakes the workers to admit more.
+	"""
+
+	_shared: Optional[RequestQueue] = None
+	_shared_lock = threading.Lock()
+
+	def __init__(self, store: TorrentStore, pool: Optional[DelugePool], poller: TorrentPoller, workers: int = WORKERS, policy: Optional[AdmissionPolicy] = None) -> None:
+		self.store = store
+		self.pool = pool
+		self.poller = poller
+		self.policy = policy or AdmissionPolicy()
+		# Why queued jobs were last held back: 'slot', 'disk' or None.
+		self.waiting_for: Optional[str] = None
+		self._claim_lock = threading.Lock()
+		self._wake = threading.Condition()
+		# Set on submit so a worker that just found the queue empty does not sleep through new work.
+		self._pending = False
+		self._stop = threading.Event()
+		self._threads = [
+			threading.Thread(target=self._run, name=f"request-worker-{number}", daemon=True)
+			for number in range(workers)
+		]
+		with store.connection as connection:
+			connection.executescript(SCHEMA)
+			columns = {row['name'] for row in connection.execute("PRAGMA table_info(request_jobs)")}
+			for name, definition in ADDED_COLUMNS.items():
+				if name not in columns:
+					connection.execute(f"ALTER TABLE request_jobs ADD COLUMN {name} {definition}")
+			# Jobs interrupted mid-add are safe to retry: adding a torrent twice is a no-op.
+			connection.execute("UPDATE request_jobs SET state = ? WHERE state = ?", (QUEUED, ADDING))
+		poller.on_complete(lambda completed: self._notify())
+
+	@classmethod
+	def shared(cls, store: TorrentStore, pool: Optional[DelugePool], poller: TorrentPoller, **kwargs) -> RequestQueue:
+		"""One set of workers per process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			if cls._shared is None:
+				cls._shared = cls(store, pool, poller, **kwargs).start()
+			return cls._shared
+
+	def start(self) -> RequestQueue:
+		for thread in self._threads:
+			thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		with self._wake:
+			self._wake.notify_all()
+		for thread in self._threads:
+			thread.join()
+
+	def submit(self, magnet_url: str, title: Optional[str], year: Optional[int], size_bytes: Optional[int] = None, username: Optional[str] = None, priority: int = NORMAL) -> Optional[RequestJob]:
+		"""Queue a request unless one for the same torrent is already queued or done.
+
+		Failed jobs are queued again. ``size_bytes`` is the estimated download
+		size. Returns the job, or None for a magnet link without an infohash.
+		"""
+		infohash = infohash_from_magnet(magnet_url)
+		return self.submit_many([(magnet_url, title, year, size_bytes)], username, priority).get(infohash) if infohash else None
+
+	def submit_many(self, requests: Iterable[Tuple[str, Optional[str], Optional[int], Optional[int]]], username: Optional[str] = None, priority: int = NORMAL) -> Dict[str, RequestJob]:
+		"""``submit`` for several ``(magnet_url, title, year, size_bytes)`` requests in one transaction."""
+		now = datetime.now().isoformat()
+		rows = []
+		for magnet_url, title, year, size_bytes in requests:
+			infohash = infohash_from_magnet(magnet_url)
+			if infohash:
+				rows.append((infohash, magnet_url, title, int(year) if year else None, username, priority, size_bytes, QUEUED, now, now, now, FAILED))
+		if not rows:
+			return {}
+		with self.store.connection as connection:
+			connection.executemany(
+				"""
+				INSERT INTO request_jobs (infohash, magnet_url, title, year, username, priority, size_bytes, state, attempts, not_before, created_at, updated_at)
+				VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+				ON CONFLICT (infohash) DO UPDATE SET
+					username = excluded.username, priority = excluded.priority, size_bytes = excluded.size_bytes,
+					state = excluded.state, attempts = 0, error = NULL,
+					not_before = excluded.not_before, created_at = excluded.created_at, updated_at = excluded.updated_at
+				WHERE request_jobs.state = ?
+				""",
+				rows,
+			)
+		self._notify()
+		return self.jobs(row[0] for row in rows)
+
+	def _notify(self) -> None:
+		with self._wake:
+			self._pending = True
+			self._wake.notify()
+
+	def job(self, infohash: str) -> Optional[RequestJob]:
+		return self.jobs([infohash]).get(normalize_infohash(infohash))
+
+	def jobs(self, infohashes: Iterable[Optional[str]]) -> Dict[str, RequestJob]:
+		"""Jobs for the given torrents, keyed by infohash, in one query."""
+		keys = list(dict.fromkeys(key for key in map(normalize_infohash, infohashes) if key))
+		if not keys:
+			return {}
+		rows = self.store.connection.execute(
+			f"SELECT * FROM request_jobs WHERE infohash IN ({', '.join('?' * len(keys))})",
+			keys,
+		)
+		return {row['infohash']: RequestJob(**dict(row)) for row in rows}
+
+	def pending(self) -> List[RequestJob]:
+		rows = self.store.connection.execute(
+			"SELECT * FROM request_jobs WHERE state IN (?, ?) ORDER BY created_at",
+			(QUEUED, ADDING),
+		)
+		return [RequestJob(**dict(row)) for row in rows]
+
+	def active(self) -> List[Download]:
+		"""Torrents being added or downloading, with the bytes they still have to write."""
+		stalled_before = (datetime.now() - STALLED_AFTER).isoformat()
+		rows = self.store.connection.execute(
+			"""
+			SELECT torrents.infohash, torrents.completion, request_jobs.username, request_jobs.size_bytes,
+				(SELECT MAX(timestamp) FROM torrent_history WHERE torrent_history.infohash = torrents.infohash) AS progressed_at
+			FROM torrents LEFT JOIN request_jobs USING (infohash)
+			WHERE torrents.status != 'completed' AND torrents.completion < 100
+			UNION ALL
+			SELECT infohash, 0, username, size_bytes, updated_at FROM request_jobs WHERE state = ?
+			""",
+			(ADDING,),
+		).fetchall()
+		rows = list({row['infohash']: row for row in reversed(rows)}.values())
+		infos = {}
+		if self.pool is not None and rows:
+			try:
+				infos = self.pool.status((row['infohash'] for row in rows), keys=['progress', 'total_size'])
+			except DelugeError as exc:
+				logger.warning("Could not get download sizes, using estimates: {}", exc)
+		downloads = []
+		for row in rows:
+			info = infos.get(row['infohash'])
+			if info is not None and info.total_size:
+				remaining = info.total_size * (1 - info.progress / 100)
+			else:
+				remaining = (row['size_bytes'] or DEFAULT_SIZE) * (1 - row['completion'] / 100)
+			stalled = bool(row['progressed_at']) and row['progressed_at'] < stalled_before
+			downloads.append(Download(row['username'], int(remaining), stalled))
+		return downloads
+
+	def _claim(self, limit: int = BATCH_SIZE) -> List[RequestJob]:
+		"""Move up to ``limit`` due jobs the admission policy lets start to ``adding`` and return them.
+
+		Jobs that cannot fit on the download disk even when it is idle are failed.
+		"""
+		now = datetime.now()
+		claimed = []
+		with self._claim_lock:
+			queued = [
+				RequestJob(**dict(row))
+				for row in self.store.connection.execute(
+					"SELECT * FROM request_jobs WHERE state = ? AND not_before <= ? ORDER BY created_at",
+					(QUEUED, now.isoformat()),
+				)
+			]
+			if not queued:
+				self.waiting_for = None
+				return []
+			free_bytes = free_space()
+			admission = self.policy.select(queued, self.active(), free_bytes, now)
+			self.waiting_for = admission.waiting_for
+			for job in admission.too_large:
+				logger.warning("Not adding {}: it needs about {:.1f} GB and the download disk has {:.1f} GB free", job.title, (job.size_bytes or DEFAULT_SIZE) / GB, free_bytes / GB)
+				self._finish(job, FAILED, f"Not enough disk space (needs about {(job.size_bytes or DEFAULT_SIZE) / GB:.1f} GB)")
+			with self.store.connection as connection:
+				for job in admission.admitted[:limit]:
+					updated = connection.execute(
+						"UPDATE request_jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE infohash = ? AND state = ?",
+						(ADDING, now.isoformat(), job.infohash, QUEUED),
+					).rowcount
+					if updated:
+						claimed.append(job.model_copy(update={'state': ADDING, 'attempts': job.attempts + 1}))
+		return claimed
+
+	def _finish(self, job: RequestJob, state: str, error: Optional[str] = None, delay: timedelta = timedelta()) -> None:
+		now = datetime.now()
+		with self.store.connection as connection:
+			connection.execute(
+				"UPDATE request_jobs SET state = ?, error = ?, not_before = ?, updated_at = ? WHERE infohash = ?",
+				(state, error, (now + delay).isoformat(), now.isoformat(), job.infohash),
+			)
+
+	def _retry_or_fail(self, job: RequestJob, error: Exception) -> None:
+		if job.attempts < MAX_ATTEMPTS:
+			logger.warning("Adding {} failed (attempt {}), retrying: {}", job.title, job.attempts, error)
+			self._finish(job, QUEUED, str(error), delay=RETRY_DELAY * job.attempts)
+		else:
+			logger.error("Adding {} failed: {}", job.title, error)
+			self._finish(job, FAILED, str(error))
+
+	def process(self, jobs: List[RequestJob]) -> None:
+		"""Add a batch of jobs to deluge with one add round trip and one status round trip."""
+		if self.pool is None:
+			for job in jobs:
+				self._finish(job, FAILED, "Deluge credentials not configured")
+			return
+		try:
+			results = self.pool.add_magnets([job.magnet_url for job in jobs])
+			added = [(job, infohash) for job, infohash in zip(jobs, results) if isinstance(infohash, str)]
+			infos = self.pool.status(infohash for _, infohash in added)
+		except DelugeError as exc:
+			for job in jobs:
+				self._retry_or_fail(job, exc)
+			return
+		for job, result in zip(jobs, results):
+			if isinstance(result, DelugeError):
+				self._retry_or_fail(job, result)
+		if not added:
+			return
+		self.poller.track_many([
+			dict(
+				infohash=infohash,
+				title=job.title,
+				year=job.year,
+				completion=round(infos[infohash].progress, 2) if infohash in infos else 0,
+				status='added',
+			)
+			for job, infohash in added
+		])
+		for job, _ in added:
+			self._finish(job, ADDED)
+		logger.info("Added {} torrents: {}", len(added), ", ".join(f"{job.title} ({job.year})" for job, _ in added))
+
+	def _run(self) -> None:
+		while not self._stop.is_set():
+			try:
+				jobs = self._claim()
+			except Exception as exc:  # noqa: BLE001
+				logger.warning("Claiming request jobs failed: {}", exc)
+				jobs = []
+			if not jobs:
+				with self._wake:
+					if not self._pending:
+						self._wake.wait(IDLE_WAIT)
+					self._pending = False
+				continue
+			try:
+				self.process(jobs)
+			except Exception as exc:  # noqa: BLE001
+				logger.exception("Request jobs crashed: {}", ", ".join(str(job.title) for job in jobs))
+				for job in jobs:
+					self._finish(job, FAILED, str(exc))
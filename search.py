@@ -0,0 +1,200 @@
+"""Ranked, typo-tolerant search over catalog text fields.
+
+Each field keeps an inverted index from folded tokens to the rows containing
+them, a sorted vocabulary for prefix (search-as-you-type) lookups, and a
+trigram index over the vocabulary for substring and fuzzy matches. A query
+only touches the postings of the vocabulary entries it matches.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence
+import re
+import unicodedata
+
+import numpy as np
+
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+# Score given to a query token for each kind of match; the best one wins.
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+SUBSTRING_SCORE = 0.6
+FUZZY_SCORE = 0.5
+# Tokens shorter than this are never matched as typos; too many short words are one edit apart.
+FUZZY_MIN_LENGTH = 4
+# Bonus for rows where a value starts with the first query token (e.g. "matr" -> "Matrix Reloaded").
+LEADING_BONUS = 0.5
+
+
+def fold(text: str) -> str:
+	"""Lowercase, strip accents and collapse punctuation to spaces."""
+	decomposed = unicodedata.normalize("NFKD", text)
+	stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+	return NON_WORD_PATTERN.sub(" ", stripped.casefold()).strip()
+
+
+def trigrams(token: str) -> set:
+	return {token[index:index + 3] for index in range(len(token) - 2)}
+
+
+def deletion_variants(token: str) -> set:
+	"""The token plus every string one deletion away from it.
+
+	Two tokens within one insertion, deletion, substitution or adjacent
+	transposition of each other always share a variant.
+	"""
+	variants = {token}
+	for index in range(len(token)):
+		variants.add(token[:index] + token[index + 1:])
+	return variants
+
+
+class FieldIndex:
+	"""Search index over one text field (a field may hold several values per row, e.g. cast)."""
+
+	def __init__(self, values: Sequence[Iterable[str]]) -> None:
+		self.size = len(values)
+		postings: Dict[str, List[int]] = {}
+		leading: Dict[str, List[int]] = {}
+		for row, row_values in enumerate(values):
+			for value in row_values:
+				tokens = fold(value).split() if value else []
+				for index, token in enumerate(tokens):
+					for target in (postings, leading) if index == 0 else (postings,):
+						rows = target.setdefault(token, [])
+						if not rows or rows[-1] != row:
+							rows.append(row)
+
+		self.vocabulary = sorted(postings)
+		self.postings = [np.asarray(postings[token], dtype=np.int32) for token in self.vocabulary]
+		self.leading_vocabulary = sorted(leading)
+		self.leading_postings = [np.asarray(leading[token], dtype=np.int32) for token in self.leading_vocabulary]
+
+		trigram_index: Dict[str, List[int]] = {}
+		variant_hashes: List[int] = []
+		variant_tokens: List[int] = []
+		for token_id, token in enumerate(self.vocabulary):
+			for gram in trigrams(token):
+				trigram_index.setdefault(gram, []).append(token_id)
+			if len(token) >= FUZZY_MIN_LENGTH:
+				for variant in deletion_variants(token):
+					variant_hashes.append(hash(variant))
+					variant_tokens.append(token_id)
+		self.trigram_postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in trigram_index.items()}
+
+		# Deletion variants are stored as sorted 64-bit hashes rather than strings,
+		# which keeps the typo index to a few bytes per variant.
+		hashes = np.asarray(variant_hashes, dtype=np.int64)
+		order = np.argsort(hashes, kind='stable')
+		self.variant_hashes = hashes[order]
+		self.variant_tokens = np.asarray(variant_tokens, dtype=np.int32)[order]
+
+	@staticmethod
+	def _prefix_range(vocabulary: List[str], token: str) -> range:
+		start = bisect_left(vocabulary, token)
+		end = bisect_left(vocabulary, token + "\uffff", start)
+		return range(start, end)
+
+	def _substring_ids(self, token: str) -> List[int]:
+		"""Vocabulary entries containing ``token``, found through its trigrams."""
+		grams = trigrams(token)
+		gram_postings = [self.trigram_postings.get(gram) for gram in grams]
+		if any(ids is None for ids in gram_postings):
+			return []
+		gram_postings.sort(key=len)
+		candidates = gram_postings[0]
+		for ids in gram_postings[1:]:
+			candidates = np.intersect1d(candidates, ids, assume_unique=True)
+			if not len(candidates):
+				return []
+		return [token_id for token_id in candidates.tolist() if token in self.vocabulary[token_id]]
+
+	def _fuzzy_ids(self, token: str) -> set:
+		"""Vocabulary entries about one edit away from ``token``."""
+		found = set()
+		for variant in deletion_variants(token):
+			key = hash(variant)
+			start = np.searchsorted(self.variant_hashes, key, side='left')
+			end = np.searchsorted(self.variant_hashes, key, side='right')
+			if end > start:
+				found.update(self.variant_tokens[start:end].tolist())
+		return found
+
+	def _token_matches(self, token: str) -> Dict[int, float]:
+		"""Vocabulary entries matching one query token, with their match score."""
+		matches: Dict[int, float] = {}
+		for token_id in self._prefix_range(self.vocabulary, token):
+			matches[token_id] = EXACT_SCORE if self.vocabulary[token_id] == token else PREFIX_SCORE
+		if len(token) >= 3:
+			for token_id in self._substring_ids(token):
+				matches.setdefault(token_id, SUBSTRING_SCORE)
+		if len(token) >= FUZZY_MIN_LENGTH:
+			for token_id in self._fuzzy_ids(token):
+				matches.setdefault(token_id, FUZZY_SCORE)
+		return matches
+
+	def scores(self, query: str) -> Optional[np.ndarray]:
+		"""Relevance per row (0 for rows that miss any query token); None for an empty query."""
+		tokens = fold(query).split()
+		if not tokens:
+			return None
+		total = np.zeros(self.size, dtype=np.float32)
+		matched = np.ones(self.size, dtype=bool)
+		for token in dict.fromkeys(tokens):
+			token_scores = np.zeros(self.size, dtype=np.float32)
+			for token_id, score in self._token_matches(token).items():
+				rows = self.postings[token_id]
+				token_scores[rows] = np.maximum(token_scores[rows], score)
+			matched &= token_scores > 0
+			total += token_scores
+		leading = np.zeros(self.size, dtype=bool)
+		for token_id in self._prefix_range(self.leading_vocabulary, tokens[0]):
+			leading[self.leading_postings[token_id]] = True
+		total[leading] += LEADING_BONUS
+		total[~matched] = 0
+		return total
+
+
+class CatalogSearch:
+	"""Title, cast and director search over the catalog, built once per load."""
+
+	def __init__(self, media: Sequence) -> None:
+		self.size = len(media)
+		self.title = FieldIndex([(movie.title or '',) for movie in media])
+		self.cast = FieldIndex([movie.cast for movie in media])
+		self.director = FieldIndex([(movie.director or '',) for movie in media])
+
+	def scores(self, title: str = '', cast: str = '', director: str = '') -> Optional[np.ndarray]:
+		"""Combined relevance per row (0 where any non-empty query misses); None when all are empty."""
+		total = None
+		for field, query in ((self.title, title), (self.cast, cast), (self.director, director)):
+			scores = field.scores(query) if query else None
+			if scores is None:
+				continue
+			if total is None:
+				total = scores
+			else:
+				total = np.where((total > 0) & (scores > 0), total + scores, 0)
+		return total
+
+	@staticmethod
+	def rank(total: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+		"""Rows with a positive score (and in ``mask``), best match first."""
+		hits = total > 0
+		if mask is not None:
+			hits &= mask
+		rows = np.flatnonzero(hits)
+		# Highest score first; ties keep catalog order.
+		return rows[np.argsort(-total[rows], kind='stable')]
+
+	def search(self, title: str = '', cast: str = '', director: str = '', mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+		"""Rows matching every non-empty query, best match first.
+
+		Returns None when all queries are empty, so callers can keep their own
+		ordering. ``mask`` restricts results to rows already selected by filters.
+		"""
+		total = self.scores(title=title, cast=cast, director=director)
+		return None if total is None else self.rank(total, mask)
@@ -0,0 +1,175 @@
+"""Precomputed "more like this" neighbours for every catalog movie.
+
+Each movie is a sparse feature vector over its genres, director, cast and a
+five-year release bucket. Features are weighted by how rare they are
+(inverse document frequency) and rows are normalised to unit length, so the
+dot product of two movies is their cosine similarity.
+
+Comparing every pair would be quadratic. As in the search index, candidates
+come from the postings of the rare features (people), plus the best-rated
+movies with the same genres and release bucket, and only those pairs are
+scored. Rows are processed in batches with NumPy, and the best few
+neighbours per movie are kept, so showing them is a plain lookup.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+
+NEIGHBOURS = 8
+YEAR_BUCKET = 5
+# Best-rated movies with the same genres and year bucket, always scored as candidates.
+GROUP_CANDIDATES = 32
+BATCH_ROWS = 4096
+FEATURE_WEIGHTS = {'genre': 1.0, 'year': 0.5, 'director': 1.5, 'cast': 1.0}
+# Few distinct values, shared by many movies: kept as dense columns instead of postings.
+DENSE_KINDS = ('genre', 'year')
+# People credited on more movies than this still count towards a pair's
+# score, but do not make every pair of their movies a candidate.
+POSTINGS_LIMIT = 500
+
+
+class SparseRows(NamedTuple):
+	"""Feature entries in row order, with where each row's entries start."""
+
+	rows: np.ndarray
+	features: np.ndarray
+	weights: np.ndarray
+	starts: np.ndarray
+
+	@classmethod
+	def build(cls, rows: np.ndarray, features: np.ndarray, weights: np.ndarray, size: int) -> SparseRows:
+		return cls(rows, features, weights, np.searchsorted(rows, np.arange(size + 1)))
+
+	def expand(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		"""``(owner, entry)``: the entries of each of ``rows``, with the position in ``rows`` they belong to."""
+		counts = self.starts[rows + 1] - self.starts[rows]
+		ends = np.cumsum(counts)
+		entries = np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - counts - self.starts[rows], counts)
+		return np.repeat(np.arange(len(rows)), counts), entries
+
+
+class SimilarMovies:
+	"""Nearest neighbours of every movie, built once per catalog load.
+
+	``neighbours[row]`` holds the most similar rows, best first, padded with -1.
+	"""
+
+	def __init__(self, media: Sequence, neighbours: int = NEIGHBOURS) -> None:
+		self.size = len(media)
+		self.neighbours = np.full((self.size, neighbours), -1, dtype=np.int32)
+		if self.size < 2:
+			return
+
+		feature_ids: Dict[Tuple[str, object], int] = {}
+		group_ids: Dict[Tuple, int] = {}
+		entry_rows: List[int] = []
+		entry_features: List[int] = []
+		groups = np.empty(self.size, dtype=np.int32)
+		self.ratings = np.zeros(self.size, dtype=np.float32)
+		for row, movie in enumerate(media):
+			bucket = movie.year // YEAR_BUCKET if movie.year else None
+			keys = {('genre', genre) for genre in movie.genres}
+			keys.update(('cast', name) for name in movie.cast if name)
+			if movie.director:
+				keys.add(('director', movie.director))
+			if bucket is not None:
+				keys.add(('year', bucket))
+			for key in keys:
+				entry_rows.append(row)
+				entry_features.append(feature_ids.setdefault(key, len(feature_ids)))
+			groups[row] = group_ids.setdefault((tuple(sorted(set(movie.genres))), bucket), len(group_ids))
+			self.ratings[row] = movie.imdb_rating or 0
+
+		rows = np.asarray(entry_rows, dtype=np.int32)
+		features = np.asarray(entry_features, dtype=np.int32)
+		kinds = [kind for kind, _ in feature_ids]
+		self.feature_count = len(feature_ids)
+		frequency = np.bincount(features, minlength=self.feature_count)
+		idf = np.log(self.size / frequency).astype(np.float32) + 1
+		weights = (np.asarray([FEATURE_WEIGHTS[kind] for kind in kinds], dtype=np.float32) * idf)[features]
+		norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=self.size)).astype(np.float32)
+		weights /= norms[rows]
+
+		# Genres and year buckets as a dense (movies x features) matrix.
+		is_dense = np.asarray([kind in DENSE_KINDS for kind in kinds])
+		dense_columns = np.cumsum(is_dense) - 1
+		dense_entries = is_dense[features]
+		self.dense = np.zeros((self.size, int(is_dense.sum())), dtype=np.float32)
+		self.dense[rows[dense_entries], dense_columns[features[dense_entries]]] = weights[dense_entries]
+
+		# People as sparse rows (entries are already in row order); the rare ones also as postings.
+		frequent = ~dense_entries & (frequency[features] > POSTINGS_LIMIT)
+		rare = ~dense_entries & ~frequent
+		self.rare = SparseRows.build(rows[rare], features[rare], weights[rare], self.size)
+		order = np.argsort(self.rare.features, kind='stable')
+		self.postings = SparseRows.build(self.rare.features[order], self.rare.rows[order], self.rare.weights[order], self.feature_count)
+		self.frequent = SparseRows.build(rows[frequent], features[frequent], weights[frequent], self.size)
+		keys = self.frequent.rows.astype(np.int64) * self.feature_count + self.frequent.features
+		order = np.argsort(keys)
+		self.frequent_keys, self.frequent_weights = keys[order], self.frequent.weights[order]
+
+		# Best-rated members of every genres-and-bucket group.
+		by_group = np.lexsort((-self.ratings, groups))
+		group_starts = np.searchsorted(groups[by_group], np.arange(len(group_ids)))
+		rank = np.arange(self.size) - group_starts[groups[by_group]]
+		group_top = np.full((len(group_ids), GROUP_CANDIDATES), -1, dtype=np.int32)
+		kept = rank < GROUP_CANDIDATES
+		group_top[groups[by_group][kept], rank[kept]] = by_group[kept]
+
+		for start in range(0, self.size, BATCH_ROWS):
+			stop = min(self.size, start + BATCH_ROWS)
+			self._score_batch(np.arange(start, stop, dtype=np.int32), group_top[groups[start:stop]])
+		# Only the neighbour table outlives the build.
+		del self.ratings, self.dense, self.rare, self.postings, self.frequent, self.frequent_keys, self.frequent_weights
+
+	def _score_batch(self, batch: np.ndarray, group_candidates: np.ndarray) -> None:
+		# Every (row, other) pair sharing a rare person, with that person's share of the dot product.
+		owners, entries = self.rare.expand(batch)
+		matches, postings = self.postings.expand(self.rare.features[entries])
+		pair_rows = self.rare.rows[entries][matches]
+		pair_others = self.postings.features[postings]
+		pair_scores = self.rare.weights[entries][matches] * self.postings.weights[postings]
+
+		group_rows = np.repeat(batch, group_candidates.shape[1])
+		group_others = group_candidates.ravel()
+		present = group_others >= 0
+		pair_rows = np.concatenate((pair_rows, group_rows[present]))
+		pair_others = np.concatenate((pair_others, group_others[present]))
+		pair_scores = np.concatenate((pair_scores, np.zeros(int(present.sum()), dtype=np.float32)))
+
+		# Sum per pair, then add the genre, year and prolific people parts of the dot product.
+		keys, inverse = np.unique(pair_rows.astype(np.int64) * self.size + pair_others, return_inverse=True)
+		scores = np.bincount(inverse.ravel(), weights=pair_scores, minlength=len(keys))
+		rows = (keys // self.size).astype(np.int32)
+		others = (keys % self.size).astype(np.int32)
+		scores += np.einsum('ij,ij->i', self.dense[rows], self.dense[others])
+		scores += self._frequent_scores(rows, others)
+		useful = (rows != others) & (scores > 0)
+		rows, others, scores = rows[useful], others[useful], scores[useful]
+
+		# Best first per row; equal scores go to the better-rated movie.
+		order = np.lexsort((-self.ratings[others], -scores, rows))
+		rows, others = rows[order], others[order]
+		rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+		kept = rank < self.neighbours.shape[1]
+		self.neighbours[rows[kept], rank[kept]] = others[kept]
+
+	def _frequent_scores(self, rows: np.ndarray, others: np.ndarray) -> np.ndarray:
+		"""Dot product of each pair over the prolific people only."""
+		pairs, entries = self.frequent.expand(rows)
+		if not len(entries):
+			return np.zeros(len(rows))
+		lookup = others[pairs].astype(np.int64) * self.feature_count + self.frequent.features[entries]
+		positions = np.minimum(np.searchsorted(self.frequent_keys, lookup), len(self.frequent_keys) - 1)
+		found = self.frequent_keys[positions] == lookup
+		shared = self.frequent.weights[entries[found]] * self.frequent_weights[positions[found]]
+		return np.bincount(pairs[found], weights=shared, minlength=len(rows))
+
+	def rows(self, row: int) -> np.ndarray:
+		"""Catalog rows most like ``row``, best first."""
+		neighbours = self.neighbours[row]
+		return neighbours[neighbours >= 0]
@@ -0,0 +1,70 @@
+"""Download size estimates for requested releases.
+
+A magnet link may carry the exact length (``xl``); otherwise the mirrored
+``.torrent`` file gives the total size of its files, and failing both a
+typical size for the release's quality is used.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+
+GB = 1024 ** 3
+# Typical release sizes, for magnets without an exact length and no .torrent file.
+QUALITY_SIZES = {'2160p': 5 * GB, '1080p': 2 * GB, '720p': GB, '480p': GB // 2, '3D': 2 * GB}
+DEFAULT_SIZE = 2 * GB
+
+
+def bdecode(data: bytes, index: int = 0) -> Tuple[object, int]:
+	"""Decode one bencoded value starting at ``index``; returns it and the index after it."""
+	kind = data[index:index + 1]
+	if kind == b'i':
+		end = data.index(b'e', index)
+		return int(data[index + 1:end]), end + 1
+	if kind in (b'l', b'd'):
+		items = []
+		index += 1
+		while data[index:index + 1] != b'e':
+			item, index = bdecode(data, index)
+			items.append(item)
+		if kind == b'l':
+			return items, index + 1
+		return dict(zip(items[::2], items[1::2])), index + 1
+	colon = data.index(b':', index)
+	end = colon + 1 + int(data[index:colon])
+	return data[colon + 1:end], end
+
+
+def torrent_size(path: Path) -> Optional[int]:
+	"""Total size of the files described by a ``.torrent`` file."""
+	try:
+		meta, _ = bdecode(path.read_bytes())
+		info = meta[b'info']
+		if b'length' in info:
+			return int(info[b'length'])
+		return sum(int(entry[b'length']) for entry in info[b'files'])
+	except (OSError, ValueError, KeyError, TypeError, IndexError) as exc:
+		logger.debug("Could not read the size from {}: {}", path, exc)
+		return None
+
+
+def magnet_size(magnet_url: str) -> Optional[int]:
+	"""The exact length (``xl``) a magnet link may carry."""
+	values = parse_qs(urlsplit(magnet_url).query).get('xl')
+	try:
+		return int(values[0]) if values else None
+	except ValueError:
+		return None
+
+
+def estimate_size(magnet_url: str, torrent_path: Optional[Path] = None, quality: Optional[str] = None) -> int:
+	"""Bytes a request will take on disk: from the magnet, its .torrent file, or its quality."""
+	size = magnet_size(magnet_url)
+	if size is None and torrent_path is not None:
+		size = torrent_size(Path(torrent_path))
+	return size if size else QUALITY_SIZES.get(quality or '', DEFAULT_SIZE)
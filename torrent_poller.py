@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, List, Optional
+import os
+import threading
+import time
+
+from loguru import logger
+
+from deluge_rpc import DelugeError, DelugePool
+from torrent_store import TorrentStatus, TorrentStore, normalize_infohash
+
+
+POLL_INTERVAL = float(os.getenv("TORRENT_POLL_INTERVAL", "10"))
+# History older than the store's retention is dropped this often (seconds).
+COMPACT_INTERVAL = 3600.0
+
+
+class TorrentPoller:
+	"""Refreshes the progress of unfinished torrents from a background thread.
+
+	``statuses`` maps each tracked infohash to its latest ``TorrentStatus``.
+	The dict is replaced after every poll rather than mutated, so page renders
+	read it without locking and never wait on deluge. Without a deluge pool
+	it only re-reads the store, which another process may be updating.
+	Callbacks registered with ``on_complete`` are called from the poller
+	thread with the torrents each poll found finished.
+	"""
+
+	_shared: Optional[TorrentPoller] = None
+	_shared_lock = threading.Lock()
+
+	def __init__(self, store: TorrentStore, pool: Optional[DelugePool], interval: float = POLL_INTERVAL) -> None:
+		self.store = store
+		self.pool = pool
+		self.interval = interval
+		self.statuses: Dict[str, TorrentStatus] = store.all()
+		self.last_error: Optional[str] = None
+		self._listeners: List[Callable[[List[TorrentStatus]], None]] = []
+		self._publish_lock = threading.Lock()
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="torrent-poller", daemon=True)
+
+	@classmethod
+	def shared(cls, store: TorrentStore, pool: Optional[DelugePool], **kwargs) -> TorrentPoller:
+		"""One running poller per process, surviving Streamlit cache clears."""
+		with cls._shared_lock:
+			if cls._shared is None:
+				cls._shared = cls(store, pool, **kwargs).start()
+			return cls._shared
+
+	def start(self) -> TorrentPoller:
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		self._wake.set()
+		self._thread.join()
+
+	def refresh_now(self) -> None:
+		"""Ask the background thread to poll without waiting for the interval."""
+		self._wake.set()
+
+	def on_complete(self, callback: Callable[[List[TorrentStatus]], None]) -> None:
+		"""Register ``callback``; registering the same one again is a no-op."""
+		if callback not in self._listeners:
+			self._listeners.append(callback)
+
+	def get(self, infohashes: Iterable[Optional[str]]) -> Dict[str, TorrentStatus]:
+		statuses = self.statuses
+		return {key: statuses[key] for key in map(normalize_infohash, infohashes) if key in statuses}
+
+	def track(self, infohash: str, title: Optional[str], year: Optional[int], completion: float, status: str = 'added') -> None:
+		"""Record a newly requested torrent so it shows up (and is polled) right away."""
+		self.track_many([dict(infohash=infohash, title=title, year=year, completion=completion, status=status)])
+
+	def track_many(self, torrents: List[dict]) -> None:
+		"""``track`` for several torrents, written in one transaction."""
+		self.store.record_many(torrents)
+		self._publish(self.store.latest_many(torrent['infohash'] for torrent in torrents))
+		self.refresh_now()
+
+	def _publish(self, updates: Dict[str, TorrentStatus]) -> None:
+		with self._publish_lock:
+			statuses = dict(self.statuses)
+			statuses.update(updates)
+			self.statuses = statuses
+
+	def poll_once(self) -> int:
+		"""Refresh every unfinished torrent with one deluge call; returns the number updated."""
+		if self.pool is None:
+			latest = self.store.all()
+			if latest != self.statuses:
+				self.statuses = latest
+			return 0
+		active = self.store.active()
+		if not active:
+			return 0
+		try:
+			infos = self.pool.status(torrent.infohash for torrent in active)
+		except DelugeError as exc:
+			self.last_error = str(exc)
+			logger.warning("Torrent status poll failed: {}", exc)
+			return 0
+		self.last_error = None
+
+		updates = []
+		completed = []
+		for torrent in active:
+			info = infos.get(torrent.infohash)
+			if info is None or info.progress >= 100:
+				# Finished torrents are moved out of deluge's view or report 100%.
+				updates.append(dict(infohash=torrent.infohash, completion=100, status='completed'))
+				completed.append(torrent.infohash)
+				logger.info("Torrent completed: {} ({})", torrent.title, torrent.year)
+			else:
+				updates.append(dict(infohash=torrent.infohash, completion=round(info.progress, 2), status='downloading'))
+		self.store.record_many(updates)
+		latest = self.store.latest_many(torrent.infohash for torrent in active)
+		self._publish(latest)
+		if completed:
+			self._notify([latest[infohash] for infohash in completed if infohash in latest])
+		return len(updates)
+
+	def _notify(self, completed: List[TorrentStatus]) -> None:
+		for callback in self._listeners:
+			try:
+				callback(completed)
+			except Exception:  # noqa: BLE001
+				logger.exception("Completion callback {} failed", getattr(callback, '__qualname__', callback))
+
+	def _run(self) -> None:
+		# The store was compacted when it was opened.
+		compacted_at = time.monotonic()
+		while not self._stop.is_set():
+			try:
+				self.poll_once()
+			except Exception as exc:  # noqa: BLE001
+				self.last_error = str(exc)
+				logger.warning("Torrent status poll failed: {}", exc)
+			# Only the poller writing the history trims it.
+			if self.pool is not None and time.monotonic() - compacted_at >= COMPACT_INTERVAL:
+				compacted_at = time.monotonic()
+				try:
+					removed = self.store.compact()
+					if removed:
+						logger.info("Dropped {} torrent history rows past retention", removed)
+				except Exception as exc:  # noqa: BLE001
+					logger.warning("Compacting torrent history failed: {}", exc)
+			self._wake.wait(self.interval)
+			self._wake.clear()
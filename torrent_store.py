@@ -0,0 +1,244 @@
+"""SQLite store for requested torrents and their download progress.
+
+``torrents`` holds the latest state of each torrent, keyed by infohash, and
+``torrent_history`` keeps the progress samples behind it for a limited time.
+The database runs in WAL mode so the page can read while status updates are
+being written.
+"""
+
+from __future__ import annotations
+
+from base64 import b32decode
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import csv
+import re
+import sqlite3
+import threading
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+STORE_FILE = Path("torrents.db")
+LEGACY_CSV_FILE = Path("torrent_tracking.csv")
+HISTORY_RETENTION = timedelta(days=30)
+# Keeps IN (...) lookups below SQLite's bound-parameter limit.
+LOOKUP_CHUNK = 500
+
+BTIH_PATTERN = re.compile(r"urn:btih:([0-9a-zA-Z]{32,40})")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS torrents (
+	infohash TEXT PRIMARY KEY,
+	title TEXT,
+	year INTEGER,
+	completion REAL NOT NULL DEFAULT 0,
+	status TEXT NOT NULL,
+	updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS torrents_status ON torrents (status);
+CREATE TABLE IF NOT EXISTS torrent_history (
+	id INTEGER PRIMARY KEY,
+	infohash TEXT NOT NULL,
+	timestamp TEXT NOT NULL,
+	completion REAL NOT NULL,
+	status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS torrent_history_infohash ON torrent_history (infohash, timestamp);
+CREATE INDEX IF NOT EXISTS torrent_history_timestamp ON torrent_history (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+	key TEXT PRIMARY KEY,
+	value TEXT
+);
+"""
+
+
+def normalize_infohash(infohash: Optional[str]) -> Optional[str]:
+	"""Lowercase hex infohash; base32 hashes (32 chars) are converted."""
+	if not infohash or infohash == 'unknown':
+		return None
+	if len(infohash) == 32:
+		try:
+			return b32decode(infohash.upper()).hex()
+		except ValueError:
+			return None
+	return infohash.lower()
+
+
+def infohash_from_magnet(url: Optional[str]) -> Optional[str]:
+	match = BTIH_PATTERN.search(url or "")
+	return normalize_infohash(match.group(1)) if match else None
+
+
+class TorrentStatus(BaseModel):
+	infohash: str
+	title: Optional[str] = None
+	year: Optional[int] = None
+	completion: float = 0.0
+	status: str
+	updated_at: datetime
+
+	@property
+	def is_complete(self) -> bool:
+		return self.completion >= 100 or self.status == 'completed'
+
+
+class TorrentStore:
+	"""Latest torrent state plus a bounded history, shared by all sessions.
+
+	SQLite connections cannot be shared between threads, and Streamlit runs
+	each session on its own thread, so every thread gets its own connection.
+	"""
+
+	_shared: Dict[Path, TorrentStore] = {}
+	_shared_lock = threading.Lock()
+
+	def __init__(self, path: Path = STORE_FILE, retention: timedelta = HISTORY_RETENTION) -> None:
+		self.path = path
+		self.retention = retention
+		self._local = threading.local()
+		self.connection.executescript(SCHEMA)
+
+	@classmethod
+	def shared(cls, path: Path = STORE_FILE) -> TorrentStore:
+		"""One store per file and process, surviving Streamlit cache clears; imports the legacy CSV on first use."""
+		with cls._shared_lock:
+			store = cls._shared.get(path)
+			if store is None:
+				store = cls(path)
+				store.import_csv()
+				store.compact()
+				cls._shared[path] = store
+			return store
+
+	@property
+	def connection(self) -> sqlite3.Connection:
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = sqlite3.connect(self.path, timeout=10)
+			connection.row_factory = sqlite3.Row
+			connection.execute("PRAGMA journal_mode=WAL")
+			connection.execute("PRAGMA synchronous=NORMAL")
+			self._local.connection = connection
+		return connection
+
+	def _write(self, connection: sqlite3.Connection, infohash: str, title: Optional[str], year: Optional[int], completion: float, status: str, at: str) -> None:
+		previous = connection.execute("SELECT completion, status FROM torrents WHERE infohash = ?", (infohash,)).fetchone()
+		connection.execute(
+			"""
+			INSERT INTO torrents (infohash, title, year, completion, status, updated_at)
+			VALUES (?, ?, ?, ?, ?, ?)
+			ON CONFLICT (infohash) DO UPDATE SET
+				title = COALESCE(excluded.title, title),
+				year = COALESCE(excluded.year, year),
+				completion = excluded.completion,
+				status = excluded.status,
+				updated_at = excluded.updated_at
+			""",
+			(infohash, title, year, completion, status, at),
+		)
+		# Unchanged samples are not kept, so idle torrents do not grow the history.
+		if previous is None or (previous['completion'], previous['status']) != (completion, status):
+			connection.execute(
+				"INSERT INTO torrent_history (infohash, timestamp, completion, status) VALUES (?, ?, ?, ?)",
+				(infohash, at, completion, status),
+			)
+
+	def record(self, infohash: str, title: Optional[str], year: Optional[int], completion: float, status: str, at: Optional[datetime] = None) -> None:
+		self.record_many([dict(infohash=infohash, title=title, year=year, completion=completion, status=status, at=at)])
+
+	def record_many(self, updates: Iterable[dict]) -> None:
+		"""Record several status updates in one transaction."""
+		now = datetime.now().isoformat()
+		with self.connection as connection:
+			for update in updates:
+				infohash = normalize_infohash(update['infohash'])
+				if infohash is None:
+					continue
+				at = update.get('at')
+				self._write(
+					connection,
+					infohash,
+					update.get('title'),
+					int(update['year']) if update.get('year') else None,
+					float(update.get('completion') or 0),
+					update['status'],
+					at.isoformat() if at else now,
+				)
+
+	def latest(self, infohash: str) -> Optional[TorrentStatus]:
+		return self.latest_many([infohash]).get(normalize_infohash(infohash))
+
+	def latest_many(self, infohashes: Iterable[Optional[str]]) -> Dict[str, TorrentStatus]:
+		"""Latest status of each known torrent among ``infohashes``, keyed by normalised infohash."""
+		keys = list(dict.fromkeys(key for key in map(normalize_infohash, infohashes) if key))
+		found: Dict[str, TorrentStatus] = {}
+		for start in range(0, len(keys), LOOKUP_CHUNK):
+			chunk = keys[start:start + LOOKUP_CHUNK]
+			rows = self.connection.execute(
+				f"SELECT * FROM torrents WHERE infohash IN ({', '.join('?' * len(chunk))})",
+				chunk,
+			)
+			for row in rows:
+				found[row['infohash']] = TorrentStatus(**dict(row))
+		return found
+
+	def all(self) -> Dict[str, TorrentStatus]:
+		return {row['infohash']: TorrentStatus(**dict(row)) for row in self.connection.execute("SELECT * FROM torrents")}
+
+	def active(self) -> List[TorrentStatus]:
+		"""Torrents that have not completed yet."""
+		rows = self.connection.execute("SELECT * FROM torrents WHERE status != 'completed' AND completion < 100")
+		return [TorrentStatus(**dict(row)) for row in rows]
+
+	def history(self, infohash: str) -> List[dict]:
+		rows = self.connection.execute(
+			"SELECT timestamp, completion, status FROM torrent_history WHERE infohash = ? ORDER BY timestamp",
+			(normalize_infohash(infohash),),
+		)
+		return [dict(row) for row in rows]
+
+	def compact(self) -> int:
+		"""Drop history older than the retention period; returns the rows removed."""
+		cutoff = (datetime.now() - self.retention).isoformat()
+		with self.connection as connection:
+			removed = connection.execute("DELETE FROM torrent_history WHERE timestamp < ?", (cutoff,)).rowcount
+		return removed
+
+	def import_csv(self, path: Path = LEGACY_CSV_FILE) -> int:
+		"""Import the old ``torrent_tracking.csv`` once; returns the rows imported."""
+		connection = self.connection
+		if connection.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone() or not path.exists():
+			return 0
+		with path.open('r', newline='') as handle:
+			rows = list(csv.DictReader(handle))
+		rows.sort(key=lambda row: row.get('timestamp') or '')
+		with connection:
+			count = 0
+			for row in rows:
+				infohash = normalize_infohash(row.get('torrent_id'))
+				if infohash is None:
+					continue
+				try:
+					completion = float(row.get('completion_percent') or 0)
+				except ValueError:
+					completion = 0.0
+				year = row.get('year')
+				self._write(
+					connection,
+					infohash,
+					row.get('movie_title'),
+					int(year) if year and year.isdigit() else None,
+					completion,
+					row.get('status') or 'downloading',
+					row.get('timestamp') or datetime.now().isoformat(),
+				)
+				count += 1
+			connection.execute(
+				"INSERT INTO meta (key, value) VALUES ('csv_imported', ?)",
+				(datetime.now().isoformat(),),
+			)
+		logger.info("Imported {} rows from {} into {}", count, path, self.path)
+		return count